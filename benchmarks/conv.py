@@ -0,0 +1,187 @@
+"""Microbenchmarks of the convolutions in `ckconv.nn.functional`.
+
+Sweeps every convolution over batch size, channels, input length, kernel length,
+causal/centred padding and separable/non-separable kernels, for the forward and the
+backward pass, and reports the time and memory per configuration. Results are saved
+as json and can be compared against a stored baseline, e.g.,
+
+    python -m benchmarks.conv --output benchmarks/results/conv.json
+    python -m benchmarks.conv --baseline benchmarks/results/conv.json
+
+The script exits with status 1 if any configuration regressed by more than
+--tolerance with respect to the baseline.
+"""
+# torch
+import torch
+
+# project
+import ckconv.nn.functional as ckconv_f
+from ckconv.nn.functional.conv import conv, fftconv
+from ckconv.utils.flops import conv_flops
+from benchmarks import utils
+
+# built-in
+import argparse
+import itertools
+import sys
+
+
+CONFIG_KEYS = [
+    "function",
+    "batch",
+    "channels",
+    "length",
+    "kernel_length",
+    "causal",
+    "separable",
+    "pass",
+]
+
+# name: (function, modes, separable variants, uses the fft)
+FUNCTIONS = {
+    "conv1d": (ckconv_f.conv1d, [True, False], [True, False], False),
+    "fftconv1d": (ckconv_f.fftconv1d, [True, False], [True, False], True),
+    "conv": (conv, [False], [True, False], False),
+    "fftconv": (fftconv, [False], [False], True),
+}
+
+
+def configurations(args) -> list:
+    configs = []
+    for function in args.functions:
+        _, modes, separable_variants, fft = FUNCTIONS[function]
+        modes = [m for m in modes if ("causal" if m else "centred") in args.modes]
+        for batch, channels, length, kernel_length, causal, separable, pass_ in (
+            itertools.product(
+                args.batch,
+                args.channels,
+                args.length,
+                args.kernel_length,
+                modes,
+                separable_variants,
+                args.passes,
+            )
+        ):
+            if function in ["conv", "fftconv"] and kernel_length % 2 == 0:
+                # These require odd kernels
+                continue
+            kernel_shape = [1 if separable else channels, channels, kernel_length]
+            flops = conv_flops(
+                [batch, channels, length], kernel_shape, separable, fft, causal
+            )
+            if flops / 1e9 > args.max_gflops:
+                continue
+            configs.append(
+                {
+                    "function": function,
+                    "batch": batch,
+                    "channels": channels,
+                    "length": length,
+                    "kernel_length": kernel_length,
+                    "causal": causal,
+                    "separable": separable,
+                    "pass": pass_,
+                    "gflops": flops / 1e9,
+                }
+            )
+    return configs
+
+
+def run(config: dict, device: torch.device, warmup: int, repeats: int) -> dict:
+    function = FUNCTIONS[config["function"]][0]
+    channels, separable = config["channels"], config["separable"]
+    kernel_shape = [1 if separable else channels, channels, config["kernel_length"]]
+    backward = config["pass"] == "backward"
+
+    x = torch.randn(config["batch"], channels, config["length"], device=device)
+    kernel = torch.randn(*kernel_shape, device=device) / kernel_shape[-1]
+    bias = torch.randn(channels, device=device)
+    for tensor in [x, kernel, bias]:
+        tensor.requires_grad_(backward)
+
+    def forward():
+        return function(
+            x, kernel, bias, separable=separable, causal=config["causal"]
+        )
+
+    if backward:
+        grad = torch.randn(forward().shape, device=device)
+
+        def setup():
+            return (forward(),)
+
+        def step(out):
+            out.backward(grad)
+
+        result = utils.measure(step, device, setup, warmup=warmup, repeats=repeats)
+        result["saved_mb"] = utils.saved_tensors_mb(forward)
+    else:
+        with torch.no_grad():
+            result = utils.measure(forward, device, warmup=warmup, repeats=repeats)
+    return {**config, **result}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--functions", nargs="+", default=list(FUNCTIONS))
+    parser.add_argument("--batch", nargs="+", type=int, default=[8, 32])
+    parser.add_argument("--channels", nargs="+", type=int, default=[32, 128])
+    parser.add_argument("--length", nargs="+", type=int, default=[1024, 4096])
+    parser.add_argument("--kernel_length", nargs="+", type=int, default=[33, 257, 1025])
+    parser.add_argument("--modes", nargs="+", default=["causal", "centred"])
+    parser.add_argument("--passes", nargs="+", default=["forward", "backward"])
+    parser.add_argument(
+        "--max_gflops",
+        type=float,
+        default=100.0,
+        help="Skip configurations that take more GFLOPs than this.",
+    )
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", default=None, help="Path to save the results to.")
+    parser.add_argument("--baseline", default=None, help="Results to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    device = torch.device(args.device)
+    configs = configurations(args)
+    print(f"Running {len(configs)} configurations on {device}.")
+    results = []
+    for config in configs:
+        results.append(run(config, device, args.warmup, args.repeats))
+    columns = CONFIG_KEYS + ["gflops", "time_ms", "peak_mb", "saved_mb"]
+    print(utils.format_table(results, columns))
+
+    if args.output is not None:
+        utils.save_results(args.output, results, CONFIG_KEYS)
+        print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        comparisons = utils.compare(
+            results,
+            utils.load_results(args.baseline),
+            CONFIG_KEYS,
+            tolerance=args.tolerance,
+        )
+        regressions = [c for c in comparisons if c["regression"]]
+        print(f"\nCompared {len(comparisons)} measurements with {args.baseline}:")
+        print(
+            utils.format_table(
+                comparisons, CONFIG_KEYS + ["metric", "baseline", "value", "ratio"]
+            )
+        )
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            print(
+                utils.format_table(
+                    regressions, CONFIG_KEYS + ["metric", "baseline", "value", "ratio"]
+                )
+            )
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
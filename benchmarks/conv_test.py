@@ -0,0 +1,18 @@
+from . import conv
+
+
+def test_every_function_runs(tmp_path):
+    output = tmp_path / "conv.json"
+    argv = [
+        "--batch", "1",
+        "--channels", "2",
+        "--length", "16",
+        "--kernel_length", "5",
+        "--device", "cpu",
+        "--warmup", "0",
+        "--repeats", "1",
+        "--output", str(output),
+    ]
+    assert conv.main(argv) == 0
+    results = conv.utils.load_results(str(output))["results"]
+    assert {r["function"] for r in results} == set(conv.FUNCTIONS)
@@ -0,0 +1,141 @@
+"""Ranks network configurations with the analytical cost model of
+`models/cost_model.py`, and validates its predictions against the profiler.
+
+Every --configs entry is a space separated list of Hydra overrides of
+`cfg/config.yaml`. Without --validate, the configurations are only constructed and
+ranked by their predicted cost, e.g.,
+
+    python -m benchmarks.cost_model --length 2000 --configs "" "net.no_hidden=64" \\
+        "net.no_blocks=8 mask.init_value=0.2"
+
+With --validate, every network is also run under a `ModuleProfiler`. Per layer, the
+predicted kernel lengths and FLOPs are compared to the ones observed by the profiler,
+and across configurations, the rank correlation between the predicted FLOPs and the
+measured forward time is reported.
+"""
+# torch
+import torch
+
+# project
+from ckconv.nn.ckconv import CKConvBase
+from ckconv.utils.profiling import ModuleProfiler
+from models import cost_model
+from benchmarks import utils
+
+# built-in
+import argparse
+import os
+import sys
+
+# Configs
+from hydra import compose, initialize_config_dir
+from omegaconf import OmegaConf
+
+
+def compose_config(overrides: list) -> OmegaConf:
+    config_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cfg")
+    with initialize_config_dir(config_dir=os.path.abspath(config_dir), version_base="1.3"):
+        cfg = compose(config_name="config.yaml", overrides=overrides)
+    OmegaConf.set_struct(cfg, False)
+    return cfg
+
+
+def profile(network, x, lens, repeats: int) -> tuple:
+    """Runs the network under a ModuleProfiler of its convolutions.
+
+    Returns:
+        (dict, dict): the profiler rows by layer name, and the timing of `utils.measure`
+    """
+    network.eval()
+    with torch.no_grad():
+        # Fixes the kernel sizes, as the first training step would
+        network(x, lens)
+        convs = [(n, m) for n, m in network.named_modules() if isinstance(m, CKConvBase)]
+        profiler = ModuleProfiler(convs)
+        profiler.start()
+        network(x, lens)
+        profiler.stop()
+        timing = utils.measure(
+            lambda: network(x, lens), x.device, warmup=1, repeats=repeats
+        )
+    rows = {row[0]: dict(zip(ModuleProfiler.COLUMNS, row)) for row in profiler.table()}
+    kernel_lengths = {n: m.kernel_shape()[-1] for n, m in convs}
+    for name, row in rows.items():
+        row["kernel_length"] = kernel_lengths[name]
+    return rows, timing
+
+
+def spearman(a: list, b: list) -> float:
+    """Rank correlation of two lists, without ties correction."""
+    if len(a) < 2:
+        return float("nan")
+    rank_a = torch.tensor(a).argsort().argsort().double()
+    rank_b = torch.tensor(b).argsort().argsort().double()
+    return torch.corrcoef(torch.stack([rank_a, rank_b]))[0, 1].item()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--configs", nargs="+", default=[""])
+    parser.add_argument("--length", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--in_channels", type=int, default=13)
+    parser.add_argument("--out_channels", type=int, default=1)
+    parser.add_argument("--validate", action="store_true")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--verbose", action="store_true", help="Print every layer.")
+    parser.add_argument("--output", default=None, help="Path to save the results to.")
+    args = parser.parse_args(argv)
+
+    results = []
+    for overrides in args.configs:
+        cfg = compose_config(overrides.split())
+        network = cost_model.construct_sequence_network(
+            cfg, args.in_channels, args.out_channels
+        )
+        costs = cost_model.estimate_network(network, args.length, args.batch)
+        result = {"config": overrides or "default", **cost_model.summarise(costs)}
+
+        if args.validate:
+            x = torch.randn(args.batch, args.in_channels, args.length)
+            lens = torch.full((args.batch,), args.length)
+            rows, timing = profile(network, x, lens, args.repeats)
+            errors = []
+            for cost in costs:
+                row = rows.get(cost.name)
+                if row is None:
+                    continue
+                if row["kernel_length"] != cost.kernel_length:
+                    print(
+                        f"{cost.name}: predicted kernel length {cost.kernel_length}, "
+                        f"observed {row['kernel_length']}"
+                    )
+                errors.append(abs(cost.gflops - row["gflops"]) / max(row["gflops"], 1e-12))
+            result["profiled_conv_gflops"] = sum(r["gflops"] for r in rows.values())
+            result["max_conv_flops_error"] = max(errors, default=float("nan"))
+            result["time_ms"] = timing["time_ms"]
+
+        if args.verbose:
+            print(f"\n{result['config']}:")
+            print(cost_model.format_costs(costs))
+        results.append(result)
+
+    results.sort(key=lambda r: r["gflops"])
+    columns = ["config", "gflops", "train_gflops", "kernel_gflops", "activations_mb"]
+    if args.validate:
+        columns += ["profiled_conv_gflops", "max_conv_flops_error", "time_ms"]
+    print(f"\nConfigurations ranked by predicted cost (length {args.length}):")
+    print(utils.format_table(results, columns))
+    if args.validate:
+        correlation = spearman(
+            [r["gflops"] for r in results], [r["time_ms"] for r in results]
+        )
+        print(f"\nRank correlation of predicted GFLOPs and forward time: {correlation:.3f}")
+
+    if args.output is not None:
+        utils.save_results(args.output, results, ["config"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
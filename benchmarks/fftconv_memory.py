@@ -0,0 +1,101 @@
+"""Memory benchmark of the backward pass of `ckconv.nn.functional.fftconv1d`.
+
+Compares `fftconv1d`, which saves only its input and kernel for the backward pass,
+with differentiating through the FFTs with autograd, for separable and dense causal
+convolutions, e.g.,
+
+    python -m benchmarks.fftconv_memory --channels 140 --length 2048 8192
+"""
+# torch
+import torch
+import torch.nn.functional as f
+
+# project
+import ckconv.nn.functional as ckconv_f
+from ckconv.nn.functional.causal_conv import causal_padding
+from benchmarks import utils
+
+# built-in
+import argparse
+import itertools
+import sys
+
+
+def autograd_fftconv1d(x, kernel, bias=None, separable=False, causal=True, **kwargs):
+    """fftconv1d differentiated with autograd, which stores every intermediate."""
+    x_shape = x.shape
+    x, kernel = causal_padding(x, kernel)
+    kernel = f.pad(kernel, [0, x.size(-1) - kernel.size(-1)])
+    x_fr = torch.fft.rfft(x, dim=-1)
+    kernel_fr = torch.conj(torch.fft.rfft(kernel, dim=-1))
+    if separable:
+        output_fr = kernel_fr * x_fr
+    else:
+        output_fr = torch.einsum("bi..., oi... -> bo...", x_fr, kernel_fr)
+    out = torch.fft.irfft(output_fr, n=x.shape[-1], dim=-1)[..., : x_shape[-1]]
+    if bias is not None:
+        out = out + bias.view(1, -1, 1)
+    return out
+
+
+IMPLEMENTATIONS = {"autograd": autograd_fftconv1d, "fftconv1d": ckconv_f.fftconv1d}
+
+
+def run(implementation, batch, channels, length, separable, device, repeats):
+    function = IMPLEMENTATIONS[implementation]
+    # The kernel spans the whole input, as for kernel.size="same"
+    kernel_shape = [1 if separable else channels, channels, length]
+    x = torch.randn(batch, channels, length, device=device, requires_grad=True)
+    kernel = torch.randn(*kernel_shape, device=device, requires_grad=True)
+    bias = torch.randn(channels, device=device, requires_grad=True)
+
+    def forward():
+        return function(x, kernel, bias, separable=separable, causal=True)
+
+    grad = torch.randn(batch, channels, length, device=device)
+    result = utils.measure(
+        lambda out: out.backward(grad),
+        device,
+        setup=lambda: (forward(),),
+        warmup=1,
+        repeats=repeats,
+    )
+    result["saved_mb"] = utils.saved_tensors_mb(forward)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--batch", nargs="+", type=int, default=[32])
+    parser.add_argument("--channels", nargs="+", type=int, default=[140])
+    parser.add_argument("--length", nargs="+", type=int, default=[1024, 4096])
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    device = torch.device(args.device)
+    results = []
+    for batch, channels, length, separable in itertools.product(
+        args.batch, args.channels, args.length, [True, False]
+    ):
+        for implementation in IMPLEMENTATIONS:
+            result = run(
+                implementation, batch, channels, length, separable, device, args.repeats
+            )
+            results.append(
+                {
+                    "implementation": implementation,
+                    "batch": batch,
+                    "channels": channels,
+                    "length": length,
+                    "separable": separable,
+                    **result,
+                }
+            )
+    columns = ["implementation", "batch", "channels", "length", "separable"]
+    print(utils.format_table(results, columns + ["saved_mb", "peak_mb", "time_ms"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Startup benchmark of the command line entry points.
+
+Every target is imported in a fresh interpreter, and the time of the import, the
+number of loaded modules and which of the heavy optional dependencies got loaded
+are reported, e.g.,
+
+    python -m benchmarks.import_time --output benchmarks/results/import_time.json
+    python -m benchmarks.import_time --baseline benchmarks/results/import_time.json
+"""
+# project
+from benchmarks import utils
+
+# built-in
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+CONFIG_KEYS = ["target"]
+
+# Statements that are timed, per target
+TARGETS = {
+    "score": "import score",
+    "serve": "import serve",
+    "main": "import main",
+    "lucas_datamodule": (
+        "import dataset_constructor, datamodules; datamodules.LucasDataModule"
+    ),
+    "sequence_model": "import model_constructor, models; models.ResNet_sequence",
+}
+
+# Dependencies that Lucas runs do not need
+HEAVY = [
+    "torch_geometric",
+    "torchtext",
+    "datasets",
+    "torchvision",
+    "sklearn",
+    "matplotlib",
+    "pandas",
+    "wandb",
+]
+
+SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "import_s": elapsed,
+    "modules": len(sys.modules),
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def time_import(statement: str, repeats: int) -> dict:
+    """Runs the statement in `repeats` fresh interpreters from the root of the
+    repository, and returns the median import time."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = SNIPPET.format(statement=statement, heavy=HEAVY)
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return {
+        "import_s": statistics.median(r["import_s"] for r in runs),
+        "modules": runs[-1]["modules"],
+        "heavy": " ".join(runs[-1]["heavy"]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS), choices=TARGETS)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default=None, help="Path to save the results to.")
+    parser.add_argument("--baseline", default=None, help="Results to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = [
+        {"target": target, **time_import(TARGETS[target], args.repeats)}
+        for target in args.targets
+    ]
+    print(utils.format_table(results, CONFIG_KEYS + ["import_s", "modules", "heavy"]))
+
+    if args.output is not None:
+        utils.save_results(args.output, results, CONFIG_KEYS)
+        print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        comparisons = utils.compare(
+            results,
+            utils.load_results(args.baseline),
+            CONFIG_KEYS,
+            metrics=("import_s",),
+            tolerance=args.tolerance,
+        )
+        columns = ["target", "metric", "baseline", "value", "ratio", "regression"]
+        print(utils.format_table(comparisons, columns))
+        if any(c["regression"] for c in comparisons):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
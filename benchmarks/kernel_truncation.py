@@ -0,0 +1,84 @@
+"""End-to-end speedup and AUROC of the Lucas network with truncated kernels on CPU.
+
+Truncates the baked FlexConv kernels of the network of `cfg/config.yaml` to every
+error budget, see `models.inference.truncate_kernels`, and reports the scoring
+throughput and AUROC relative to the untruncated network, and the error of the
+logits. Each layer uses the faster of the direct and FFT convolution for its
+truncated kernel, or the FFT above --fft-threshold if given.
+
+As in `benchmarks/precision.py`, the shots are synthetic and the weights random
+without --data-dir and --checkpoint, e.g.,
+
+    python -m benchmarks.kernel_truncation --data-dir data/ \\
+        --checkpoint path/to/model.ckpt --error-budget 1e-4 1e-3 1e-2
+    python -m benchmarks.kernel_truncation --layers mask.init_value=0.02
+
+Trailing arguments are Hydra overrides of `cfg/config.yaml`.
+"""
+# torch
+import torch
+
+# project
+from models.inference import truncate_kernels
+from benchmarks import utils
+from benchmarks.precision import add_arguments, score, setup
+
+# built-in
+import argparse
+import contextlib
+import copy
+import sys
+
+CONFIG_KEYS = ["error_budget", "batches", "threads", "overrides"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--error-budget", nargs="+", type=float, default=[1e-4, 1e-3, 1e-2, 3e-2]
+    )
+    parser.add_argument("--fft-threshold", type=int, default=None)
+    parser.add_argument("--layers", action="store_true", help="Print every layer.")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    model, batches = setup(args)
+
+    reference = score(model, batches, contextlib.nullcontext)
+    results = []
+    for budget in args.error_budget:
+        truncated = copy.deepcopy(model)
+        layers = truncate_kernels(
+            truncated.network, batches, budget, fft_threshold=args.fft_threshold
+        )
+        if args.layers:
+            print(f"error_budget={budget}")
+            print(utils.format_table(layers, list(layers[0])))
+        result = score(truncated, batches, contextlib.nullcontext)
+        logits = result.pop("logits")
+        error = (logits - reference["logits"]).norm() / reference["logits"].norm()
+        results.append(
+            {
+                "error_budget": f"{budget:g}",
+                "batches": len(batches),
+                "threads": torch.get_num_threads(),
+                "overrides": " ".join(args.overrides),
+                "kernel_length": sum(layer["kernel_length"] for layer in layers),
+                "truncated_length": sum(layer["truncated_length"] for layer in layers),
+                "spatial_layers": sum(layer["conv"] == "spatial" for layer in layers),
+                "speedup": result["timesteps_per_s"] / reference["timesteps_per_s"],
+                "auroc": result["auroc"],
+                "auroc_change": result["auroc"] - reference["auroc"],
+                "logit_rel_error": error.item(),
+            }
+        )
+
+    columns = CONFIG_KEYS + [k for k in results[0] if k not in CONFIG_KEYS]
+    print(utils.format_table(results, columns))
+    if args.output is not None:
+        utils.save_results(args.output, results, CONFIG_KEYS)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""Accuracy and throughput of the Lucas network in reduced precision on CPU.
+
+Runs the validation shots through the network of `cfg/config.yaml` once per
+precision, and reports the scoring throughput, the AUROC, and the error of the
+logits and probabilities with respect to float32. With --train, the time of a
+training step (forward and backward) on the same batches is reported as well.
+
+The kernels are baked for scoring in every precision, see `FlexConvBase.bake`. int8
+quantizes the point-wise layers, see `models.inference.quantize_network`, after
+calibrating on the first --calibration-batches batches; it is not trained.
+
+Without --data-dir, the shots are synthetic, see `benchmarks/training.py`, and the
+weights random, so only the errors and throughput are meaningful. Pass a Lucas data
+directory and a checkpoint to measure the change in AUROC of a trained network, e.g.,
+
+    python -m benchmarks.precision --data-dir data/ --checkpoint path/to/model.ckpt
+    python -m benchmarks.precision --train --batches 10 net.no_hidden=64
+
+Trailing arguments are Hydra overrides of `cfg/config.yaml`.
+"""
+# torch
+import torch
+
+# project
+from dataset_constructor import construct_datamodule
+from model_constructor import construct_model
+from datamodules.lucas import LucasDataModule
+from models.checkpoint_io import load_checkpoint
+from models.inference import bake_kernels, quantize_network
+from models.metrics import HistogramMetrics
+from benchmarks import utils
+from benchmarks.training import synthetic_shots
+
+# built-in
+import argparse
+import contextlib
+import copy
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+# Configs
+from hydra import compose, initialize_config_dir
+from omegaconf import OmegaConf
+
+
+CONFIG_KEYS = ["precision", "batches", "threads", "overrides"]
+
+
+def float32(model, calibration: list):
+    return model, contextlib.nullcontext
+
+
+def bfloat16(model, calibration: list):
+    # As train.precision=bf16: autocast, the FFTs and kernel nets stay in float32
+    return model, lambda: torch.autocast("cpu", dtype=torch.bfloat16)
+
+
+def int8(model, calibration: list):
+    # As score.precision=int8: int8 point-wise layers, on a copy of the model
+    model = copy.deepcopy(model)
+    quantize_network(model.network, calibration, inplace=True)
+    return model, contextlib.nullcontext
+
+
+# precision: function of the model and calibration batches, returning the model to
+# run and a context factory
+PRECISIONS = {"fp32": float32, "bf16": bfloat16, "int8": int8}
+# Precisions without a backward pass
+INFERENCE_ONLY = ["int8"]
+
+
+def score(model, batches: list, context) -> dict:
+    """Scores the batches, and returns the logits, the AUROC and the throughput."""
+    metrics = HistogramMetrics(num_classes=1, task="binary", bins=1000)
+    logits, timesteps, elapsed = [], 0, 0.0
+    with torch.no_grad(), context():
+        for x, labels, lens in batches:
+            start = time.perf_counter()
+            out = model.network(x, lens).float()
+            elapsed += time.perf_counter() - start
+            metrics.update(model.get_probabilities(out, lens), labels)
+            logits.append(out)
+            timesteps += int(sum(lens))
+    return {
+        "logits": torch.cat(logits),
+        "auroc": metrics.compute()["auroc"].item(),
+        "timesteps_per_s": timesteps / elapsed,
+    }
+
+
+def train_step_ms(model, batches: list, context) -> float:
+    model.train()
+    elapsed = 0.0
+    for i, batch in enumerate(batches):
+        start = time.perf_counter()
+        with context():
+            loss = model.training_step(batch, i)["loss"]
+        loss.backward()
+        elapsed += time.perf_counter() - start
+        model.zero_grad(set_to_none=True)
+    model.eval()
+    return 1000.0 * elapsed / len(batches)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Arguments of `setup`, shared with `benchmarks/kernel_truncation.py`."""
+    parser.add_argument("--data-dir", default=None, help="Lucas data directory.")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint to load.")
+    parser.add_argument("--shots", type=int, default=500, help="Synthetic shots.")
+    parser.add_argument("--batches", type=int, default=-1, help="-1: all batches.")
+    parser.add_argument("--threads", type=int, default=-1, help="torch threads.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Path to save the results to.")
+    parser.add_argument("overrides", nargs="*", help="Hydra overrides.")
+
+
+def setup(args) -> tuple:
+    """Constructs the model of the config, with the weights of --checkpoint, and the
+    validation batches of --data-dir or of synthetic shots.
+
+    Returns:
+        (tuple): the model in eval mode, with baked kernels, and the batches
+    """
+    if args.threads != -1:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+
+    config_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cfg")
+    with initialize_config_dir(config_dir=os.path.abspath(config_dir), version_base="1.3"):
+        cfg = compose(config_name="config.yaml", overrides=args.overrides)
+    OmegaConf.set_struct(cfg, False)
+    cfg.dataset.name = "Lucas"
+    cfg.device = "cpu"
+    cfg.train.avail_gpus = 0
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        if args.data_dir is None:
+            shots = synthetic_shots(args.shots, seed=args.seed)
+            with open(os.path.join(data_dir, LucasDataModule.DATA_FILENAME), "wb") as f:
+                pickle.dump(shots, f)
+        cfg.dataset.data_dir = args.data_dir or data_dir
+        datamodule = construct_datamodule(cfg)
+        datamodule.setup()
+        batches = [
+            (x, labels, torch.as_tensor(lens))
+            for x, labels, lens in datamodule.val_dataloader()
+        ]
+    if args.batches != -1:
+        batches = batches[: args.batches]
+
+    cfg.scheduler.iters_per_train_epoch = 1
+    cfg.scheduler.total_train_iters = cfg.train.epochs
+    model = construct_model(cfg, datamodule)
+    if args.checkpoint is not None:
+        model.load_state_dict(load_checkpoint(args.checkpoint)["state_dict"])
+    model.eval()
+    # Fixes the kernel sizes, as the first training step would, and bakes the kernels
+    bake_kernels(model.network)
+    with torch.no_grad():
+        model.network(*batches[0][::2])
+    return model, batches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--precisions", nargs="+", default=list(PRECISIONS))
+    parser.add_argument(
+        "--calibration-batches", type=int, default=8, help="int8 calibration batches."
+    )
+    parser.add_argument("--train", action="store_true", help="Time training steps.")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    model, batches = setup(args)
+
+    results, reference = [], None
+    # The errors are relative to the first precision, float32 if included
+    for precision in sorted(args.precisions, key=lambda p: p != "fp32"):
+        calibration = batches[: args.calibration_batches]
+        precision_model, context = PRECISIONS[precision](model, calibration)
+        result = score(precision_model, batches, context)
+        logits = result.pop("logits")
+        if reference is None:
+            reference = logits
+        error = (logits - reference).norm() / reference.norm()
+        result["logit_rel_error"] = error.item()
+        result["prob_max_error"] = (
+            (torch.sigmoid(logits) - torch.sigmoid(reference)).abs().max().item()
+        )
+        if args.train and precision not in INFERENCE_ONLY:
+            # On a copy, as training updates the BatchNorm statistics of the model
+            # that the following precisions are scored with
+            result["train_step_ms"] = train_step_ms(
+                copy.deepcopy(precision_model), batches, context
+            )
+        elif args.train:
+            result["train_step_ms"] = None
+        results.append(
+            {
+                "precision": precision,
+                "batches": len(batches),
+                "threads": torch.get_num_threads(),
+                "overrides": " ".join(args.overrides),
+                **result,
+            }
+        )
+
+    columns = CONFIG_KEYS + [k for k in results[0] if k not in CONFIG_KEYS]
+    print(utils.format_table(results, columns))
+    if args.output is not None:
+        utils.save_results(args.output, results, CONFIG_KEYS)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
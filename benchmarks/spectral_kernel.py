@@ -0,0 +1,112 @@
+"""Benchmark of kernels given by their spectrum against sampled kernels.
+
+Times the forward and backward pass of a causal SeparableFlexConv layer with
+  - magnet: a MAGNet kernel, sampled, masked and transformed with an FFT,
+  - modal_sampled: a ModalNet kernel on the same path,
+  - modal_spectral: the same ModalNet kernel, whose masked spectrum is computed in
+    closed form, see `ckconv.nn.ck.ModalNet.spectrum`,
+and reports the relative error of modal_spectral with respect to modal_sampled, e.g.,
+
+    python -m benchmarks.spectral_kernel --channels 140 --length 1000 4000 \\
+        --mask-width 0.075 0.3
+"""
+# torch
+import torch
+
+# project
+import ckconv
+from benchmarks import utils
+from benchmarks.cost_model import compose_config
+
+# built-in
+import argparse
+import copy
+import itertools
+import sys
+
+
+VARIANTS = ["magnet", "modal_sampled", "modal_spectral"]
+
+
+def construct_layer(cfg, variant: str, channels: int) -> torch.nn.Module:
+    cfg = copy.deepcopy(cfg)
+    cfg.kernel.type = "MAGNet" if variant == "magnet" else "ModalNet"
+    layer = ckconv.nn.SeparableFlexConv(
+        in_channels=channels,
+        out_channels=channels,
+        data_dim=1,
+        kernel_cfg=cfg.kernel,
+        conv_cfg=cfg.conv,
+        mask_cfg=cfg.mask,
+    )
+    layer.spectral = variant == "modal_spectral"
+    return layer
+
+
+def run(layer, batch, channels, length, device, repeats) -> dict:
+    x = torch.randn(batch, channels, length, device=device, requires_grad=True)
+    grad = torch.randn(batch, channels, length, device=device)
+    # Fixes train_length and the Chang initialization
+    layer(x)
+
+    def step():
+        layer.zero_grad(set_to_none=True)
+        layer(x).backward(grad)
+
+    result = utils.measure(step, device, warmup=1, repeats=repeats)
+    result["kernel_length"] = layer.kernel_shape()[-1]
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--batch", nargs="+", type=int, default=[32])
+    parser.add_argument("--channels", nargs="+", type=int, default=[140])
+    parser.add_argument("--length", nargs="+", type=int, default=[1000, 4000])
+    parser.add_argument("--mask-width", nargs="+", type=float, default=[0.075, 0.3])
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default=None, help="Path to save the results to.")
+    args = parser.parse_args(argv)
+
+    device = torch.device(args.device)
+    results = []
+    for batch, channels, length, mask_width in itertools.product(
+        args.batch, args.channels, args.length, args.mask_width
+    ):
+        cfg = compose_config([f"mask.init_value={mask_width}"])
+        layers = {
+            variant: construct_layer(cfg, variant, channels).to(device)
+            for variant in VARIANTS
+        }
+        # The ModalNet variants share their weights
+        layers["modal_spectral"].load_state_dict(layers["modal_sampled"].state_dict())
+        with torch.no_grad():
+            x = torch.randn(batch, channels, length, device=device)
+            reference = layers["modal_sampled"](x)
+            error = (layers["modal_spectral"](x) - reference).norm() / reference.norm()
+        for variant, layer in layers.items():
+            result = run(layer, batch, channels, length, device, args.repeats)
+            results.append(
+                {
+                    "variant": variant,
+                    "batch": batch,
+                    "channels": channels,
+                    "length": length,
+                    "mask_width": mask_width,
+                    "rel_error": error.item() if variant == "modal_spectral" else None,
+                    **result,
+                }
+            )
+
+    config_keys = ["variant", "batch", "channels", "length", "mask_width"]
+    columns = config_keys + ["kernel_length", "time_ms", "peak_mb", "rel_error"]
+    print(utils.format_table(results, columns))
+    if args.output is not None:
+        utils.save_results(args.output, results, config_keys)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""End-to-end training throughput benchmark of the Lucas pipeline on synthetic shots.
+
+Generates shots with the schema of the Lucas dataset, runs them through the real
+`LucasDataModule` (splits, scaling, length augmentation, `collate_fn` and
+DataLoader workers), the network and wrapper of `cfg/config.yaml` and its optimizer
+and scheduler, offline and without a wandb login. Reports samples/s, timesteps/s,
+the fraction of the time spent waiting on the data loader and the peak RSS, e.g.,
+
+    python -m benchmarks.training --steps 50 --output benchmarks/results/training.json
+    python -m benchmarks.training --baseline benchmarks/results/training.json net.no_hidden=64
+
+Trailing arguments are Hydra overrides of `cfg/config.yaml`.
+"""
+# torch
+import torch
+
+# project
+from dataset_constructor import construct_datamodule
+from model_constructor import construct_model
+from datamodules.lucas import LucasDataModule
+from benchmarks import utils
+
+# built-in
+import argparse
+import itertools
+import os
+import pickle
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Configs
+from hydra import compose, initialize_config_dir
+from omegaconf import OmegaConf
+
+
+CONFIG_KEYS = ["shots", "batch_size", "no_workers", "threads", "overrides"]
+
+# Approximate composition of the Lucas dataset per machine: fraction of the shots,
+# median and log-standard deviation of the shot length in samples, and the fraction
+# of disruptive shots.
+MACHINES = {
+    "cmod": {"fraction": 0.3, "median_length": 120, "sigma": 0.5, "disruptive": 0.2},
+    "d3d": {"fraction": 0.45, "median_length": 600, "sigma": 0.6, "disruptive": 0.15},
+    "east": {"fraction": 0.25, "median_length": 900, "sigma": 0.5, "disruptive": 0.15},
+}
+NO_CHANNELS = 13
+
+
+def synthetic_shots(
+    no_shots: int, seed: int = 42, max_length: int = 2048, min_length: int = 30
+) -> dict:
+    """Generates shots in the format of the Lucas dataset pickle: a dict of shot
+    index to {"data": [length, 13] float32 array, "label": 0/1, "machine": str}.
+    Lengths and labels are drawn per machine according to `MACHINES`."""
+    rng = np.random.default_rng(seed)
+    names = list(MACHINES)
+    fractions = np.array([MACHINES[m]["fraction"] for m in names])
+    machines = rng.choice(names, size=no_shots, p=fractions / fractions.sum())
+    shots = {}
+    for i, machine in enumerate(machines):
+        stats = MACHINES[machine]
+        length = int(
+            np.clip(
+                rng.lognormal(np.log(stats["median_length"]), stats["sigma"]),
+                min_length,
+                max_length,
+            )
+        )
+        label = int(rng.random() < stats["disruptive"])
+        # Random walks, so the robust scaler sees realistic, non-degenerate signals
+        data = np.cumsum(rng.standard_normal((length, NO_CHANNELS)), axis=0)
+        shots[i] = {
+            "data": data.astype(np.float32),
+            "label": label,
+            "machine": str(machine),
+        }
+    return shots
+
+
+def peak_rss_mb() -> tuple:
+    """Peak resident set size of this process and of its largest child (e.g. a data
+    loader worker), in MB."""
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return own / 2**20, children / 2**20
+
+
+def run(cfg: OmegaConf, steps: int, warmup: int) -> dict:
+    """Runs warmup + steps training steps and measures the last steps."""
+    datamodule = construct_datamodule(cfg)
+    datamodule.setup()
+    cfg.scheduler.iters_per_train_epoch = max(
+        len(datamodule.train_dataset) // cfg.train.batch_size, 1
+    )
+    cfg.scheduler.total_train_iters = (
+        cfg.scheduler.iters_per_train_epoch * cfg.train.epochs
+    )
+    model = construct_model(cfg, datamodule)
+    model.train()
+    optimizers = model.configure_optimizers()
+    optimizer = optimizers["optimizer"]
+    scheduler = optimizers.get("lr_scheduler", {}).get("scheduler")
+
+    # Cycle through epochs, as a trainer would, reshuffling every epoch
+    batches = itertools.chain.from_iterable(
+        datamodule.train_dataloader() for _ in itertools.count()
+    )
+
+    # As train.precision=bf16 does in the trainer
+    bf16 = str(cfg.train.precision) == "bf16"
+    samples, timesteps = 0, 0
+    wait_time, step_time = 0.0, 0.0
+    for i in range(warmup + steps):
+        start = time.perf_counter()
+        batch = next(batches)
+        loaded = time.perf_counter()
+
+        with torch.autocast("cpu", dtype=torch.bfloat16, enabled=bf16):
+            loss = model.training_step(batch, i)["loss"]
+        optimizer.zero_grad(set_to_none=True)
+        loss.backward()
+        if cfg.train.grad_clip > 0.0:
+            torch.nn.utils.clip_grad_norm_(model.parameters(), cfg.train.grad_clip)
+        optimizer.step()
+        if scheduler is not None:
+            scheduler.step()
+        end = time.perf_counter()
+
+        if i >= warmup:
+            wait_time += loaded - start
+            step_time += end - loaded
+            samples += batch[0].shape[0]
+            timesteps += int(sum(batch[2]))
+
+    total = wait_time + step_time
+    own_rss, worker_rss = peak_rss_mb()
+    return {
+        "samples_per_s": samples / total,
+        "timesteps_per_s": timesteps / total,
+        "step_ms": 1000.0 * total / steps,
+        "stall_fraction": wait_time / total,
+        "peak_rss_mb": own_rss,
+        "peak_worker_rss_mb": worker_rss,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--shots", type=int, default=1000)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=-1, help="torch threads.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Path to save the results to.")
+    parser.add_argument("--baseline", default=None, help="Results to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("overrides", nargs="*", help="Hydra overrides.")
+    args = parser.parse_args(argv)
+
+    if args.threads != -1:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+
+    config_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cfg")
+    with initialize_config_dir(config_dir=os.path.abspath(config_dir), version_base="1.3"):
+        cfg = compose(config_name="config.yaml", overrides=args.overrides)
+    OmegaConf.set_struct(cfg, False)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        shots = synthetic_shots(args.shots, seed=args.seed)
+        with open(os.path.join(data_dir, LucasDataModule.DATA_FILENAME), "wb") as f:
+            pickle.dump(shots, f)
+
+        cfg.dataset.name = "Lucas"
+        cfg.dataset.data_dir = data_dir
+        cfg.device = "cpu"
+        cfg.train.avail_gpus = 0
+        result = run(cfg, args.steps, args.warmup)
+
+    results = [
+        {
+            "shots": args.shots,
+            "batch_size": cfg.train.batch_size,
+            "no_workers": cfg.no_workers,
+            "threads": torch.get_num_threads(),
+            "overrides": " ".join(args.overrides),
+            **result,
+        }
+    ]
+    print(utils.format_table(results, CONFIG_KEYS + list(result)))
+
+    if args.output is not None:
+        utils.save_results(args.output, results, CONFIG_KEYS)
+        print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        comparisons = utils.compare(
+            results,
+            utils.load_results(args.baseline),
+            CONFIG_KEYS,
+            metrics=("step_ms", "peak_rss_mb"),
+            tolerance=args.tolerance,
+        )
+        columns = ["metric", "baseline", "value", "ratio", "regression"]
+        print(utils.format_table(comparisons, columns))
+        if any(c["regression"] for c in comparisons):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
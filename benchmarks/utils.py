@@ -0,0 +1,166 @@
+import torch
+
+import json
+import os
+import platform
+import statistics
+import time
+from typing import Callable, Optional, Sequence
+
+
+def synchronize(device: torch.device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def measure(
+    fn: Callable,
+    device: torch.device,
+    setup: Optional[Callable] = None,
+    warmup: int = 3,
+    repeats: int = 10,
+) -> dict:
+    """Times fn and records its peak memory.
+
+    Args:
+        fn (Callable): the function to benchmark.
+        device (torch.device): the device fn runs on.
+        setup (Callable, optional): called before every call of fn, without being
+            timed. Its return value is unpacked as the arguments of fn. Defaults to None.
+        warmup (int, optional): number of untimed calls. Defaults to 3.
+        repeats (int, optional): number of timed calls. Defaults to 10.
+
+    Returns:
+        (dict): "time_ms", the median time per call, "time_ms_min" and "peak_mb",
+            the peak memory allocated during setup and fn on top of what was
+            allocated before. peak_mb is None on devices other than CUDA.
+    """
+    times = []
+    peak_mb = None
+    for i in range(warmup + repeats):
+        if i == warmup and device.type == "cuda":
+            synchronize(device)
+            base = torch.cuda.memory_allocated(device)
+            torch.cuda.reset_peak_memory_stats(device)
+        args = setup() if setup is not None else ()
+        synchronize(device)
+        start = time.perf_counter()
+        fn(*args)
+        synchronize(device)
+        if i >= warmup:
+            times.append(time.perf_counter() - start)
+        del args
+    if device.type == "cuda":
+        peak_mb = (torch.cuda.max_memory_allocated(device) - base) / 2**20
+    return {
+        "time_ms": 1000.0 * statistics.median(times),
+        "time_ms_min": 1000.0 * min(times),
+        "peak_mb": peak_mb,
+    }
+
+
+def saved_tensors_mb(fn: Callable, *args) -> float:
+    """Size of the tensors autograd saves for the backward pass of fn(*args), in MB.
+    Tensors sharing storage are only counted once. Unlike peak_mb of `measure`, this
+    is available on every device."""
+    storages = {}
+
+    def pack(tensor):
+        storage = tensor.untyped_storage()
+        storages[storage.data_ptr()] = storage.nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        fn(*args)
+    return sum(storages.values()) / 2**20
+
+
+def environment() -> dict:
+    """Description of the machine the benchmark runs on, stored with the results."""
+    env = {
+        "torch": torch.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "threads": torch.get_num_threads(),
+    }
+    if torch.cuda.is_available():
+        env["gpu"] = torch.cuda.get_device_name()
+        env["cuda"] = torch.version.cuda
+    return env
+
+
+def save_results(path: str, results: list, config_keys: Sequence[str]):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "environment": environment(),
+                "config_keys": list(config_keys),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(
+    results: list,
+    baseline: dict,
+    config_keys: Sequence[str],
+    metrics: Sequence[str] = ("time_ms", "peak_mb"),
+    tolerance: float = 0.1,
+) -> list:
+    """Compares results to a baseline stored with `save_results`. Configurations
+    are matched on config_keys; configurations missing from either side are skipped.
+
+    Returns:
+        (list): for every matched configuration and metric, a dict with the
+            configuration, "metric", "baseline", "value", "ratio" and "regression",
+            which is True if the value exceeds the baseline by more than tolerance.
+    """
+
+    def key(result):
+        return tuple(result[k] for k in config_keys)
+
+    baseline_results = {key(r): r for r in baseline["results"]}
+    comparisons = []
+    for result in results:
+        reference = baseline_results.get(key(result))
+        if reference is None:
+            continue
+        for metric in metrics:
+            value, base = result.get(metric), reference.get(metric)
+            if value is None or base is None or base <= 0:
+                continue
+            ratio = value / base
+            comparisons.append(
+                {
+                    **{k: result[k] for k in config_keys},
+                    "metric": metric,
+                    "baseline": base,
+                    "value": value,
+                    "ratio": ratio,
+                    "regression": ratio > 1.0 + tolerance,
+                }
+            )
+    return comparisons
+
+
+def format_table(rows: list, columns: Sequence[str]) -> str:
+    def cell(value):
+        if isinstance(value, float):
+            return f"{value:.3f}"
+        return "-" if value is None else str(value)
+
+    cells = [[cell(row.get(c)) for c in columns] for row in rows]
+    widths = [max([len(c)] + [len(r[i]) for r in cells]) + 2 for i, c in enumerate(columns)]
+    lines = ["".join(c.ljust(w) for c, w in zip(columns, widths))]
+    lines += ["".join(c.ljust(w) for c, w in zip(r, widths)) for r in cells]
+    return "\n".join(lines)
@@ -4,3 +4,4 @@ from .mfn import GaborNet, FourierNet
 from .siren import SIREN
 from .mlp import MLP
 from .rfnet import RFNet
+from .modal import ModalNet
@@ -0,0 +1,202 @@
+import math
+
+import torch
+import ckconv
+
+# The half Gaussian exp(-x^2 / 2), x >= 0, is approximated by the real part of a sum
+# of damped oscillations exp(-(decay + i * frequency) * x), fitted on [0, FIT_RANGE].
+GAUSSIAN_DECAY = 1.5
+GAUSSIAN_FREQUENCIES = (0.0, 1.0, 2.0, 3.0)
+GAUSSIAN_FIT_RANGE = 3.5
+_GAUSSIAN_MODES = {}
+
+
+def gaussian_modes(device=None) -> tuple[torch.Tensor, torch.Tensor]:
+    """Rates mu and complex weights v, such that
+        exp(-x^2 / 2) ~ Re(sum_r v_r exp(-mu_r x)),  for 0 <= x <= 3.5
+    with a maximum error of about 3e-5. Fitted once per device, in float64.
+
+    Returns:
+        (Tensor, Tensor): mu and v, complex128 tensors of shape [len(FREQUENCIES)]
+    """
+    device = torch.device("cpu" if device is None else device)
+    if device not in _GAUSSIAN_MODES:
+        x = torch.linspace(0.0, GAUSSIAN_FIT_RANGE, 2048, dtype=torch.float64)
+        envelope = torch.exp(-GAUSSIAN_DECAY * x)
+        basis = []
+        for frequency in GAUSSIAN_FREQUENCIES:
+            basis.append(envelope * torch.cos(frequency * x))
+            if frequency != 0.0:
+                basis.append(envelope * torch.sin(frequency * x))
+        weights = torch.linalg.lstsq(
+            torch.stack(basis, dim=1), torch.exp(-0.5 * x**2).unsqueeze(1)
+        ).solution[:, 0]
+        # Re(v exp(-i f x)) = Re(v) cos(f x) + Im(v) sin(f x)
+        v, idx = [], 0
+        for frequency in GAUSSIAN_FREQUENCIES:
+            if frequency == 0.0:
+                v.append(complex(float(weights[idx]), 0.0))
+                idx += 1
+            else:
+                v.append(complex(float(weights[idx]), float(weights[idx + 1])))
+                idx += 2
+        mu = [complex(GAUSSIAN_DECAY, f) for f in GAUSSIAN_FREQUENCIES]
+        _GAUSSIAN_MODES[device] = (
+            torch.tensor(mu, dtype=torch.complex128, device=device),
+            torch.tensor(v, dtype=torch.complex128, device=device),
+        )
+    return _GAUSSIAN_MODES[device]
+
+
+def exponential_dft(
+    rates: torch.Tensor,
+    frequencies: torch.Tensor,
+    end: torch.Tensor,
+    step: torch.Tensor,
+    size: int,
+    n: int,
+) -> torch.Tensor:
+    """DFT of size n, at the given (integer) frequencies, of the sequences
+        y[m] = exp(-rate * s_m),  s_m = end + (size - 1 - m) * step,  m < size
+    in closed form, as a geometric series. The rates must have a positive real part.
+
+    Returns:
+        (Tensor): complex tensor of shape [*rates.shape, len(frequencies)]
+    """
+    rates = rates.unsqueeze(-1)
+    phase = 2j * math.pi * frequencies / n
+    # Summed from the last sample backwards, with ratio exp(-rate * step + phase),
+    # |ratio| < 1. The exponentials factorize over the rates and the frequencies.
+    ratio = torch.exp(-rates * step) * torch.exp(phase)
+    ratio_size = torch.exp(-rates * (step * size)) * torch.exp(phase * size)
+    return (
+        torch.exp(-rates * end)
+        * torch.exp(-phase * (size - 1))
+        * (1.0 - ratio_size)
+        / (1.0 - ratio)
+    )
+
+
+class ModalNet(torch.nn.Module):
+    def __init__(
+        self,
+        data_dim: int,
+        hidden_channels: int,
+        out_channels: int,
+        bias: bool,
+        omega_0: float,
+        min_decay: float = 0.5,
+        max_decay: float = 50.0,
+        **kwargs,
+    ):
+        """
+        Kernel of damped oscillations, whose spectrum has a closed form.
+
+        The kernel is a linear combination of hidden_channels modes
+            exp(-(decay + i * frequency) * s),  s = 1 - t,
+        i.e., oscillations that decay from the end of the kernel, t = 1, towards its
+        start. Like the other kernels it can be sampled on positions, and `spectrum`
+        returns the rfft of the sampled kernel multiplied by a causal Gaussian mask,
+        without sampling it.
+        :param data_dim: Dimensionality of input signal. Only 1 is supported.
+        :param hidden_channels: Amount of modes.
+        :param out_channels: Amount of output channels to use.
+        :param bias: Whether to use bias.
+        :param omega_0: Maximum initial frequency of the modes.
+        :param min_decay: Minimum initial decay of the modes.
+        :param max_decay: Maximum initial decay of the modes.
+        """
+        super().__init__()
+        if data_dim != 1:
+            raise NotImplementedError("ModalNet is only implemented for sequences.")
+        # Decays are log-uniformly and frequencies uniformly initialized
+        log_decay = math.log(min_decay) + (
+            math.log(max_decay) - math.log(min_decay)
+        ) * torch.rand(hidden_channels)
+        self.log_decay = torch.nn.Parameter(log_decay)
+        self.frequency = torch.nn.Parameter(omega_0 * torch.rand(hidden_channels))
+        # The real and imaginary parts of the modes are mixed by the output layer
+        self.output_linear = ckconv.nn.Linear1d(
+            in_channels=2 * hidden_channels,
+            out_channels=out_channels,
+            bias=bias,
+        )
+        torch.nn.init.kaiming_uniform_(self.output_linear.weight, nonlinearity="linear")
+        if self.output_linear.bias is not None:
+            self.output_linear.bias.data.fill_(0.0)
+
+    def forward(self, x):
+        # x: [1, 1, positions]
+        s = 1.0 - x
+        envelope = torch.exp(-torch.exp(self.log_decay).view(1, -1, 1) * s)
+        phase = self.frequency.view(1, -1, 1) * s
+        # Real and imaginary parts of exp(-(decay + i * frequency) * s)
+        modes = torch.cat([envelope * torch.cos(phase), -envelope * torch.sin(phase)], 1)
+        return self.output_linear(modes)
+
+    def spectrum(
+        self,
+        end: torch.Tensor,
+        step: torch.Tensor,
+        size: int,
+        n: int,
+        mask_width: torch.Tensor,
+    ) -> torch.Tensor:
+        """The rfft of size n of the masked kernel, i.e.,
+            rfft(gaussian_mask(t) * self(t), n=n),  t = end - (size - 1 - m) * step
+        with a Gaussian mask exp(-(1 - t)^2 / (2 * mask_width^2)) centred at t = 1.
+
+        The mask is replaced by its approximation of `gaussian_modes`, so that every
+        masked mode is again a sum of exponentials, whose DFT is a geometric series.
+        The result is accurate up to about 1e-4 for positions within 3.5 mask widths
+        of t = 1, as is the case after dynamic cropping.
+
+        Returns:
+            (Tensor): complex tensor of shape [1, out_channels, n // 2 + 1], in the
+                precision of the parameters
+        """
+        no_frequencies = n // 2 + 1
+        k = torch.arange(no_frequencies, device=step.device, dtype=torch.float64)
+        # The real parts of the sequences need their DFT at -k as well
+        frequencies = torch.cat([k, -k])
+        # Distance of the last position to the end of the kernel, t = 1
+        s_end = (1.0 - end).to(torch.float64)
+        step = step.to(torch.float64)
+        sigma = torch.sqrt(mask_width.to(torch.float64) ** 2 + 1e-8)
+
+        rates = torch.complex(
+            torch.exp(self.log_decay).to(torch.float64),
+            self.frequency.to(torch.float64),
+        )
+        mask_rates, mask_weights = gaussian_modes(step.device)
+        mask_rates = mask_rates / sigma
+        # Re(z) * Re(g) = Re(z * g + z * conj(g)) / 2, for a mode z and the mask g
+        masked_rates = torch.cat(
+            [
+                rates.unsqueeze(1) + mask_rates.unsqueeze(0),
+                rates.unsqueeze(1) + mask_rates.conj().unsqueeze(0),
+            ],
+            dim=1,
+        )
+        masked_weights = 0.5 * torch.cat([mask_weights, mask_weights.conj()])
+        args = (frequencies, s_end, step, size, n)
+        modes_fr = torch.einsum(
+            "r, hrk -> hk", masked_weights, exponential_dft(masked_rates, *args)
+        )
+        # DFTs of the real and imaginary parts of the masked modes
+        positive, negative = modes_fr[:, :no_frequencies], modes_fr[:, no_frequencies:]
+        features_fr = torch.cat(
+            [0.5 * (positive + negative.conj()), -0.5j * (positive - negative.conj())]
+        )
+        weight = self.output_linear.weight.squeeze(-1).to(features_fr.dtype)
+        kernel_fr = weight @ features_fr
+        if self.output_linear.bias is not None:
+            # The bias is a constant, masked by the real part of the mask
+            mask_fr = mask_weights @ exponential_dft(mask_rates, *args)
+            mask_fr = 0.5 * (
+                mask_fr[:no_frequencies] + mask_fr[no_frequencies:].conj()
+            )
+            bias = self.output_linear.bias.to(features_fr.dtype)
+            kernel_fr = kernel_fr + bias.unsqueeze(1) * mask_fr.unsqueeze(0)
+        dtype = torch.promote_types(self.output_linear.weight.dtype, torch.complex64)
+        return kernel_fr.to(dtype).unsqueeze(0)
@@ -0,0 +1,29 @@
+from . import modal
+import torch
+
+
+def test_gaussian_modes():
+    mu, v = modal.gaussian_modes()
+    x = torch.linspace(0.0, modal.GAUSSIAN_FIT_RANGE, 1000, dtype=torch.float64)
+    approx = (v.unsqueeze(1) * torch.exp(-mu.unsqueeze(1) * x)).sum(0).real
+    assert torch.allclose(approx, torch.exp(-0.5 * x**2), atol=1e-4)
+
+
+def test_spectrum_matches_rfft_of_masked_kernel():
+    torch.manual_seed(0)
+    kernel = modal.ModalNet(
+        data_dim=1, hidden_channels=8, out_channels=3, bias=True, omega_0=100.0
+    ).double()
+    train_length, mask_width = 201, torch.tensor([0.1], dtype=torch.float64)
+    step = torch.tensor([2.0 / (train_length - 1)], dtype=torch.float64)
+    positions = torch.linspace(-1, 1, train_length, dtype=torch.float64)
+    # Crops within 3 mask widths of the end, as dynamic cropping would keep
+    for size in [30, 31]:
+        t = positions[-size:].view(1, 1, -1)
+        mask = torch.exp(-0.5 * (1.0 - t) ** 2 / mask_width**2)
+        n = 2 * size + 10
+        ref = torch.fft.rfft(mask * kernel(t), n=n, dim=-1)
+        out = kernel.spectrum(t[0, 0, -1], step, size, n, mask_width)
+        assert out.shape == ref.shape
+        scale = ref.abs().max()
+        assert ((out - ref).abs().max() / scale) < 1e-3
@@ -7,7 +7,7 @@ import torch.fft
 import torch.nn
 import ckconv
 import ckconv.nn.functional as ckconv_F
-from ckconv.utils.grids import linspace_grid
+from ckconv.utils.grids import cached_linspace_grid
 
 # typing
 from omegaconf import OmegaConf
@@ -116,7 +116,8 @@ class CKConvBase(torch.nn.Module):
         # 2. Non-persistent values
         self.register_buffer("conv_kernel", torch.zeros(1), persistent=False)
         self.register_buffer("linspace_stepsize", torch.zeros(1), persistent=False)
-        self.register_buffer("kernel_positions", torch.zeros(1), persistent=False)
+        # Shared by all layers with the same train_length, see cached_linspace_grid
+        self.kernel_positions = None
 
     def construct_kernel(self, x):
         # Construct kernel
@@ -125,19 +126,42 @@ class CKConvBase(torch.nn.Module):
         self.chang_initialization(kernel_pos)
         # 2. Sample the kernel
         x_shape = x.shape
-        conv_kernel = self.Kernel(kernel_pos).view(
+        conv_kernel = self.sample_kernel(kernel_pos).view(
             -1, x_shape[1], *kernel_pos.shape[2:]
         )
         # 3. Save the sampled kernel for computation of "weight_decay"
         self.conv_kernel = conv_kernel
         return self.conv_kernel
 
+    def sample_kernel(self, kernel_pos):
+        # The kernel net always runs in float32: under reduced precision autocast,
+        # neighbouring positions of long kernels would round to the same value.
+        with torch.autocast(device_type=kernel_pos.device.type, enabled=False):
+            return self.Kernel(kernel_pos)
+
+    def kernel_norm(self, norm_type: int = 2) -> torch.Tensor:
+        """Norm of the kernel of the last forward pass, used for weight decay."""
+        return self.conv_kernel.norm(norm_type)
+
+    def kernel_shape(self) -> torch.Size:
+        """Shape of the kernel of the last forward pass."""
+        return self.conv_kernel.shape
+
+    def sampled_kernel(self, x) -> torch.Tensor:
+        """The kernel of the last forward pass, with input x, sampled if the layer
+        did not sample it."""
+        return self.conv_kernel
+
     def handle_kernel_positions(self, x):
         """
         Handles the vector or relative positions which is given to KernelNet.
         """
+        # The cached grid is not a buffer, so it is refetched when the module moves
+        # to another device or dtype, which linspace_stepsize follows
         if (
-            self.kernel_positions.shape[-1] == 1
+            self.kernel_positions is None
+            or self.kernel_positions.device != x.device
+            or self.kernel_positions.dtype != self.linspace_stepsize.dtype
         ):  # The conv. receives input signals of length > 1
             if self.train_length[0] == 0:
                 # Decide the extend of the rel_positions vector
@@ -156,12 +180,13 @@ class CKConvBase(torch.nn.Module):
                         f"The size of the kernel must be either 'full', 'same' or an odd number"
                         f" in string format. Current: {self.kernel_size}"
                     )
-            # Creates the vector of relative positions.
-            kernel_positions = linspace_grid(
-                grid_sizes=self.train_length.repeat(self.data_dim)
+            # Creates the vector of relative positions, or reuses the one of another
+            # layer with the same train_length. TODO: Rectangular grids.
+            self.kernel_positions = cached_linspace_grid(
+                grid_sizes=[int(self.train_length[0])] * self.data_dim,
+                dtype=self.linspace_stepsize.dtype,
+                device=x.device,
             )
-            kernel_positions = kernel_positions.unsqueeze(0)  # TODO: Rectangular grids.
-            self.kernel_positions = kernel_positions.type_as(self.kernel_positions)
             # -> With form: [batch_size=1, dim, x_dimension, y_dimension, ...]
 
             # Save the step size for the calculation of dynamic cropping
@@ -216,9 +241,13 @@ class CKConv(CKConvBase):
 
     def forward(self, x):
         # 1. Construct kernel
-        conv_kernel = self.construct_kernel(x)
+        with record_function("ckconv.construct_kernel"):
+            conv_kernel = self.construct_kernel(x)
         # 4. Compute convolution & return result
-        return self.conv(x, conv_kernel, self.bias, separable=False, causal=self.causal)
+        with record_function(f"ckconv.{self.conv.__name__}"):
+            return self.conv(
+                x, conv_kernel, self.bias, separable=False, causal=self.causal
+            )
 
 
 class SeparableCKConv(CKConvBase):
@@ -258,9 +287,10 @@ class SeparableCKConv(CKConvBase):
 
     def forward(self, x):
         # 1. Construct kernel
-        conv_kernel = self.construct_kernel(x)
+        with record_function("ckconv.construct_kernel"):
+            conv_kernel = self.construct_kernel(x)
         # 4. Compute depthwise convolution
-        out = self.channel_mixer(
-            self.conv(x, conv_kernel, self.bias, separable=True, causal=self.causal)
-        )
+        with record_function(f"ckconv.{self.conv.__name__}"):
+            out = self.conv(x, conv_kernel, self.bias, separable=True, causal=self.causal)
+        out = self.channel_mixer(out)
         return out
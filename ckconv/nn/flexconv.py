@@ -1,10 +1,12 @@
 import math
 
 import torch
+from torch.profiler import record_function
 import ckconv
 from .ckconv import CKConv
 from .ckconv import CKConvBase
 import ckconv.nn.functional as ckconv_F
+from ckconv.utils.checkpoint import checkpoint
 
 # typing
 from omegaconf import OmegaConf
@@ -120,6 +122,27 @@ class FlexConvBase(CKConvBase):
 
         # Save values in self
         self.dynamic_cropping = mask_dynamic_cropping
+        # Recompute the kernel and convolution on the backward pass instead of storing
+        # their intermediate values.
+        self.checkpoint = conv_cfg.get("checkpoint", False)
+        # Kernels with a closed-form spectrum, e.g., ModalNet, are not sampled on the
+        # FFT path. Only for causal Gaussian masks centred at the end of the kernel.
+        self.spectral = (
+            hasattr(self.Kernel, "spectrum")
+            and self.data_dim == 1
+            and self.causal
+            and mask_type == "gaussian"
+            and not mask_learn_mean
+        )
+        # The kernel spectrum, FFT size and kernel size of the last forward pass on
+        # that path, on which conv_kernel is None
+        self.conv_kernel_fr = None
+        # Masked kernel sampled once and reused at inference, see `bake`
+        self.baked = False
+        self.baked_kernel = None
+        # Kernels longer than this use the FFT convolution, if conv.use_fft. Can be
+        # tuned per layer at inference, see `models.inference.truncate_kernels`.
+        self.fft_threshold = 50
 
     def crop_kernel_positions_causal(
         self,
@@ -164,8 +187,7 @@ class FlexConvBase(CKConvBase):
 
         return kernel_pos[slices]
 
-    def construct_masked_kernel(self, x):
-        # Construct kernel
+    def cropped_kernel_positions(self, x):
         # 1. Get kernel positions
         kernel_pos = self.handle_kernel_positions(x)
         # 2. dynamic cropping
@@ -181,9 +203,16 @@ class FlexConvBase(CKConvBase):
                 kernel_pos = self.crop_function(kernel_pos, roots)
         # 3. chang-initialize self.Kernel if not done yet.
         self.chang_initialization(kernel_pos)
+        return kernel_pos
+
+    def construct_masked_kernel(self, x, kernel_pos=None):
+        # Construct kernel
+        # 1-3. Get the cropped kernel positions
+        if kernel_pos is None:
+            kernel_pos = self.cropped_kernel_positions(x)
         # 4. sample the kernel
         x_shape = x.shape
-        conv_kernel = self.Kernel(kernel_pos).view(
+        conv_kernel = self.sample_kernel(kernel_pos).view(
             -1, x_shape[1], *kernel_pos.shape[2:]
         )
         # 5. construct mask and multiply with conv-kernel
@@ -197,6 +226,106 @@ class FlexConvBase(CKConvBase):
         # Return the masked kernel
         return self.conv_kernel
 
+    def bake(self, mode: bool = True):
+        """Samples the masked kernel once, on the next forward pass in eval mode, and
+        reuses it afterwards, as it does not depend on the input at inference. In
+        training mode the kernel is sampled as usual and the baked one is dropped."""
+        if mode != self.baked:
+            self.baked_kernel = None
+        self.baked = mode
+
+    def masked_kernel(self, x, kernel_pos=None):
+        """The masked kernel of this forward pass, baked if `bake` is on."""
+        if not (self.baked and not self.training):
+            self.baked_kernel = None
+            with record_function("ckconv.construct_masked_kernel"):
+                return self.construct_masked_kernel(x, kernel_pos)
+        if self.baked_kernel is None:
+            with torch.no_grad():
+                self.baked_kernel = self.construct_masked_kernel(x, kernel_pos)
+        self.conv_kernel = self.baked_kernel
+        return self.baked_kernel
+
+    def spectral_conv(self, x, kernel_pos):
+        """Convolution with the spectrum of the masked kernel, without sampling it."""
+        size = kernel_pos.shape[-1]
+        n = ckconv_F.fft_size(x.shape[-1], size, self.causal)
+        with record_function("ckconv.kernel_spectrum"):
+            kernel_fr = self.Kernel.spectrum(
+                end=kernel_pos[0, 0, -1],
+                step=self.linspace_stepsize,
+                size=size,
+                n=n,
+                mask_width=self.mask_width_param,
+            )
+            kernel_fr = kernel_fr.view(-1, x.shape[1], kernel_fr.shape[-1])
+        self.conv_kernel_fr = (kernel_fr, n, size)
+        # The kernel is not sampled, see `kernel_shape` and `sampled_kernel`
+        self.conv_kernel = None
+        with record_function("ckconv.fftconv1d_spectral"):
+            return ckconv_F.fftconv1d_spectral(
+                x, kernel_fr, size, self.bias, separable=self.separable, causal=True
+            )
+
+    def kernel_norm(self, norm_type: int = 2) -> torch.Tensor:
+        if self.conv_kernel_fr is None:
+            return super().kernel_norm(norm_type)
+        if norm_type != 2:
+            raise NotImplementedError(
+                "Only the L2 norm of a kernel given by its spectrum is supported."
+            )
+        # Parseval: the rfft holds every frequency but 0 and n / 2 twice
+        kernel_fr, n, _ = self.conv_kernel_fr
+        weights = torch.full((kernel_fr.shape[-1],), 2.0, device=kernel_fr.device)
+        weights[0] = 1.0
+        if n % 2 == 0:
+            weights[-1] = 1.0
+        return torch.sqrt((weights * kernel_fr.abs() ** 2).sum() / n)
+
+    def kernel_shape(self) -> torch.Size:
+        if self.conv_kernel_fr is None:
+            return super().kernel_shape()
+        kernel_fr, _, size = self.conv_kernel_fr
+        return torch.Size([*kernel_fr.shape[:-1], size])
+
+    def sampled_kernel(self, x) -> torch.Tensor:
+        if self.conv_kernel_fr is None:
+            return super().sampled_kernel(x)
+        # Samples the kernel given by its spectrum, e.g., for logging
+        with torch.no_grad():
+            kernel = self.construct_masked_kernel(x)
+        self.conv_kernel = None
+        return kernel
+
+    def masked_conv(self, x):
+        self.conv_kernel_fr = None
+        kernel_pos = None
+        # Baked kernels are sampled, also if they have a closed-form spectrum
+        if self.spectral and not (self.baked and not self.training):
+            kernel_pos = self.cropped_kernel_positions(x)
+            if self.conv_use_fft and kernel_pos.shape[-1] > self.fft_threshold:
+                return self.spectral_conv(x, kernel_pos)
+        # 1. Compute the masked kernel
+        conv_kernel = self.masked_kernel(x, kernel_pos)
+        # 2. Select convolution type
+        size = torch.tensor(conv_kernel.shape[2:])
+        # if the kernel is larger than fft_threshold, use fftconv
+        if self.conv_use_fft and torch.all(size > self.fft_threshold):
+            conv_type = self.conv_types["fft"]
+        else:
+            conv_type = self.conv_types["spatial"]
+        # 3. Compute convolution
+        with record_function(f"ckconv.{conv_type.__name__}"):
+            out = conv_type(
+                x, conv_kernel, self.bias, separable=self.separable, causal=self.causal
+            )
+        return out
+
+    def forward(self, x):
+        if self.checkpoint and self.training and torch.is_grad_enabled():
+            return checkpoint(self.masked_conv, x)
+        return self.masked_conv(x)
+
 
 class FlexConv(FlexConvBase):
     def __init__(
@@ -219,19 +348,6 @@ class FlexConv(FlexConvBase):
             separable=False,
         )
 
-    def forward(self, x):
-        # 1. Compute the masked kernel
-        conv_kernel = self.construct_masked_kernel(x)
-        # 2. Compute convolution & return result
-        size = torch.tensor(conv_kernel.shape[2:])
-        # if the kernel is larger than 50, use fftconv
-        if self.conv_use_fft and torch.all(size > 50):
-            conv_type = self.conv_types["fft"]
-        else:
-            conv_type = self.conv_types["spatial"]
-        out = conv_type(x, conv_kernel, self.bias, separable=False, causal=self.causal)
-        return out
-
 
 class SeparableFlexConv(FlexConvBase):
     def __init__(
@@ -264,21 +380,41 @@ class SeparableFlexConv(FlexConvBase):
         torch.nn.init.kaiming_normal_(self.channel_mixer.weight)
         if self.channel_mixer.bias is not None:
             torch.nn.init._no_grad_fill_(self.channel_mixer.bias, 0.0)
+        # Mix the channels in the Fourier domain, before the inverse FFT, if cheaper.
+        # Only implemented for sequences, and for kernels that are sampled.
+        self.fuse_mixer = (
+            conv_cfg.get("fuse_mixer", False) and data_dim == 1 and not self.spectral
+        )
 
-    def forward(self, x):
+    def masked_conv(self, x):
+        if not self.fuse_mixer:
+            return super().masked_conv(x)
         # 1. Compute the masked kernel
-        conv_kernel = self.construct_masked_kernel(x)
-        # 2. Select convolution type
-        size = torch.tensor(conv_kernel.shape[2:])
-        # if the kernel is larger than 50, use fftconv
-        if self.conv_use_fft and torch.all(size > 50):
-            conv_type = self.conv_types["fft"]
+        conv_kernel = self.masked_kernel(x)
+        # 2. Compute the depthwise convolution and channel mixer
+        if self.conv_use_fft and conv_kernel.shape[-1] > self.fft_threshold:
+            with record_function("ckconv.fftconv1d_mixed"):
+                out = ckconv_F.fftconv1d_mixed(
+                    x,
+                    conv_kernel,
+                    self.bias,
+                    self.channel_mixer.weight,
+                    self.channel_mixer.bias,
+                    causal=self.causal,
+                )
         else:
-            conv_type = self.conv_types["spatial"]
-        # 3. Compute depthwise convolution
-        out = self.channel_mixer(
-            conv_type(x, conv_kernel, self.bias, separable=True, causal=self.causal)
-        )
+            with record_function("ckconv.conv1d"):
+                out = ckconv_F.conv1d(
+                    x, conv_kernel, self.bias, separable=True, causal=self.causal
+                )
+            out = self.channel_mixer(out)
+        return out
+
+    def forward(self, x):
+        # Depthwise convolution, followed by the point-wise channel mixer
+        out = super().forward(x)
+        if not self.fuse_mixer:
+            out = self.channel_mixer(out)
         return out
 
 
@@ -1,2 +1,8 @@
 from .conv import conv2d, fftconv2d, conv3d, fftconv3d
-from .causal_conv import conv1d, fftconv1d
+from .causal_conv import (
+    conv1d,
+    fftconv1d,
+    fftconv1d_mixed,
+    fftconv1d_spectral,
+    fft_size,
+)
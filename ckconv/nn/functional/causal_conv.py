@@ -1,9 +1,13 @@
+import math
+
 import torch
 import torch.nn.functional as f
 import torch.fft
 
 from typing import Optional
 
+from ckconv.utils.flops import fft_flops
+
 
 def causal_padding(
     x: torch.Tensor,
@@ -30,6 +34,17 @@ def padding(
     return x, kernel
 
 
+def fft_dtypes(
+    x: torch.Tensor,
+    kernel: torch.Tensor,
+) -> tuple[torch.dtype, torch.dtype]:
+    """The dtype of the output of an FFT convolution, and the dtype its FFTs are
+    computed in: at least float32, as the FFTs do not support reduced precision
+    inputs, e.g., under bfloat16 autocast, and would lose too much accuracy."""
+    out_dtype = torch.promote_types(x.dtype, kernel.dtype)
+    return out_dtype, torch.promote_types(out_dtype, torch.float32)
+
+
 def conv1d(
     x: torch.Tensor,
     kernel: torch.Tensor,
@@ -79,34 +94,222 @@ def fftconv1d(
     Returns:
         (Tensor) Convolved tensor
     """
+    out_dtype, fft_dtype = fft_dtypes(x, kernel)
+    out = FFTConv1d.apply(x.to(fft_dtype), kernel.to(fft_dtype), separable, causal)
+    # Optionally, add a bias term before returning.
+    if bias is not None:
+        out = out + bias.view(1, -1, 1)
+    return out.to(out_dtype)
+
+
+class FFTConv1d(torch.autograd.Function):
+    """Convolution in the Fourier domain with a memory-lean backward pass.
+
+    Differentiating through the FFTs with autograd stores the padded input and
+    kernel, both spectra, their product and the inverse transform. Instead, only the
+    (unpadded) input and kernel are saved, and the gradients are computed on the
+    backward pass from their spectra and the spectrum of the output gradient:
+        grad_input = irfft(rfft(grad_out) * rfft(kernel))
+        grad_kernel = irfft(conj(rfft(grad_out)) * rfft(input))
+    """
+
+    @staticmethod
+    def _spectra(x, kernel, causal):
+        # 1. Handle padding
+        if causal:
+            x, kernel = causal_padding(x, kernel)
+        else:
+            x, kernel = padding(x, kernel)
+        # 2. Perform fourier transforms, the kernel is zero-padded to the input size.
+        n = x.shape[-1]
+        x_fr = torch.fft.rfft(x, dim=-1)
+        kernel_fr = torch.fft.rfft(kernel, n=n, dim=-1)
+        return x_fr, kernel_fr, n, kernel.shape[-1]
 
-    x_shape = x.shape
+    @staticmethod
+    def forward(ctx, x, kernel, separable, causal):
+        x_fr, kernel_fr, n, _ = FFTConv1d._spectra(x, kernel, causal)
+        # 3. Multiply the transformed matrices:
+        # (Input * Conj(Kernel)) = Correlation(Input, Kernel)
+        kernel_fr = torch.conj(kernel_fr)
+        if separable:
+            output_fr = kernel_fr * x_fr
+        else:
+            output_fr = torch.einsum("bi..., oi... -> bo...", x_fr, kernel_fr)
+        # 4. Compute inverse FFT, and remove extra padded values
+        out = torch.fft.irfft(output_fr, n=n, dim=-1)[..., : x.shape[-1]]
 
-    # 1. Handle padding
+        ctx.save_for_backward(x, kernel)
+        ctx.separable = separable
+        ctx.causal = causal
+        return out
+
+    @staticmethod
+    @torch.autograd.function.once_differentiable
+    def backward(ctx, grad_out):
+        x, kernel = ctx.saved_tensors
+        separable, causal = ctx.separable, ctx.causal
+        x_fr, kernel_fr, n, padded_kernel_size = FFTConv1d._spectra(x, kernel, causal)
+        # The output gradient is zero beyond the cropped output
+        grad_fr = torch.fft.rfft(grad_out, n=n, dim=-1)
+
+        grad_x = grad_kernel = None
+        if ctx.needs_input_grad[0]:
+            # Convolution of the output gradient with the kernel
+            if separable:
+                grad_x_fr = grad_fr * kernel_fr
+            else:
+                grad_x_fr = torch.einsum("bo..., oi... -> bi...", grad_fr, kernel_fr)
+            grad_x = torch.fft.irfft(grad_x_fr, n=n, dim=-1)
+            # Remove the padding of the input
+            start = padded_kernel_size - 1 if causal else kernel.shape[-1] // 2
+            grad_x = grad_x[..., start : start + x.shape[-1]]
+        if ctx.needs_input_grad[1]:
+            # Correlation of the input with the output gradient
+            if separable:
+                grad_kernel_fr = (torch.conj(grad_fr) * x_fr).sum(0, keepdim=True)
+            else:
+                grad_kernel_fr = torch.einsum(
+                    "bo..., bi... -> oi...", torch.conj(grad_fr), x_fr
+                )
+            grad_kernel = torch.fft.irfft(grad_kernel_fr, n=n, dim=-1)
+            # Remove the padding of the kernel, see causal_padding
+            grad_kernel = grad_kernel[
+                ..., padded_kernel_size - kernel.shape[-1] : padded_kernel_size
+            ]
+        return grad_x, grad_kernel, None, None
+
+
+def fftconv1d_mixed(
+    x: torch.Tensor,
+    kernel: torch.Tensor,
+    bias: Optional[torch.Tensor],
+    weight: torch.Tensor,
+    mixer_bias: Optional[torch.Tensor] = None,
+    causal: bool = False,
+    order: str = "auto",
+) -> torch.Tensor:
+    """Separable fftconv1d followed by a point-wise channel mixer, i.e.,
+        conv1d(fftconv1d(x, kernel, bias, separable=True), weight, mixer_bias)
+
+    The channels can be mixed before or after the inverse FFT. Mixing in the
+    frequency domain replaces in_channels inverse transforms by out_channels ones and
+    skips the full-size depthwise output, but mixes about twice as many (complex)
+    values. By default, the order with the fewest floating point operations is used.
+
+    Args:
+        x: (Tensor) Input tensor of shape [batch, in_channels, length].
+        kernel: (Tensor) Depthwise kernel of shape [1, in_channels, kernel_size].
+        bias: (Optional, Tensor) Bias of the depthwise convolution.
+        weight: (Tensor) Channel mixer weight of shape [out_channels, in_channels, 1].
+        mixer_bias: (Optional, Tensor) Bias of the channel mixer.
+        causal: (bool) Whether to use causal padding.
+        order: (str) "frequency", "time" or "auto".
+    Returns:
+        (Tensor) Convolved tensor
+    """
+    if order == "auto":
+        order = mixing_order(
+            x.shape[0], weight.shape[1], weight.shape[0], x.shape[-1], kernel.shape[-1]
+        )
+    if order == "time":
+        out = fftconv1d(x, kernel, bias, separable=True, causal=causal)
+        return f.conv1d(out, weight, mixer_bias)
+    elif order != "frequency":
+        raise ValueError(f"Mixing order {order} not recognized.")
+
+    out_dtype, fft_dtype = fft_dtypes(x, kernel)
+    x_fr, kernel_fr, n, _ = FFTConv1d._spectra(
+        x.to(fft_dtype), kernel.to(fft_dtype), causal
+    )
+    output_fr = x_fr * torch.conj(kernel_fr)
+    # Mix the channels of the spectra and compute out_channels inverse FFTs
+    output_fr = torch.einsum(
+        "oi, bi... -> bo...", weight.squeeze(-1).to(output_fr.dtype), output_fr
+    )
+    out = torch.fft.irfft(output_fr, n=n, dim=-1)[..., : x.shape[-1]]
+    # The mixed depthwise bias is a constant per output channel
+    out_bias = mixer_bias
+    if bias is not None:
+        mixed_bias = weight.squeeze(-1) @ bias
+        out_bias = mixed_bias if out_bias is None else out_bias + mixed_bias
+    if out_bias is not None:
+        out = out + out_bias.view(1, -1, 1)
+    return out.to(out_dtype)
+
+
+def fft_size(length: int, kernel_size: int, causal: bool = False) -> int:
+    """Size of the FFTs of fftconv1d, i.e., the length of the padded input, for an
+    input of the given length and a kernel of kernel_size."""
     if causal:
-        x, kernel = causal_padding(x, kernel)
-    else:
-        x, kernel = padding(x, kernel)
+        # causal_padding makes even kernels odd
+        return length + kernel_size - 1 + (kernel_size % 2 == 0)
+    return length + 2 * (kernel_size // 2)
 
-    # 2. Pad the kernel tensor to make them equally big. Required for fft.
-    kernel = f.pad(kernel, [0, x.size(-1) - kernel.size(-1)])
 
-    # 3. Perform fourier transform
-    x_fr = torch.fft.rfft(x, dim=-1)
-    kernel_fr = torch.conj(torch.fft.rfft(kernel, dim=-1))
+def fftconv1d_spectral(
+    x: torch.Tensor,
+    kernel_fr: torch.Tensor,
+    kernel_size: int,
+    bias: Optional[torch.Tensor] = None,
+    separable: bool = False,
+    causal: bool = False,
+) -> torch.Tensor:
+    """fftconv1d with a kernel that is given by its spectrum instead, e.g., as
+    computed by `ckconv.nn.ck.ModalNet.spectrum`. Skips the FFT of the kernel.
 
-    # 4. Multiply the transformed matrices:
+    Args:
+        x: (Tensor) Input tensor to be convolved with the kernel.
+        kernel_fr: (Tensor) rfft(kernel, n=fft_size(...)) of the unpadded kernel.
+        kernel_size: (int) Size of the kernel.
+        bias: (Optional, Tensor) Bias tensor to add to the output.
+        separable: (bool) Whether the kernel is depthwise.
+        causal: (bool) Whether to use causal padding.
+    Returns:
+        (Tensor) Convolved tensor
+    """
+    n = fft_size(x.shape[-1], kernel_size, causal)
+    out_dtype = x.dtype
+    x = x.to(torch.promote_types(x.dtype, torch.float32))
+    if causal:
+        x_padded = f.pad(x, [n - x.shape[-1], 0], value=0.0)
+        if kernel_size % 2 == 0:
+            # causal_padding prepends a zero to even kernels, i.e., delays them
+            k = torch.arange(
+                kernel_fr.shape[-1], device=x.device, dtype=kernel_fr.real.dtype
+            )
+            kernel_fr = kernel_fr * torch.polar(torch.ones_like(k), -2 * math.pi * k / n)
+    else:
+        x_padded = f.pad(x, [kernel_size // 2, kernel_size // 2], value=0.0)
+    x_fr = torch.fft.rfft(x_padded, dim=-1)
     # (Input * Conj(Kernel)) = Correlation(Input, Kernel)
+    kernel_fr = torch.conj(kernel_fr)
     if separable:
         output_fr = kernel_fr * x_fr
     else:
         output_fr = torch.einsum("bi..., oi... -> bo...", x_fr, kernel_fr)
-
-    # 5. Compute inverse FFT, and remove extra padded values
-    # Once we are back in the spatial domain, we can go back to float precision, if double used.
-    out = torch.fft.irfft(output_fr, dim=-1)[..., : x_shape[-1]]
-
-    # 6. Optionally, add a bias term before returning.
+    out = torch.fft.irfft(output_fr, n=n, dim=-1)[..., : x.shape[-1]]
     if bias is not None:
         out = out + bias.view(1, -1, 1)
-    return out
+    return out.to(out_dtype)
+
+
+def mixing_order(
+    batch_size: int,
+    in_channels: int,
+    out_channels: int,
+    length: int,
+    kernel_size: int,
+) -> str:
+    """The cheaper order of fftconv1d_mixed, "frequency" or "time", in floating point
+    operations of the inverse FFTs and the channel mixing."""
+    n = length + kernel_size
+    frequencies = n // 2 + 1
+    # complex multiply-accumulate: 8 flops, real: 2 flops
+    frequency = batch_size * (
+        8 * frequencies * in_channels * out_channels + out_channels * fft_flops(n)
+    )
+    time = batch_size * (
+        2 * length * in_channels * out_channels + in_channels * fft_flops(n)
+    )
+    return "frequency" if frequency < time else "time"
@@ -0,0 +1,97 @@
+from . import causal_conv
+import torch
+
+
+def shapes():
+    # (separable, causal, length, kernel_size), odd and even lengths and kernels
+    for separable in [True, False]:
+        for length in [31, 32]:
+            for kernel_size in [5, 6]:
+                yield separable, True, length, kernel_size
+            # Centred convolutions require odd kernels in conv1d
+            yield separable, False, length, 7
+
+
+def inputs(separable, length, kernel_size, batch_size=2, channels=3):
+    x = torch.randn(batch_size, channels, length, dtype=torch.double)
+    kernel_channels = 1 if separable else channels
+    kernel = torch.randn(kernel_channels, channels, kernel_size, dtype=torch.double)
+    bias = torch.randn(channels, dtype=torch.double)
+    return [t.requires_grad_() for t in (x, kernel, bias)]
+
+
+def test_fftconv1d_matches_conv1d():
+    for separable, causal, length, kernel_size in shapes():
+        x, kernel, bias = inputs(separable, length, kernel_size)
+        out = causal_conv.fftconv1d(x, kernel, bias, separable=separable, causal=causal)
+        grads = torch.autograd.grad(out.pow(2).sum(), (x, kernel, bias))
+
+        ref = causal_conv.conv1d(x, kernel, bias, separable=separable, causal=causal)
+        ref_grads = torch.autograd.grad(ref.pow(2).sum(), (x, kernel, bias))
+
+        assert out.shape == ref.shape == x.shape
+        assert torch.allclose(out, ref)
+        for grad, ref_grad in zip(grads, ref_grads):
+            assert torch.allclose(grad, ref_grad)
+
+
+def test_fftconv1d_gradcheck():
+    for separable, causal, length, kernel_size in shapes():
+        x, kernel, _ = inputs(separable, length, kernel_size, batch_size=1, channels=2)
+        assert torch.autograd.gradcheck(
+            causal_conv.FFTConv1d.apply, (x, kernel, separable, causal)
+        )
+
+
+def test_fftconv1d_only_saves_inputs():
+    x, kernel, _ = inputs(separable=True, length=64, kernel_size=64, channels=4)
+    saved = []
+    with torch.autograd.graph.saved_tensors_hooks(
+        lambda t: saved.append(t) or t, lambda t: t
+    ):
+        causal_conv.fftconv1d(x, kernel, separable=True, causal=True)
+    assert len(saved) == 2
+    assert saved[0].data_ptr() == x.data_ptr()
+    assert saved[1].data_ptr() == kernel.data_ptr()
+
+
+def test_fftconv1d_mixed_matches_unfused():
+    for _, causal, length, kernel_size in shapes():
+        # Fewer, equal and more output than input channels
+        for out_channels in [2, 3, 5]:
+            x, kernel, bias = inputs(True, length, kernel_size)
+            weight = torch.randn(out_channels, 3, 1, dtype=torch.double)
+            mixer_bias = torch.randn(out_channels, dtype=torch.double)
+            weight.requires_grad_(), mixer_bias.requires_grad_()
+            params = (x, kernel, bias, weight, mixer_bias)
+
+            ref = causal_conv.fftconv1d(x, kernel, bias, separable=True, causal=causal)
+            ref = torch.nn.functional.conv1d(ref, weight, mixer_bias)
+            ref_grads = torch.autograd.grad(ref.pow(2).sum(), params)
+
+            for order in ["frequency", "time", "auto"]:
+                out = causal_conv.fftconv1d_mixed(*params, causal=causal, order=order)
+                grads = torch.autograd.grad(out.pow(2).sum(), params)
+                assert out.shape == ref.shape
+                assert torch.allclose(out, ref)
+                for grad, ref_grad in zip(grads, ref_grads):
+                    assert torch.allclose(grad, ref_grad)
+
+
+def test_mixing_order():
+    # Mixing before the inverse FFT pays off when the channels are reduced
+    assert causal_conv.mixing_order(8, 256, 1, 1000, 1000) == "frequency"
+    assert causal_conv.mixing_order(8, 16, 256, 1000, 1000) == "time"
+
+
+def test_fftconv1d_spectral_matches_fftconv1d():
+    for separable, causal, length, kernel_size in shapes():
+        x, kernel, bias = inputs(separable, length, kernel_size)
+        n = causal_conv.fft_size(length, kernel_size, causal)
+        kernel_fr = torch.fft.rfft(kernel, n=n, dim=-1)
+        out = causal_conv.fftconv1d_spectral(
+            x, kernel_fr, kernel_size, bias, separable=separable, causal=causal
+        )
+        ref = causal_conv.fftconv1d(x, kernel, bias, separable=separable, causal=causal)
+        assert out.shape == ref.shape
+        assert torch.allclose(out, ref)
@@ -68,12 +68,18 @@ def fftconv(
 
     # Input tensors are assumed to have dimensionality [batch_size, no_channels, spatial_dim1, .., spatial_dimN].
     x_shape = x.shape
+    # The FFTs are computed in at least float32, also under reduced precision autocast
+    out_dtype = torch.promote_types(x.dtype, kernel.dtype)
+    fft_dtype = torch.promote_types(out_dtype, torch.float32)
+    x, kernel = x.to(fft_dtype), kernel.to(fft_dtype)
     spatial_dim = len(x.shape) - 2
 
-    if (kernel.shape[-2] % 2 == 0) or (kernel.shape[-1] % 2 == 0):
+    # Only the spatial dimensions must be odd, for 1D kernels shape[-2] are channels
+    kernel_size = tuple(kernel.shape[-spatial_dim:])
+    if any(size % 2 == 0 for size in kernel_size):
         raise AttributeError(
-            "Convolutional kernels must have odd dimensionality. Received: ({}, {})".format(
-                kernel.shape[-2], kernel.shape[-1]
+            "Convolutional kernels must have odd dimensionality. Received: {}".format(
+                kernel_size
             )
         )
 
@@ -117,8 +123,7 @@ def fftconv(
     # )  # 'ab..., cb... -> ac...'
 
     # 5. Compute inverse FFT, and remove extra padded values
-    # Once we are back in the spatial domain, we can go back to float precision, if double used.
-    out = torch.fft.irfftn(output_fr, dim=tuple(range(2, x.ndim))).float()
+    out = torch.fft.irfftn(output_fr, dim=tuple(range(2, x.ndim)))
 
     # No PyTorch function exists for cropping, it seems
     if spatial_dim == 1:
@@ -133,7 +138,9 @@ def fftconv(
         reshape_dim = spatial_dim * [1]
         out = out + bias.view(1, -1, *reshape_dim)
 
-    return out
+    # Once we are back in the spatial domain, we can go back to the input precision,
+    # if double used.
+    return out.to(out_dtype)
 
 
 # Aliases to handle data dimensionality
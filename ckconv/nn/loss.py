@@ -29,7 +29,7 @@ class LnLoss(torch.nn.Module):
         # If the module is a CKConv, calculate on the sampled kernel
         for m in model.modules():
             if isinstance(m, CKConvBase):
-                loss += m.conv_kernel.norm(self.norm_type)
+                loss += m.kernel_norm(self.norm_type)
         return loss
 
     def forward(
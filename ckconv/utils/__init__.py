@@ -1,9 +1,21 @@
-from .flatten_configdict import flatten_configdict
-from .grids import linspace_grid
+import importlib
+
+from .grids import linspace_grid, cached_linspace_grid, clear_grid_cache
 from .iterables import pairwise as pairwise_iterable
-from .hooks import (
-    visualize_ckconv_out_hook,
-    visualize_kernel_out_hook,
-    visualize_conv_kernel_out_hook,
-)
 from .no_params import no_params
+
+# Imported on first access, as they depend on pandas and wandb
+_REGISTRY = {
+    "flatten_configdict": ".flatten_configdict",
+    "visualize_ckconv_out_hook": ".hooks",
+    "visualize_kernel_out_hook": ".hooks",
+    "visualize_conv_kernel_out_hook": ".hooks",
+}
+
+
+def __getattr__(name):
+    if name not in _REGISTRY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_REGISTRY[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,34 @@
+import torch
+import torch.utils.checkpoint
+
+
+def checkpoint(function, *args):
+    """Activation checkpointing of function(*args): the activations of function are
+    not stored, but recomputed on the backward pass.
+
+    Batch norm layers would update their running statistics a second time during
+    the recomputation. Their momentum is therefore set to zero while recomputing,
+    which leaves the running statistics untouched.
+    """
+    module = getattr(function, "__self__", function)
+    calls = []
+
+    def run(*inputs):
+        if not calls:
+            calls.append(True)
+            return function(*inputs)
+        norms = [
+            m
+            for m in module.modules()
+            if isinstance(m, torch.nn.modules.batchnorm._BatchNorm) and m.training
+        ]
+        momenta = [m.momentum for m in norms]
+        for m in norms:
+            m.momentum = 0.0
+        try:
+            return function(*inputs)
+        finally:
+            for m, momentum in zip(norms, momenta):
+                m.momentum = momentum
+
+    return torch.utils.checkpoint.checkpoint(run, *args, use_reentrant=False)
@@ -0,0 +1,120 @@
+import math
+import torch
+
+
+def fft_flops(n: int) -> float:
+    """Approximate number of real floating point operations of a real FFT of n points."""
+    if n <= 1:
+        return 0.0
+    return 2.5 * n * math.log2(n)
+
+
+def conv_flops(
+    x_shape,
+    kernel_shape,
+    separable: bool,
+    fft: bool,
+    causal: bool = True,
+) -> float:
+    """Approximate number of floating point operations of a call to one of the
+    convolutions in `ckconv.nn.functional`.
+
+    Args:
+        x_shape: shape of the input, [batch, in_channels, *spatial]
+        kernel_shape: shape of the kernel, [out_channels or 1, in_channels, *spatial]
+        separable (bool): whether the convolution is depthwise.
+        fft (bool): whether the convolution is computed in the Fourier domain.
+        causal (bool, optional): whether causal (1D) padding is used. Defaults to True.
+    """
+    batch, in_channels = x_shape[0], x_shape[1]
+    spatial = list(x_shape[2:])
+    kernel_spatial = list(kernel_shape[2:])
+    out_channels = in_channels if separable else kernel_shape[0]
+    no_kernels = in_channels if separable else out_channels * in_channels
+    if fft:
+        # Inputs and kernels are padded to the same size, see fftconv1d and fftconv.
+        if causal:
+            padded = [s + k - 1 for s, k in zip(spatial, kernel_spatial)]
+        else:
+            padded = [s + 2 * (k // 2) for s, k in zip(spatial, kernel_spatial)]
+        n = math.prod(padded)
+        no_freqs = n // padded[-1] * (padded[-1] // 2 + 1)
+        transforms = (batch * in_channels + no_kernels + batch * out_channels) * (
+            fft_flops(n)
+        )
+        # Complex multiplication: 6 flops, complex multiply-accumulate: 8 flops.
+        if separable:
+            products = 6 * batch * in_channels * no_freqs
+        else:
+            products = 8 * batch * out_channels * in_channels * no_freqs
+        return transforms + products
+    else:
+        macs_per_output = math.prod(kernel_spatial) * (1 if separable else in_channels)
+        return 2.0 * batch * out_channels * math.prod(spatial) * macs_per_output
+
+
+def module_flops(module: torch.nn.Module, inputs: tuple, output) -> float:
+    """Approximate number of floating point operations of one forward pass of a module,
+    given its inputs and output. Returns 0.0 for modules that are not recognised.
+
+    Supported are the convolutional layers of `ckconv.nn` (kernel generation, the
+    convolution itself, and the channel mixer of separable layers), kernel networks,
+    `torch.nn.ConvNd` (including `ckconv.nn.LinearNd`) and normalisation layers.
+    """
+    # Imported here, as ckconv.nn itself imports ckconv.utils.
+    from ckconv.nn.ckconv import CKConvBase
+    from ckconv.nn.conv import ConvBase
+
+    if not isinstance(output, torch.Tensor):
+        return 0.0
+    x = inputs[0] if len(inputs) > 0 else None
+
+    if isinstance(module, torch.nn.modules.conv._ConvNd):
+        macs_per_output = math.prod(module.kernel_size) * (
+            module.in_channels // module.groups
+        )
+        return 2.0 * output.numel() * macs_per_output
+
+    if isinstance(module, (torch.nn.modules.batchnorm._NormBase, torch.nn.GroupNorm)):
+        return 2.0 * output.numel()
+    if isinstance(module, torch.nn.LayerNorm) or type(module).__name__ == "LayerNorm":
+        return 8.0 * output.numel()
+
+    if isinstance(module, (CKConvBase, ConvBase)):
+        if isinstance(module, CKConvBase):
+            kernel_shape = module.kernel_shape()
+        else:
+            kernel_shape = module.weight.shape
+        fft = module.conv_use_fft
+        if fft and hasattr(module, "conv_types"):
+            # FlexConvs only use the FFT for kernels larger than their fft_threshold
+            fft = all(s > module.fft_threshold for s in kernel_shape[2:])
+        flops = conv_flops(
+            x.shape,
+            kernel_shape,
+            separable=module.separable,
+            fft=fft,
+            causal=getattr(module, "causal", True),
+        )
+        if isinstance(module, CKConvBase):
+            # Kernel generation, on the positions of the sampled kernel
+            flops += kernel_net_flops(module.Kernel, math.prod(kernel_shape[2:]))
+        if hasattr(module, "channel_mixer"):
+            flops += 2.0 * output.numel() * module.channel_mixer.in_channels
+        return flops
+
+    if hasattr(module, "output_linear"):
+        # A kernel network, evaluated on every position of its output
+        return kernel_net_flops(module, math.prod(output.shape[2:]))
+
+    return 0.0
+
+
+def kernel_net_flops(kernel_net: torch.nn.Module, no_positions: int) -> float:
+    """Approximate number of floating point operations of a kernel network evaluated
+    on no_positions positions. Only the (pointwise) linear layers are counted."""
+    flops = 0.0
+    for m in kernel_net.modules():
+        if isinstance(m, torch.nn.modules.conv._ConvNd):
+            flops += 2.0 * no_positions * m.in_channels * m.out_channels
+    return flops
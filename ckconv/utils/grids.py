@@ -1,5 +1,11 @@
 import torch
 
+# typing
+from typing import Optional, Sequence
+
+# (sizes, dtype, device) -> grid, shared by all layers of the process
+_GRID_CACHE = {}
+
 
 def linspace_grid(grid_sizes):
     """Generates a flattened grid of (x,y,...) coordinates in a range of -1 to 1."""
@@ -8,3 +14,31 @@ def linspace_grid(grid_sizes):
         tensors.append(torch.linspace(-1, 1, steps=size))
     grid = torch.stack(torch.meshgrid(*tensors, indexing='ij'), dim=0)
     return grid
+
+
+def cached_linspace_grid(
+    grid_sizes: Sequence[int],
+    dtype: Optional[torch.dtype] = None,
+    device: Optional[torch.device] = None,
+) -> torch.Tensor:
+    """Returns the linspace_grid of the given sizes, with form [1, dim, *grid_sizes],
+    from a process-wide cache. Layers with the same sizes share the same tensor, and
+    crops of it are views of the same memory.
+
+    The returned grid is shared and must be treated as read-only: never modify it,
+    or its views, in place.
+    """
+    dtype = torch.get_default_dtype() if dtype is None else dtype
+    device = torch.device("cpu" if device is None else device)
+    key = (tuple(int(size) for size in grid_sizes), dtype, device)
+    grid = _GRID_CACHE.get(key)
+    if grid is None:
+        grid = linspace_grid(key[0]).unsqueeze(0).to(dtype=dtype, device=device)
+        # Another thread may have created it in the meantime, keep the first one
+        grid = _GRID_CACHE.setdefault(key, grid)
+    return grid
+
+
+def clear_grid_cache():
+    """Drops the cached grids, e.g., to release the memory of a device."""
+    _GRID_CACHE.clear()
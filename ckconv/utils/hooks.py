@@ -1,7 +1,7 @@
-import wandb
 import torch
 
 
+from ckconv.utils import loggers
 from ckconv.utils.visualisation import visualize_tensor_1d, visualize_tensor_2d
 
 
@@ -42,8 +42,9 @@ def log_dead_neuron_count_hook(module, module_in, module_out, name):
     if hasattr(module, "dead_indices"):
         dead_count = len(module.dead_indices)
 
-        if wandb.run:
-            wandb.log({"dead/" + name: dead_count / out.shape[1]}, commit=False)
+        run = loggers.active_run()
+        if run:
+            loggers.log(run, {"dead/" + name: dead_count / out.shape[1]}, commit=False)
 
         del module.dead_indices
 
@@ -58,10 +59,13 @@ def module_out_hist_hook(module, module_in, module_out, output, name):
     if type(module_in) == tuple:
         input = module_in[0]
 
-    if wandb.run:
-        wandb.log(
+    run = loggers.active_run()
+    if run:
+        histogram = loggers.Histogram.from_values(output.detach().cpu().numpy())
+        loggers.log(
+            run,
             {
-                "activations/" + name: wandb.Histogram(output.detach().cpu().numpy()),
+                "activations/" + name: histogram,
                 # name + ".sum": output.sum().detach().cpu().numpy(),
             },
             commit=False,
@@ -71,18 +75,23 @@ def module_out_hist_hook(module, module_in, module_out, output, name):
 def visualize_kernel_out_hook(module, module_in, module_out, name):
     """Logs a visualisation of kernelnet output values (conv kernels) in a plotly figure format."""
 
-    # Get conv kernel.
-    kernel = module.conv_kernel
+    # Get conv kernel, sampled if it is given by its spectrum.
+    if hasattr(module, "sampled_kernel"):
+        kernel = module.sampled_kernel(module_in[0])
+    else:
+        kernel = module.conv_kernel
 
     # Get dimensionality of conv kernel.
     data_dim = module.data_dim
 
-    if wandb.run:
+    run = loggers.active_run()
+    if run:
         if data_dim == 1:
             figs = visualize_tensor_1d(kernel.detach().cpu())
         elif data_dim == 2:
             figs = visualize_tensor_2d(kernel.detach().cpu())
-        wandb.log(
+        loggers.log(
+            run,
             {f"kernels/{name}.out_channel.{idx}": fig for idx, fig in enumerate(figs)},
             commit=False,
         )
@@ -92,9 +101,11 @@ def visualize_conv_kernel_out_hook(module, input, output, name):
     """Logs a visualisation of kernelnet output values (conv kernels) in a plotly figure format."""
     kernel = module.weight
 
-    if wandb.run:
+    run = loggers.active_run()
+    if run:
         figs = visualize_tensor_1d(kernel.detach().cpu())
-        wandb.log(
+        loggers.log(
+            run,
             {f"kernels/{name}.out_channel.{idx}": fig for idx, fig in enumerate(figs)},
             commit=False,
         )
@@ -102,96 +113,95 @@ def visualize_conv_kernel_out_hook(module, input, output, name):
 
 @torch.no_grad()
 def log_mask_params(module, input, output, name):
-    if wandb.run:
+    run = loggers.active_run()
+    if run:
+        # Move both parameters to the host at once
+        mean, variance = torch.stack(
+            [module.mask_mean_param.reshape(()), module.mask_width_param.reshape(())]
+        ).tolist()
         # Log
-        wandb.log(
-            {f"mask/{name}_mean": module.mask_mean_param.item()},
-            commit=False,
-        )
-        wandb.log(
-            {f"mask/{name}_variance": module.mask_width_param.item()},
+        loggers.log(
+            run,
+            {f"mask/{name}_mean": mean, f"mask/{name}_variance": variance},
             commit=False,
         )
 
 
-def get_statistics(tensor: torch.Tensor):
-    return (
-        tensor.max().item(),
-        tensor.mean().item(),
-        tensor.std().item(),
-        tensor.min().item(),
-        tensor.abs().max().item(),
-    )
+STATISTICS = ["max", "mean", "std", "min", "max_abs"]
+
+
+def get_statistics(tensors: dict, bins: int = 64) -> dict:
+    """Computes the statistics and a histogram of every tensor on its device, and moves
+    all of them to the host in a single transfer.
+
+    Args:
+        tensors (dict): name -> tensor
+        bins (int, optional): number of histogram bins. Defaults to 64.
+
+    Returns:
+        (dict): name -> (statistics, histogram), with statistics a dict with the
+            keys in `STATISTICS` and histogram a (counts, edges) tuple of numpy arrays
+    """
+    summaries = []
+    for tensor in tensors.values():
+        t = tensor.detach().flatten().float()
+        max, min = t.max(), t.min()
+        edges = min + (max - min) * torch.linspace(0, 1, bins + 1, device=t.device)
+        counts = torch.bincount(
+            torch.bucketize(t, edges[1:-1], right=True), minlength=bins
+        )
+        statistics = torch.stack([max, t.mean(), t.std(), min, t.abs().max()])
+        summaries.append(
+            torch.cat([statistics.double(), edges.double(), counts.double()])
+        )
+    if not summaries:
+        return {}
+    summaries = torch.stack(summaries).cpu().numpy()
+
+    no_statistics = len(STATISTICS)
+    results = {}
+    for name, summary in zip(tensors.keys(), summaries):
+        statistics = dict(zip(STATISTICS, summary[:no_statistics].tolist()))
+        edges = summary[no_statistics : no_statistics + bins + 1]
+        counts = summary[no_statistics + bins + 1 :]
+        results[name] = (statistics, (counts, edges))
+    return results
+
+
+def log_statistics(tensors: dict, prefix: str):
+    """Logs the statistics and histogram of every tensor to the active run, under
+    f"{prefix}/{name}_{statistic}" and f"{prefix}/{name}_histogram"."""
+    logs = {}
+    for name, (statistics, histogram) in get_statistics(tensors).items():
+        for statistic, value in statistics.items():
+            logs[f"{prefix}/{name}_{statistic}"] = value
+        logs[f"{prefix}/{name}_histogram"] = loggers.Histogram(*histogram)
+    loggers.log(loggers.active_run(), logs, commit=False)
 
 
 @torch.no_grad()
 def log_output_statistics(module, input, output, name):
-    if wandb.run:
-        # Calculate statistics
-        max, mean, std, min, max_abs = get_statistics(output)
-        # Log
-        for statistic in ["max", "mean", "std", "min", "max_abs"]:
-            wandb.log(
-                {f"outputs/{name}_{statistic}": eval(statistic)},
-                commit=False,
-            )
-        # Histogram
-        wandb.log(
-            {
-                f"outputs/{name}_histogram": wandb.Histogram(
-                    output.flatten().detach().to("cpu")
-                )
-            },
-            commit=False,
-        )
+    if loggers.active_run():
+        log_statistics({name: output}, prefix="outputs")
 
 
 @torch.no_grad()
 def log_parameter_statistics(module, input, output, name):
-
-    if wandb.run:
-        for parameter in ["weight", "bias"]:
-            # Calculate statistics
-            max, mean, std, min, max_abs = get_statistics(getattr(module, parameter))
-            # Log
-            for statistic in ["max", "mean", "std", "min", "max_abs"]:
-                wandb.log(
-                    {f"params/{name}_{parameter}_{statistic}": eval(statistic)},
-                    commit=False,
-                )
-            # Histogram
-            wandb.log(
-                {
-                    f"params/{name}_{parameter}_histogram": wandb.Histogram(
-                        module.weight.flatten().detach().to("cpu")
-                    )
-                },
-                commit=False,
-            )
+    if loggers.active_run():
+        parameters = {
+            f"{name}_{parameter}": getattr(module, parameter)
+            for parameter in ["weight", "bias"]
+            if getattr(module, parameter, None) is not None
+        }
+        log_statistics(parameters, prefix="params")
 
 
 @torch.no_grad()
 def log_ckernel_statistics(module, input, output, name):
     """Logs statistics of kernelnet output values (conv kernels)."""
-    if wandb.run:
-        kernel = module.conv_kernel
-        # Calculate statistics
-        max, mean, std, min, max_abs = get_statistics(kernel)
-        # Log
-        for statistic in ["max", "mean", "std", "min", "max_abs"]:
-            wandb.log(
-                {f"kernels/{name}_{statistic}": eval(statistic)},
-                commit=False,
-            )
-        # Histogram
-        wandb.log(
-            {
-                f"kernels/{name}_histogram": wandb.Histogram(
-                    kernel.flatten().detach().to("cpu")
-                )
-            },
-            commit=False,
-        )
+    if loggers.active_run():
+        kernel = module.sampled_kernel(input[0])
+        log_statistics({name: kernel}, prefix="kernels")
 
 
 def visualize_ckconv_out_hook(module, input, output, name):
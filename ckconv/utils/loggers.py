@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+import torch
+from pytorch_lightning.loggers.logger import Logger, rank_zero_experiment
+from pytorch_lightning.utilities import rank_zero_only
+
+# typing
+from omegaconf import OmegaConf
+from typing import Callable, Optional
+
+
+##############################
+# Backend-independent values #
+##############################
+class Histogram:
+    """A histogram of (counts, edges), as np.histogram returns."""
+
+    def __init__(self, counts, edges):
+        self.counts = np.asarray(counts)
+        self.edges = np.asarray(edges)
+
+    @classmethod
+    def from_values(cls, values, bins: int = 64):
+        return cls(*np.histogram(np.asarray(values), bins=bins))
+
+
+class Figure:
+    """A figure that is only rendered when, and if, a backend needs it. The local
+    backend can store the arguments instead, and render them later, see
+    `render_figures`.
+
+    Args:
+        render (Callable): a module-level function that returns a matplotlib or
+            plotly figure.
+        *args, **kwargs: the arguments of render.
+    """
+
+    def __init__(self, render: Callable, *args, **kwargs):
+        self.render_fn = render
+        self.args = args
+        self.kwargs = kwargs
+
+    def render(self):
+        return self.render_fn(*self.args, **self.kwargs)
+
+
+class Table:
+    def __init__(self, columns: list, data: list):
+        self.columns = list(columns)
+        self.data = [list(row) for row in data]
+
+
+def to_wandb(value):
+    """Converts the values above to their wandb counterpart."""
+    import wandb
+
+    if isinstance(value, Histogram):
+        return wandb.Histogram(np_histogram=(value.counts, value.edges))
+    elif isinstance(value, Figure):
+        return wandb.Image(value.render())
+    elif isinstance(value, Table):
+        return wandb.Table(columns=value.columns, data=value.data)
+    return value
+
+
+def active_run():
+    """The run that module hooks log to: the active LocalRun, otherwise the active
+    wandb run, or None. wandb is not imported if it is not in use."""
+    if LocalRun.current is not None:
+        return LocalRun.current
+    wandb = sys.modules.get("wandb")
+    return wandb.run if wandb is not None else None
+
+
+def log(run, values: dict, commit: bool = True):
+    """Logs values to a LocalRun or a wandb run, converting Histograms, Figures and
+    Tables for the latter."""
+    if isinstance(run, LocalRun):
+        run.log(values, commit=commit)
+    else:
+        run.log({k: to_wandb(v) for k, v in values.items()}, commit=commit)
+
+
+#################
+# Local backend #
+#################
+def _filename(key: str) -> str:
+    return key.replace("/", ".")
+
+
+class LocalRun:
+    """The experiment of a LocalLogger. Mirrors the parts of a wandb run that are
+    used in this repository: `log`, `summary`, `config`, `name` and `finish`.
+
+    Scalars are appended, as "step,value" lines, to one csv file per key in
+    `scalars/`. Histograms are written as npz files and tables as csv files, one
+    per step. Figures are rendered to png (matplotlib) or html (plotly), or, with
+    defer_figures, their render function and arguments are pickled, to be rendered
+    later with `render_figures`.
+    """
+
+    current = None
+
+    def __init__(self, directory: str, name: str, defer_figures: bool = True):
+        self.directory = directory
+        self.name = name
+        self.offline = True
+        self.defer_figures = defer_figures
+        self.summary = {}
+        self.config = {}
+        self.step = 0
+        self._scalar_files = {}
+        os.makedirs(os.path.join(directory, "scalars"), exist_ok=True)
+        LocalRun.current = self
+
+    def _scalar_file(self, key: str):
+        if key not in self._scalar_files:
+            path = os.path.join(self.directory, "scalars", f"{_filename(key)}.csv")
+            self._scalar_files[key] = open(path, "a", buffering=1 << 16)
+        return self._scalar_files[key]
+
+    def _path(self, kind: str, key: str, suffix: str) -> str:
+        directory = os.path.join(self.directory, kind, _filename(key))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{self.step:08d}{suffix}")
+
+    def log(self, values: dict, step: Optional[int] = None, commit: bool = True):
+        if step is not None:
+            self.step = step
+        for key, value in values.items():
+            if isinstance(value, torch.Tensor) and value.numel() == 1:
+                value = value.item()
+            if isinstance(value, (int, float, np.number)):
+                self._scalar_file(key).write(f"{self.step},{value}\n")
+            elif isinstance(value, Histogram):
+                path = self._path("histograms", key, ".npz")
+                np.savez(path, counts=value.counts, edges=value.edges)
+            elif isinstance(value, Table):
+                path = self._path("tables", key, ".csv")
+                with open(path, "w") as f:
+                    f.write(",".join(value.columns) + "\n")
+                    f.writelines(",".join(map(str, row)) + "\n" for row in value.data)
+            elif isinstance(value, Figure) and self.defer_figures:
+                with open(self._path("figures", key, ".pkl"), "wb") as f:
+                    pickle.dump(value, f)
+            else:
+                self._save_figure(key, value)
+        if commit:
+            self.step += 1
+
+    def _save_figure(self, key: str, figure):
+        if isinstance(figure, Figure):
+            figure = figure.render()
+        if hasattr(figure, "savefig"):
+            figure.savefig(self._path("figures", key, ".png"))
+            import matplotlib.pyplot as plt
+
+            plt.close(figure)
+        elif hasattr(figure, "write_html"):
+            figure.write_html(self._path("figures", key, ".html"))
+        else:
+            with open(self._path("objects", key, ".pkl"), "wb") as f:
+                pickle.dump(figure, f)
+
+    def flush(self):
+        for f in self._scalar_files.values():
+            f.flush()
+        with open(os.path.join(self.directory, "summary.json"), "w") as f:
+            json.dump(self.summary, f, indent=2, default=str)
+
+    def finish(self):
+        self.flush()
+        for f in self._scalar_files.values():
+            f.close()
+        self._scalar_files = {}
+        if LocalRun.current is self:
+            LocalRun.current = None
+
+
+class LocalLogger(Logger):
+    """A Lightning logger that writes append-only logs to the local disk, see
+    LocalRun. Metrics logged with `self.log` of a LightningModule end up in the same
+    scalar files as the values logged to `logger.experiment`.
+
+    Args:
+        save_dir (str): directory of the runs.
+        name (str, optional): name of the run. Defaults to a timestamp.
+        defer_figures (bool, optional): store the arguments of Figures instead of
+            rendering them. Defaults to True.
+    """
+
+    def __init__(
+        self, save_dir: str, name: Optional[str] = None, defer_figures: bool = True
+    ):
+        super().__init__()
+        self._save_dir = save_dir
+        self._name = name or time.strftime("run-%Y%m%d-%H%M%S")
+        self.defer_figures = defer_figures
+        self._experiment = None
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def version(self) -> str:
+        return ""
+
+    @property
+    def save_dir(self) -> str:
+        return self._save_dir
+
+    @property
+    def log_dir(self) -> str:
+        return os.path.join(self._save_dir, self._name)
+
+    @property
+    @rank_zero_experiment
+    def experiment(self) -> LocalRun:
+        if self._experiment is None:
+            self._experiment = LocalRun(self.log_dir, self._name, self.defer_figures)
+        return self._experiment
+
+    @rank_zero_only
+    def log_hyperparams(self, params, *args, **kwargs):
+        if isinstance(params, argparse.Namespace):
+            params = vars(params)
+        params = {
+            k: OmegaConf.to_container(v, resolve=True) if OmegaConf.is_config(v) else v
+            for k, v in dict(params).items()
+        }
+        self.experiment.config.update(params)
+        with open(os.path.join(self.log_dir, "config.json"), "w") as f:
+            json.dump(self.experiment.config, f, indent=2, default=str)
+
+    @rank_zero_only
+    def log_metrics(self, metrics: dict, step: Optional[int] = None):
+        # Lightning metrics are logged at the global step, without advancing it
+        self.experiment.log(metrics, step=step, commit=False)
+
+    @rank_zero_only
+    def save(self):
+        if self._experiment is not None:
+            self._experiment.flush()
+
+    @rank_zero_only
+    def finalize(self, status: str):
+        # Called after every fit, validate and test, the run stays open
+        if self._experiment is not None:
+            self._experiment.flush()
+
+
+def render_figures(directory: str):
+    """Renders the deferred figures of a LocalRun directory next to their pickles."""
+    figures_dir = os.path.join(directory, "figures")
+    for root, _, files in os.walk(figures_dir):
+        for file in sorted(files):
+            if not file.endswith(".pkl"):
+                continue
+            path = os.path.join(root, file)
+            with open(path, "rb") as f:
+                figure = pickle.load(f).render()
+            if hasattr(figure, "savefig"):
+                figure.savefig(path[: -len(".pkl")] + ".png")
+                import matplotlib.pyplot as plt
+
+                plt.close(figure)
+            else:
+                figure.write_html(path[: -len(".pkl")] + ".html")
+
+
+if __name__ == "__main__":
+    # python -m ckconv.utils.loggers <run directory>
+    render_figures(sys.argv[1])
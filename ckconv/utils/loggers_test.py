@@ -0,0 +1,66 @@
+from . import loggers
+import numpy as np
+import os
+
+
+def plot_values(values):
+    from matplotlib.figure import Figure
+
+    figure = Figure()
+    figure.add_subplot().plot(values)
+    return figure
+
+
+def test_local_logger(tmp_path):
+    logger = loggers.LocalLogger(str(tmp_path), name="run")
+    run = logger.experiment
+    try:
+        assert loggers.active_run() is run
+        for step in range(3):
+            # As Lightning does for self.log, at the global step
+            logger.log_metrics({"train/loss": float(step)}, step=step)
+            # As the hooks do through logger.experiment
+            loggers.log(
+                run,
+                {
+                    "train/loss": 10.0 + step,
+                    "weights": loggers.Histogram.from_values(np.arange(10), bins=5),
+                },
+            )
+        loggers.log(
+            run,
+            {
+                "predictions": loggers.Table(["shot", "score"], [[1, 0.5], [2, 0.25]]),
+                "plot": loggers.Figure(plot_values, [1.0, 3.0, 2.0]),
+            },
+        )
+        logger.save()
+
+        with open(os.path.join(tmp_path, "run", "scalars", "train.loss.csv")) as f:
+            rows = [line.strip().split(",") for line in f]
+        # Both end up in the same file, at the step they were logged at
+        assert [(int(s), float(v)) for s, v in rows] == [
+            (0, 0.0),
+            (0, 10.0),
+            (1, 1.0),
+            (1, 11.0),
+            (2, 2.0),
+            (2, 12.0),
+        ]
+
+        histograms = os.path.join(tmp_path, "run", "histograms", "weights")
+        assert sorted(os.listdir(histograms)) == [f"{i:08d}.npz" for i in range(3)]
+        histogram = np.load(os.path.join(histograms, "00000002.npz"))
+        assert histogram["counts"].tolist() == [2, 2, 2, 2, 2]
+        assert len(histogram["edges"]) == 6
+        table = os.path.join(tmp_path, "run", "tables", "predictions", "00000003.csv")
+        with open(table) as f:
+            assert f.read() == "shot,score\n1,0.5\n2,0.25\n"
+
+        figures = os.path.join(tmp_path, "run", "figures", "plot")
+        assert os.listdir(figures) == ["00000003.pkl"]
+        loggers.render_figures(os.path.join(tmp_path, "run"))
+        assert os.path.exists(os.path.join(figures, "00000003.png"))
+    finally:
+        run.finish()
+    assert loggers.active_run() is not run
@@ -0,0 +1,217 @@
+import collections
+import os
+import time
+
+import torch
+from torch.profiler import record_function
+
+from ckconv.utils.flops import module_flops
+
+
+class _Frame:
+    """Bookkeeping of one module call that is in progress."""
+
+    def __init__(self, name, start, base_memory, record):
+        self.name = name
+        self.start = start
+        self.base_memory = base_memory
+        self.peak_memory = base_memory
+        self.record = record
+
+
+class ModuleProfiler:
+    """Records the forward and backward wall time, estimated FLOPs and memory of a
+    set of modules.
+
+    Hooks are only attached between `start` and `stop`, so modules are not slowed
+    down outside of a profiling window. Every module call is also wrapped in a
+    `torch.profiler.record_function` range named after the module, so that the
+    layers show up in the Chrome trace written by `stop` if `trace_dir` is given.
+
+    Memory is reported as the size of the output activations of a module and, on
+    CUDA, as the peak allocated memory during its forward pass relative to the
+    memory allocated when it started.
+
+    Args:
+        named_modules (list): list of (name, module) tuples to profile.
+        trace_dir (str, optional): directory to write Chrome traces to. No trace is
+            recorded if None. Defaults to None.
+    """
+
+    COLUMNS = [
+        "name",
+        "type",
+        "calls",
+        "fwd_ms",
+        "bwd_ms",
+        "gflops",
+        "activations_mb",
+        "peak_mb",
+    ]
+
+    def __init__(self, named_modules: list, trace_dir: str = None):
+        self.named_modules = list(named_modules)
+        self.trace_dir = trace_dir
+        self.handles = []
+        self.profiler = None
+        self._stack = []
+        self._backward_starts = {}
+        self.reset()
+
+    def reset(self):
+        self.stats = collections.defaultdict(
+            lambda: {
+                "calls": 0,
+                "fwd_time": 0.0,
+                "bwd_calls": 0,
+                "bwd_time": 0.0,
+                "flops": 0.0,
+                "activations": 0,
+                "peak": 0,
+            }
+        )
+
+    @property
+    def active(self) -> bool:
+        return len(self.handles) > 0
+
+    def start(self):
+        """Attach the hooks and, if requested, start recording a Chrome trace."""
+        if self.active:
+            return
+        for name, module in self.named_modules:
+            self.handles += [
+                module.register_forward_pre_hook(self._forward_pre_hook(name)),
+                module.register_forward_hook(self._forward_hook(name)),
+                module.register_full_backward_pre_hook(self._backward_pre_hook(name)),
+                module.register_full_backward_hook(self._backward_hook(name)),
+            ]
+        if self.trace_dir is not None:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profiler = torch.profiler.profile(
+                activities=activities, record_shapes=True, profile_memory=True
+            )
+            self.profiler.__enter__()
+
+    def stop(self, tag: str = ""):
+        """Remove the hooks and write the Chrome trace, if one was recorded.
+
+        Returns:
+            (str): path of the Chrome trace, or None
+        """
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+        self._stack = []
+        self._backward_starts = {}
+        trace_path = None
+        if self.profiler is not None:
+            self.profiler.__exit__(None, None, None)
+            os.makedirs(self.trace_dir, exist_ok=True)
+            trace_path = os.path.join(self.trace_dir, f"trace{tag}.json")
+            self.profiler.export_chrome_trace(trace_path)
+            self.profiler = None
+        return trace_path
+
+    def table(self) -> list:
+        """Returns the aggregated statistics as a list of rows, one per module, with
+        the values of `ModuleProfiler.COLUMNS`. Times and FLOPs are per call."""
+        rows = []
+        types = {name: type(module).__name__ for name, module in self.named_modules}
+        for name, s in self.stats.items():
+            calls = max(s["calls"], 1)
+            rows.append(
+                [
+                    name,
+                    types[name],
+                    s["calls"],
+                    1000.0 * s["fwd_time"] / calls,
+                    1000.0 * s["bwd_time"] / max(s["bwd_calls"], 1),
+                    s["flops"] / calls / 1e9,
+                    s["activations"] / 2**20,
+                    s["peak"] / 2**20,
+                ]
+            )
+        return rows
+
+    def format_table(self) -> str:
+        widths = [max(len(name) for name, _ in self.named_modules) + 2, 20] + [12] * 6
+        lines = ["".join(c.ljust(w) for c, w in zip(self.COLUMNS, widths))]
+        for row in self.table():
+            cells = [row[0], row[1], str(row[2])] + [f"{v:.3f}" for v in row[3:]]
+            lines.append("".join(c.ljust(w) for c, w in zip(cells, widths)))
+        return "\n".join(lines)
+
+    # Hooks
+    # -----
+    @staticmethod
+    def _now(device=None):
+        if device is not None and device.type == "cuda":
+            torch.cuda.synchronize(device)
+        return time.perf_counter()
+
+    def _forward_pre_hook(self, name):
+        def hook(module, inputs):
+            device = _device_of(inputs)
+            on_cuda = device is not None and device.type == "cuda"
+            base_memory = torch.cuda.memory_allocated(device) if on_cuda else 0
+            if on_cuda:
+                # Fold the peak so far into the calls in progress before resetting it
+                peak = torch.cuda.max_memory_allocated(device)
+                for frame in self._stack:
+                    frame.peak_memory = max(frame.peak_memory, peak)
+                torch.cuda.reset_peak_memory_stats(device)
+            record = record_function(name)
+            record.__enter__()
+            self._stack.append(_Frame(name, self._now(device), base_memory, record))
+
+        return hook
+
+    def _forward_hook(self, name):
+        def hook(module, inputs, output):
+            device = _device_of(inputs)
+            end = self._now(device)
+            frame = self._stack.pop()
+            frame.record.__exit__(None, None, None)
+            s = self.stats[name]
+            s["calls"] += 1
+            s["fwd_time"] += end - frame.start
+            s["flops"] += module_flops(module, inputs, output)
+            if isinstance(output, torch.Tensor):
+                s["activations"] = max(
+                    s["activations"], output.numel() * output.element_size()
+                )
+            if device is not None and device.type == "cuda":
+                peak = torch.cuda.max_memory_allocated(device)
+                frame.peak_memory = max(frame.peak_memory, peak)
+                for parent in self._stack:
+                    parent.peak_memory = max(parent.peak_memory, peak)
+                s["peak"] = max(s["peak"], frame.peak_memory - frame.base_memory)
+
+        return hook
+
+    def _backward_pre_hook(self, name):
+        def hook(module, grad_output):
+            device = _device_of(grad_output)
+            self._backward_starts[name] = self._now(device)
+
+        return hook
+
+    def _backward_hook(self, name):
+        def hook(module, grad_input, grad_output):
+            start = self._backward_starts.pop(name, None)
+            if start is not None:
+                s = self.stats[name]
+                s["bwd_calls"] += 1
+                s["bwd_time"] += self._now(_device_of(grad_output)) - start
+
+        return hook
+
+
+def _device_of(tensors):
+    for t in tensors:
+        if isinstance(t, torch.Tensor):
+            return t.device
+    return None
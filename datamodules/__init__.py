@@ -1,9 +1,31 @@
-from .mnist import MNISTDataModule
-from .cifar10 import CIFAR10DataModule
-from .cifar100 import CIFAR100DataModule
-from .stl10 import STL10DataModule
-from .pathfinder import PathFinderDataModule
-from .imdb import IMDBDataModule
-from .listops import ListOpsDataModule
-from .modelnet import ModelNetDataModule
-from .lucas import LucasDataModule
+import importlib
+
+# Datamodules are imported on first access, e.g., `getattr(datamodules, name)` in
+# `construct_datamodule`, so that a run only imports the dependencies of its own
+# dataset (torchvision, torchtext, torch_geometric, ...).
+_REGISTRY = {
+    "MNISTDataModule": ".mnist",
+    "CIFAR10DataModule": ".cifar10",
+    "CIFAR100DataModule": ".cifar100",
+    "STL10DataModule": ".stl10",
+    "PathFinderDataModule": ".pathfinder",
+    "IMDBDataModule": ".imdb",
+    "ListOpsDataModule": ".listops",
+    "ModelNetDataModule": ".modelnet",
+    "LucasDataModule": ".lucas",
+    "LucasEnsembleDataModule": ".lucas",
+}
+
+__all__ = list(_REGISTRY)
+
+
+def __getattr__(name):
+    if name not in _REGISTRY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_REGISTRY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
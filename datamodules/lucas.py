@@ -1,13 +1,14 @@
-from typing import Optional
+from typing import List, Optional
 import pytorch_lightning as pl
 from pytorch_lightning.utilities.types import EVAL_DATALOADERS, TRAIN_DATALOADERS
 from . import lucas_processing
 import pickle
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Dataset
 import torch
 from torch import Generator
 import requests
 import gzip
+import copy
 from tqdm import tqdm
 import os
 
@@ -78,6 +79,7 @@ class LucasDataModule(pl.LightningDataModule):
         self.debug = debug
         self.seed = seed
         self.taus = taus
+        self.collate_fn = collate_fn
 
         if data_type != "default" and data_type != "sequence":
             raise ValueError(f"data_type {data_type} not supported.")
@@ -148,8 +150,11 @@ class LucasDataModule(pl.LightningDataModule):
         assert len(set(train_inds)) == len(train_inds)
         assert len(set(test_inds)) == len(test_inds)
 
-        val_shots = [data[i] for i in train_inds[:n_val]]
-        train_shots = [data[i] for i in train_inds[n_val:]]
+        val_inds = train_inds[:n_val]
+        train_inds = train_inds[n_val:]
+
+        val_shots = [data[i] for i in val_inds]
+        train_shots = [data[i] for i in train_inds]
         test_shots = [data[i] for i in test_inds]
 
         self.train_dataset = lucas_processing.ModelReadyDataset(
@@ -164,7 +169,7 @@ class LucasDataModule(pl.LightningDataModule):
         )
         self.val_dataset = lucas_processing.ModelReadyDataset(
             shots=val_shots,
-            inds=train_inds,
+            inds=val_inds,
             machine_hyperparameters=self.machine_hyperparameters,
             end_cutoff=self.end_cutoff,
             end_cutoff_timesteps=self.end_cutoff_timesteps,
@@ -192,7 +197,7 @@ class LucasDataModule(pl.LightningDataModule):
             shuffle=True,
             pin_memory=self.pin_memory,
             num_workers=self.num_workers,
-            collate_fn=collate_fn,
+            collate_fn=self.collate_fn,
         )
         return dl
 
@@ -202,7 +207,7 @@ class LucasDataModule(pl.LightningDataModule):
             self.batch_size,
             pin_memory=self.pin_memory,
             num_workers=self.num_workers,
-            collate_fn=collate_fn,
+            collate_fn=self.collate_fn,
         )
         return dl
 
@@ -212,7 +217,7 @@ class LucasDataModule(pl.LightningDataModule):
             self.batch_size,
             pin_memory=self.pin_memory,
             num_workers=self.num_workers,
-            collate_fn=collate_fn,
+            collate_fn=self.collate_fn,
         )
         return dl
 
@@ -222,5 +227,131 @@ class LucasDataModule(pl.LightningDataModule):
             self.batch_size,
             pin_memory=self.pin_memory,
             num_workers=self.num_workers,
-            collate_fn=collate_fn,
+            collate_fn=self.collate_fn,
+        )
+
+
+def ensemble_collate_fn(batch):
+    *batch, positions = zip(*batch)
+    inputs, labels, lengths = collate_fn(list(zip(*batch)))
+    return inputs, labels, lengths, torch.tensor(positions)
+
+
+class IndexedDataset(Dataset):
+    """The shots of a dataset at the given positions, returned together with their
+    position in the dataset."""
+
+    def __init__(self, dataset: Dataset, positions: List[int]):
+        self.dataset = dataset
+        self.positions = positions
+        self.metas = [dataset.metas[p] for p in positions]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, idx):
+        position = self.positions[idx]
+        return (*self.dataset[position], position)
+
+
+class LucasEnsembleDataModule(LucasDataModule):
+    """
+    DataModule for training an ensemble of models on Lucas' fusion dataset, one per
+    combination of case_number, new_machine and seed in `members`.
+
+    All shots used by any member are loaded once, unscaled, and every member keeps
+    boolean masks over them for its train, val and test splits, together with the
+    center and scale of its own robust scaler. Batches hold
+    (inputs, labels, lengths, positions), the positions index the masks. The
+    scaling is applied by the model, see `models.ensemble.EnsembleNetwork`.
+    """
+
+    SPLITS = ["train", "val", "test"]
+
+    def __init__(self, members: List[dict], **kwargs):
+        super().__init__(**kwargs)
+        if len(members) == 0:
+            raise ValueError("An ensemble requires at least one member.")
+        self.members = [
+            {
+                "case_number": member.get("case_number", self.case_number),
+                "new_machine": member.get("new_machine", self.new_machine),
+                "seed": member.get("seed", self.seed),
+            }
+            for member in members
+        ]
+        self.member_names = [
+            f"case{m['case_number']}_{m['new_machine']}_seed{m['seed']}"
+            for m in self.members
+        ]
+        self.collate_fn = ensemble_collate_fn
+
+    def _member_splits(self, data: dict, member: dict) -> dict:
+        # Same splits as LucasDataModule.setup
+        (
+            train_inds,
+            test_inds,
+        ) = lucas_processing.get_train_test_indices_from_Jinxiang_cases(
+            dataset=data,
+            case_number=member["case_number"],
+            new_machine=member["new_machine"],
+            seed=member["seed"],
         )
+        if self.debug:
+            train_inds = train_inds[:80]
+            test_inds = test_inds[:20]
+        n_val = int(round(len(train_inds) * self.val_percent))
+        return {
+            "train": train_inds[n_val:],
+            "val": train_inds[:n_val],
+            "test": test_inds,
+        }
+
+    def setup(self, stage=None):
+        # Load data from file
+        with open(os.path.join(self.data_dir, self.DATA_FILENAME), "rb") as f:
+            data = pickle.load(f)
+
+        splits = [self._member_splits(data, member) for member in self.members]
+        inds = sorted(set().union(*(s[split] for s in splits for split in s)))
+        self.dataset = lucas_processing.ModelReadyDataset(
+            shots=[data[i] for i in inds],
+            inds=inds,
+            machine_hyperparameters=self.machine_hyperparameters,
+            end_cutoff=self.end_cutoff,
+            end_cutoff_timesteps=self.end_cutoff_timesteps,
+            taus=self.taus,
+            len_aug=self.augment,
+            len_aug_args=self.len_aug_args,
+        )
+        # Evaluation shares the shots, without length augmentation
+        eval_dataset = copy.copy(self.dataset)
+        eval_dataset.len_aug = False
+
+        # Shots outside of the length limits of ModelReadyDataset are dropped
+        position = {meta["ind"]: p for p, meta in enumerate(self.dataset.metas)}
+        self.masks = {
+            split: torch.zeros(len(self.members), len(self.dataset), dtype=torch.bool)
+            for split in self.SPLITS
+        }
+        for m, member_splits in enumerate(splits):
+            for split, split_inds in member_splits.items():
+                rows = [position[i] for i in split_inds if i in position]
+                self.masks[split][m, rows] = True
+
+        # Robust scaler of every member, fit to its own training shots
+        centers, scales = [], []
+        for train_mask in self.masks["train"]:
+            positions = train_mask.nonzero()[:, 0].tolist()
+            scaler = self.dataset.fit_robust_scaler(positions)
+            centers.append(torch.as_tensor(scaler.center_, dtype=torch.float32))
+            scales.append(torch.as_tensor(scaler.scale_, dtype=torch.float32))
+        self.scaler_center = torch.stack(centers)
+        self.scaler_scale = torch.stack(scales)
+
+        def used(split):
+            return self.masks[split].any(0).nonzero()[:, 0].tolist()
+
+        self.train_dataset = IndexedDataset(self.dataset, used("train"))
+        self.val_dataset = IndexedDataset(eval_dataset, used("val"))
+        self.test_dataset = IndexedDataset(eval_dataset, used("test"))
@@ -83,9 +83,7 @@ class ModelReadyDataset(Dataset):
         Returns:
             scaler (object): Scaler used to scale the data."""
 
-        scaler = RobustScaler()
-        combined = torch.cat(self.xs)
-        scaler.fit(combined)
+        scaler = self.fit_robust_scaler()
         for i in range(len(self.xs)):
             self.xs[i] = torch.from_numpy(
                 scaler.transform(self.xs[i]).astype("float32")
@@ -93,6 +91,22 @@ class ModelReadyDataset(Dataset):
 
         return scaler
 
+    def fit_robust_scaler(self, positions: List = None):
+        """Fit a robust scaler to the data, without scaling it.
+
+        Args:
+            positions (list, optional): Positions of the shots to fit to. Defaults
+                to all shots.
+
+        Returns:
+            scaler (object): The fitted scaler."""
+
+        if positions is None:
+            positions = range(len(self.xs))
+        scaler = RobustScaler()
+        scaler.fit(torch.cat([self.xs[i] for i in positions]))
+        return scaler
+
     def robustly_scale_with_another_scaler(self, scaler):
         """Robustly scale the data with another scaler.
 
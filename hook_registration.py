@@ -5,6 +5,12 @@ import pytorch_lightning as pl
 import ckconv
 import models
 import torch
+from ckconv.utils import loggers
+from ckconv.utils.profiling import ModuleProfiler
+
+# built-in
+import csv
+import os
 
 # typing
 from omegaconf import OmegaConf
@@ -13,16 +19,25 @@ from functools import partial
 
 
 class HookTriggerCallback(pl.callbacks.Callback):
-    def __init__(self, registered_hook, triggers, timeout=1, log_output=False):
+    def __init__(
+        self, registered_hook, module, hook_type, triggers, timeout=1, log_output=False
+    ):
         """We want to control how often a hook is triggered through pl callbacks. This class is implemented as a pl
         callback, where each callback function specified in 'triggers' serves as a one-time trigger for the forward
         hook.
 
+        The hook is only attached to the module when a trigger opens it, and removed again as soon as it has fired.
+        In between, the module runs without any hook overhead.
+
         :param registered_hook: The forward hook, a function of the form;
             ''' def forward_hook(module: torch.nn.Module, input: torch.tensor, output: torch.tensor, name: str):
                     ...
             '''
 
+        :param module: The module to attach the hook to.
+
+        :param hook_type: Either 'forward' or 'backward'.
+
         :param triggers: List of pl callback functions to serve as one-time trigger, e.g.
             ['on_train_batch_start', 'on_epoch_end']
 
@@ -31,7 +46,8 @@ class HookTriggerCallback(pl.callbacks.Callback):
         :param log_output: Whether or not to log the hook output locally. @todo implement this.
         """
         self.registered_hook = registered_hook
-        self.opened = False
+        self.module = module
+        self.hook_type = hook_type
         self.handle = None
 
         # We may only want to open the hook once every n times the trigger has been activated.
@@ -39,12 +55,16 @@ class HookTriggerCallback(pl.callbacks.Callback):
         self.timeout = timeout
 
         # register hook triggers, these are pl callback functions e.g. 'on_train_batch_start',
-        # we overwrite these functions with a lambda function opening the hook.
+        # we overwrite these functions with a function opening the hook.
         for trigger in triggers:
-            setattr(self, trigger, lambda *args: self.open(trigger))
+            setattr(self, trigger, partial(self.open, trigger))
             setattr(self, trigger + "_counter", 0)
 
-    def open(self, trigger):
+    @property
+    def opened(self):
+        return self.handle is not None
+
+    def open(self, trigger, *args):
         """Check whether we need to open the hook for this trigger.
 
         :param trigger: Function name that served as trigger for this function call.
@@ -54,24 +74,26 @@ class HookTriggerCallback(pl.callbacks.Callback):
         trigger_counter = getattr(self, trigger + "_counter")
 
         # Check whether we want the hook to open based on the timeout of this hook.
-        if not trigger_counter % self.timeout:
-            self.opened = True
+        if not trigger_counter % self.timeout and not self.opened:
+            if self.hook_type == "forward":
+                self.handle = self.module.register_forward_hook(self)
+            elif self.hook_type == "backward":
+                self.handle = self.module.register_backward_hook(self)
 
         # Increment the counter.
         setattr(self, trigger + "_counter", trigger_counter + 1)
 
     def close(self):
-        self.opened = False
+        if self.handle is not None:
+            self.handle.remove()
+            self.handle = None
 
     def remove_hook(self):
-        self.handle.remove()
-
-    def add_handle(self, handle):
-        self.handle = handle
+        self.close()
 
     def __call__(self, module, input, output):
-        """Each forward pass through a module that this hook has been registered to will result in a call to this
-        function. We only want the hook to actually execute if a trigger (pl callback function) has been executed.
+        """Each forward pass through a module that this hook has been attached to results in a call to this
+        function. The hook detaches itself before executing, so it fires once per trigger.
         """
         if self.opened:
             self.close()
@@ -81,6 +103,78 @@ class HookTriggerCallback(pl.callbacks.Callback):
                 self.registered_hook(module, input, output)
 
 
+class ProfilerTriggerCallback(pl.callbacks.Callback):
+    def __init__(self, profiler, triggers, timeout=1, window=20, output_dir="."):
+        """Opens a profiling window of `window` training steps every time one of the
+        triggers fires. At the end of the window, the per-layer table of the profiler
+        is printed, written as csv to output_dir and logged to the active run.
+
+        :param profiler: The ModuleProfiler to start and stop.
+
+        :param triggers: List of pl callback functions that open the window, e.g.
+            ['on_train_epoch_start']
+
+        :param timeout: If this value is not 1 but for example 4, only open every 4th time.
+
+        :param window: Number of training steps to aggregate over.
+
+        :param output_dir: Directory to write the tables to.
+        """
+        self.profiler = profiler
+        self.window = window
+        self.output_dir = output_dir
+        self.remaining = 0
+
+        assert type(timeout) == int and timeout >= 1
+        self.timeout = timeout
+
+        for trigger in triggers:
+            setattr(self, trigger, partial(self.open, trigger))
+            setattr(self, trigger + "_counter", 0)
+
+    def open(self, trigger, *args):
+        trigger_counter = getattr(self, trigger + "_counter")
+        if not trigger_counter % self.timeout and not self.profiler.active:
+            self.remaining = self.window
+            self.profiler.start()
+        setattr(self, trigger + "_counter", trigger_counter + 1)
+
+    def on_train_batch_end(self, trainer, pl_module, *args):
+        if self.profiler.active:
+            self.remaining -= 1
+            if self.remaining <= 0:
+                self.close(trainer)
+
+    def on_train_epoch_end(self, trainer, pl_module):
+        # Don't let the window run into validation.
+        if self.profiler.active:
+            self.close(trainer)
+
+    def close(self, trainer):
+        tag = f"-step{trainer.global_step}"
+        trace_path = self.profiler.stop(tag)
+        print(f"Layer profile at step {trainer.global_step}:")
+        print(self.profiler.format_table())
+        if trace_path is not None:
+            print(f"Chrome trace written to {trace_path}")
+
+        rows = self.profiler.table()
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, f"profile{tag}.csv"), "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(ModuleProfiler.COLUMNS)
+            writer.writerows(rows)
+        run = loggers.active_run()
+        if run:
+            table = loggers.Table(columns=ModuleProfiler.COLUMNS, data=rows)
+            loggers.log(run, {"profile/layers": table}, commit=False)
+        self.profiler.reset()
+
+    def remove_hook(self):
+        if self.profiler.active:
+            self.profiler.stop()
+
+
 def register_hooks(
     cfg: OmegaConf,
     model: pl.LightningModule,
@@ -104,7 +198,7 @@ def register_hooks(
     # this removes any preexisting hooks
     if model.trainer:
         for callback in model.trainer.callbacks:
-            if isinstance(callback, HookTriggerCallback):
+            if isinstance(callback, (HookTriggerCallback, ProfilerTriggerCallback)):
                 callback.remove_hook()
 
     callbacks = []
@@ -116,8 +210,9 @@ def register_hooks(
         hook_limits = hook_cfg.limit_to
         hook_timeout = hook_cfg.timeout
 
-        # get the hook function
-        hook = getattr(ckconv.utils.hooks, hook_fn)
+        # get the hook function, profile hooks are handled by a ModuleProfiler
+        if hook_cfg.type != "profile":
+            hook = getattr(ckconv.utils.hooks, hook_fn)
 
         # get the module type to hook onto
         hook_onto = []
@@ -135,6 +230,33 @@ def register_hooks(
         else:
             named_modules = model.named_modules()
 
+        # profile hooks: a single profiler for all matching modules
+        if hook_cfg.type == "profile":
+            profiled = [
+                (name, module)
+                for name, module in named_modules
+                if any(isinstance(module, m) for m in hook_onto)
+            ]
+            if hook_limits == "first" or hook_limits == "last":
+                profiled = profiled[:1]
+            for name, _ in profiled:
+                print(f"Registering profile hook to '{name}'")
+            output_dir = hook_cfg.get("output_dir", "profiles")
+            profiler = ModuleProfiler(
+                profiled,
+                trace_dir=output_dir if hook_cfg.get("trace", True) else None,
+            )
+            callbacks.append(
+                ProfilerTriggerCallback(
+                    profiler,
+                    triggers=hook_triggers,
+                    timeout=hook_timeout,
+                    window=hook_cfg.get("window", 20),
+                    output_dir=output_dir,
+                )
+            )
+            continue
+
         for name, module in named_modules:
 
             # isinstance also recognises subclasses
@@ -143,22 +265,16 @@ def register_hooks(
                 # print hook info
                 print(f"Registering {hook_cfg.type} hook '{hook.__name__}' to '{name}'")
 
-                # for every registered forward hook, we create a corresponding pl callback class.
+                # for every hooked module, we create a corresponding pl callback class, which
+                # attaches the hook to the module when one of its triggers fires.
                 one_time_hook = HookTriggerCallback(
                     registered_hook=partial(hook, name=name),
+                    module=module,
+                    hook_type=hook_cfg.type,
                     triggers=hook_triggers,
                     timeout=hook_timeout,
                 )
 
-                # register the hook
-                if hook_cfg.type == "forward":
-                    h = module.register_forward_hook(one_time_hook)
-                elif hook_cfg.type == "backward":
-                    h = module.register_backward_hook(one_time_hook)
-
-                # save the handle
-                one_time_hook.add_handle(h)
-
                 # append to list of callbacks that will be merged with trainer callbacks
                 callbacks.append(one_time_hook)
 
@@ -3,15 +3,14 @@ import torch
 import pytorch_lightning as pl
 
 # Project
-import wandb
-
-import ckconv
 from dataset_constructor import construct_datamodule
 from model_constructor import construct_model
-from trainer_constructor import construct_trainer
+from trainer_constructor import construct_logger, construct_trainer
 
 from functools import partial
 from hook_registration import register_hooks
+from memory_probe import apply_memory_budget
+from models.checkpoint_io import load_checkpoint
 
 # Loggers
 from pytorch_lightning.loggers import WandbLogger
@@ -57,39 +56,40 @@ def main(
     # Construct model
     model = construct_model(cfg, datamodule)
 
-    # Initialize wandb logger
-    wandb_logger = WandbLogger(
-        save_dir=os.environ.get("WANDB_LOGGER_DIR", "."),
-        project=cfg.wandb.project,
-        entity=cfg.wandb.entity if cfg.wandb.entity != -1 else None,
-        config=ckconv.utils.flatten_configdict(cfg),
-        log_model=False
-        if cfg.offline
-        else "all",  # used to save models to wandb during training
-        offline=cfg.offline,
-        id=cfg.wandb.run_id if cfg.wandb.run_id != -1 else None,
-        save_code=False,
-    )
-    print(f"Wandb id is {wandb.run.id}")
+    # Fit the batch size to the memory budget, before the trainer is created
+    if cfg.train.memory_budget.enabled:
+        apply_memory_budget(cfg, model, datamodule)
+
+    # Initialize logger
+    logger = construct_logger(cfg)
+    use_wandb = isinstance(logger, WandbLogger)
+    if use_wandb:
+        print(f"Wandb id is {logger.experiment.id}")
+    else:
+        print(f"Logging to {os.path.abspath(logger.log_dir)}")
 
     # Before start training. Verify arguments in the cfg.
     verify_config(cfg)
 
     # Recreate the command that instantiated this run.
-    if isinstance(wandb_logger.experiment.settings, wandb.Settings):
-        args = wandb_logger.experiment.settings._args
-        command = " ".join(args)
+    if use_wandb:
+        # Only imported for wandb runs, logging.backend=local runs do without it
+        import wandb
 
-        # Log the command.
-        wandb_logger.experiment.config.update(
-            {"command": command}, allow_val_change=True
-        )
+        if isinstance(logger.experiment.settings, wandb.Settings):
+            args = logger.experiment.settings._args
+            command = " ".join(args)
+
+            # Log the command.
+            logger.experiment.config.update(
+                {"command": command}, allow_val_change=True
+            )
 
     # Print the cfg files prior to training
     print(f"Input arguments \n {OmegaConf.to_yaml(cfg)}")
 
     # Create trainer
-    trainer, checkpoint_callback = construct_trainer(cfg, wandb_logger)
+    trainer, checkpoint_callback = construct_trainer(cfg, logger)
 
     # Load checkpoint
     if cfg.pretrained.load:
@@ -128,11 +128,11 @@ def main(
         else:
             # Load from wand checkpoint
             resume_ckpt = None
-            if cfg.train.resume_wandb and not cfg.offline:
+            if use_wandb and cfg.train.resume_wandb and not cfg.offline:
                 wb = cfg.wandb
                 checkpoint_ref = f"model-{wb.run_id}:{cfg.train.resume_wandb}"
                 try:
-                    artifact_dir = wandb_logger.download_artifact(
+                    artifact_dir = logger.download_artifact(
                         checkpoint_ref, artifact_type="model"
                     )
                     resume_ckpt = str(Path(artifact_dir) / "model.ckpt")
@@ -147,7 +147,7 @@ def main(
 
         # Load state dict from best performing model
         model.load_state_dict(
-            torch.load(checkpoint_callback.best_model_path)["state_dict"],
+            load_checkpoint(checkpoint_callback.best_model_path)["state_dict"],
         )
 
     # Validate and test before finishing
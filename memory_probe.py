@@ -0,0 +1,178 @@
+# torch
+import torch
+import torch.multiprocessing
+
+# built-in
+import copy
+import math
+import os
+import resource
+
+# typing
+from omegaconf import OmegaConf
+import pytorch_lightning as pl
+
+
+def available_memory(device: str) -> int:
+    """Total memory of the device in bytes; physical RAM for the cpu."""
+    if device == "cuda":
+        return torch.cuda.get_device_properties(0).total_memory
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def synthetic_batch(batch_size: int, in_channels: int, length: int):
+    """A batch in the format of the Lucas `collate_fn`, with every sequence at the
+    given length."""
+    x = torch.randn(batch_size, in_channels, length)
+    labels = torch.randint(0, 2, (batch_size, 1)).float()
+    lens = (length,) * batch_size
+    return x, labels, lens
+
+
+def _training_step(model: pl.LightningModule, batch) -> None:
+    """Forward, backward and optimizer step, so that gradients and optimizer state
+    are included in the peak."""
+    optimizer = model.configure_optimizers()["optimizer"]
+    loss = model.training_step(batch, 0)["loss"]
+    loss.backward()
+    optimizer.step()
+
+
+def _cpu_peak(model, batch, connection):
+    try:
+        _training_step(model, batch)
+        # ru_maxrss is in kilobytes on Linux
+        connection.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+    except RuntimeError:
+        # Allocation failures
+        connection.send(None)
+    connection.close()
+
+
+def peak_memory(
+    model: pl.LightningModule,
+    batch_size: int,
+    length: int,
+    device: str,
+) -> float:
+    """Peak memory in bytes of one training step on a synthetic batch, or inf if the
+    step runs out of memory.
+
+    On the cpu, the step runs in a forked process and the peak is its maximum
+    resident set size, which includes everything this process holds (model,
+    dataset, ...). On cuda, it is the peak allocated memory of a copy of the model.
+    The model itself is never modified.
+    """
+    batch = synthetic_batch(batch_size, model.network.conv1.in_channels, length)
+    if device == "cuda":
+        model = copy.deepcopy(model).cuda()
+        batch = (batch[0].cuda(), batch[1].cuda(), batch[2])
+        torch.cuda.empty_cache()
+        torch.cuda.reset_peak_memory_stats()
+        try:
+            _training_step(model, batch)
+            torch.cuda.synchronize()
+            return torch.cuda.max_memory_allocated()
+        except torch.cuda.OutOfMemoryError:
+            return math.inf
+        finally:
+            del model, batch
+            torch.cuda.empty_cache()
+
+    ctx = torch.multiprocessing.get_context("fork")
+    receiver, sender = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_cpu_peak, args=(model, batch, sender))
+    process.start()
+    sender.close()
+    try:
+        peak = receiver.recv()
+    except EOFError:
+        # The process was killed, e.g. by the OOM killer
+        peak = None
+    process.join()
+    return math.inf if peak is None else peak
+
+
+def find_max_batch_size(
+    model: pl.LightningModule,
+    length: int,
+    budget: float,
+    device: str,
+    max_batch_size: int = 1024,
+) -> int:
+    """Largest batch of sequences of the given length whose training step stays
+    within the memory budget (in bytes). Grows the batch exponentially until it no
+    longer fits, then binary-searches between the last two sizes.
+
+    Returns:
+        (int): the batch size, or 0 if not even a single sequence fits
+    """
+
+    def fits(batch_size):
+        peak = peak_memory(model, batch_size, length, device)
+        print(f"Batch size {batch_size} x {length}: peak {peak / 2**30:.2f} GB")
+        return peak <= budget
+
+    low, high = 0, 1
+    while high <= max_batch_size and fits(high):
+        low, high = high, 2 * high
+    high = min(high, max_batch_size + 1)
+    # low fits, high does not
+    while high - low > 1:
+        middle = (low + high) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def apply_memory_budget(
+    cfg: OmegaConf,
+    model: pl.LightningModule,
+    datamodule: pl.LightningDataModule,
+):
+    """Finds the largest batch of worst-case length that fits `train.memory_budget`
+    and, if `train.batch_size` does not fit, splits it into gradient accumulation
+    steps. Updates `train.accumulate_grad_steps` and the batch size of the
+    datamodule; the effective batch size stays `train.batch_size`.
+
+    Must be called before `construct_trainer`.
+    """
+    budget_cfg = cfg.train.memory_budget
+    limit = budget_cfg.limit_gb * 2**30
+    if limit <= 0:
+        limit = available_memory(cfg.device)
+    budget = (1.0 - budget_cfg.margin) * limit
+
+    # Batches are padded to their longest sequence, so probe the longest one
+    length = max(meta["shot_len"] for meta in datamodule.train_dataset.metas)
+    max_micro_batch = find_max_batch_size(
+        model,
+        length,
+        budget,
+        cfg.device,
+        max_batch_size=cfg.train.batch_size,
+    )
+    if max_micro_batch == 0:
+        raise ValueError(
+            f"A single sequence of length {length} does not fit in the memory budget "
+            f"of {budget / 2**30:.2f} GB."
+        )
+
+    # The smallest number of accumulation steps that divides the batch size and
+    # gives micro batches that fit
+    batch_size = cfg.train.batch_size
+    accumulate_grad_steps = next(
+        steps
+        for steps in range(1, batch_size + 1)
+        if batch_size % steps == 0 and batch_size // steps <= max_micro_batch
+    )
+    cfg.train.accumulate_grad_steps = accumulate_grad_steps
+    datamodule.batch_size = batch_size // accumulate_grad_steps
+    print(
+        f"Memory budget {budget / 2**30:.2f} GB: up to {max_micro_batch} sequences of "
+        f"length {length} ({max_micro_batch * length} timesteps) per step. Using "
+        f"batches of {datamodule.batch_size} with {accumulate_grad_steps} "
+        f"accumulation step(s)."
+    )
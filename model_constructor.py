@@ -6,6 +6,10 @@ import pytorch_lightning as pl
 import ckconv
 import models
 from models.lightning_wrappers import ClassificationWrapper, PyGClassificationWrapper
+from models.ensemble import EnsembleNetwork, EnsembleWrapper
+
+# built-in
+from functools import partial
 
 # typing
 from omegaconf import OmegaConf
@@ -47,7 +51,8 @@ def construct_model(
 
     # Create and return model
     net_type = getattr(models, net_type)
-    network = net_type(
+    construct_network = partial(
+        net_type,
         in_channels=in_channels,
         out_channels=out_channels if out_channels != 2 else 1,
         net_cfg=cfg.net,
@@ -56,6 +61,23 @@ def construct_model(
         mask_cfg=cfg.mask,
     )
 
+    # Ensembles: one replica per member, initialized with the seed of the member
+    if hasattr(datamodule, "members"):
+        networks = []
+        for member in datamodule.members:
+            torch.manual_seed(member["seed"])
+            networks.append(construct_network())
+        network = EnsembleNetwork(
+            networks,
+            names=datamodule.member_names,
+            center=datamodule.scaler_center,
+            scale=datamodule.scaler_scale,
+            masks=datamodule.masks,
+        )
+        return EnsembleWrapper(network=network, cfg=cfg)
+
+    network = construct_network()
+
     # Wrap in PytorchLightning
     if cfg.dataset.name in ["ModelNet"]:
         Wrapper = PyGClassificationWrapper
@@ -1,4 +1,27 @@
-from .resnet import ResNet_sequence, ResNet_image, ResNetSeq_sequence
-from .tcn import TCN_sequence
+import importlib
+
 from . import modules
-from .resnet_pointcloud import ResNet_pointcloud
+
+# Networks are imported on first access, e.g., `getattr(models, net_type)` in
+# `construct_model`, so that sequence models do not import torch_geometric.
+_REGISTRY = {
+    "ResNet_sequence": ".resnet",
+    "ResNet_image": ".resnet",
+    "ResNetSeq_sequence": ".resnet",
+    "TCN_sequence": ".tcn",
+    "ResNet_pointcloud": ".resnet_pointcloud",
+}
+
+__all__ = list(_REGISTRY) + ["modules"]
+
+
+def __getattr__(name):
+    if name not in _REGISTRY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_REGISTRY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,150 @@
+import torch
+from typing import Sequence
+
+
+def first_crossings(
+    scores: torch.Tensor,
+    lengths: torch.Tensor,
+    thresholds: torch.Tensor,
+    min_time: int = 0,
+) -> torch.Tensor:
+    """Find, for every shot and threshold, the first timestep at which the score
+    exceeds the threshold.
+
+    The running maximum of a shot is non-decreasing, so the first crossing of every
+    threshold is found with one `torch.searchsorted` over it, instead of a loop over
+    the thresholds.
+
+    Args:
+        scores (torch.Tensor): [shots, padded_len] scores, e.g. unrolled logits
+        lengths (torch.Tensor): [shots] lengths of each shot
+        thresholds (torch.Tensor): [thresholds] alarm thresholds
+        min_time (int, optional): crossings before this timestep are ignored.
+            Defaults to 0.
+
+    Returns:
+        (torch.Tensor): [shots, thresholds] index of the first crossing, -1 if the
+            threshold is never exceeded
+    """
+    t = torch.arange(scores.shape[-1], device=scores.device)
+    valid = (t < lengths.unsqueeze(-1)) & (t >= min_time)
+    masked = torch.where(valid, scores, torch.full_like(scores, -float("inf")))
+    running_max = torch.cummax(masked, dim=-1).values.contiguous()
+    thresholds = thresholds.to(scores).expand(scores.shape[0], -1).contiguous()
+    # Index of the first running max strictly larger than the threshold
+    first = torch.searchsorted(running_max, thresholds, right=True)
+    return torch.where(first < scores.shape[-1], first, torch.full_like(first, -1))
+
+
+def evaluate_thresholds(
+    scores: torch.Tensor,
+    lengths: torch.Tensor,
+    labels: torch.Tensor,
+    machines: Sequence[str],
+    thresholds: torch.Tensor,
+    taus: dict,
+    min_time: int = 0,
+    quantiles: Sequence[float] = (0.1, 0.5, 0.9),
+) -> dict:
+    """Evaluate alarm statistics per machine over a grid of thresholds.
+
+    For a disruptive shot, an alarm is a true alarm if it is raised within the last
+    `taus[machine]` timesteps of the shot, and premature if it is raised earlier.
+    Any alarm on a non-disruptive shot is a false alarm. The warning time of a true
+    alarm is the number of timesteps between the alarm and the end of the shot.
+
+    Args:
+        scores (torch.Tensor): [shots, padded_len] scores, e.g. unrolled logits
+        lengths (torch.Tensor): [shots] lengths of each shot
+        labels (torch.Tensor): [shots] 0/1 disruption labels
+        machines (Sequence[str]): the machine of each shot
+        thresholds (torch.Tensor): [thresholds] alarm thresholds
+        taus (dict): number of timesteps before the end of a disruptive shot in which
+            the disruption can be detected, per machine
+        min_time (int, optional): alarms before this timestep are ignored.
+            Defaults to 0.
+        quantiles (Sequence[float], optional): quantiles of the warning times to
+            return. Defaults to (0.1, 0.5, 0.9).
+
+    Returns:
+        (dict): for every machine, a dict with the [thresholds] tensors
+            "true_alarm_rate", "premature_alarm_rate", "missed_alarm_rate" and
+            "false_alarm_rate", the [thresholds, quantiles] tensor
+            "warning_time_quantiles", and the [thresholds, disruptive shots] tensor
+            "warning_times", which is NaN where there was no true alarm.
+    """
+    lengths = torch.as_tensor(lengths, device=scores.device)
+    labels = torch.as_tensor(labels, device=scores.device).reshape(-1).round().bool()
+    thresholds = torch.as_tensor(thresholds, dtype=scores.dtype, device=scores.device)
+    shot_taus = torch.tensor([taus[m] for m in machines], device=scores.device)
+
+    alarms = first_crossings(scores, lengths, thresholds, min_time=min_time)
+    raised = alarms != -1
+    warning_times = (lengths.unsqueeze(-1) - alarms).to(scores.dtype)
+    in_window = raised & (warning_times <= shot_taus.unsqueeze(-1))
+
+    results = {}
+    for machine in sorted(set(machines)):
+        is_machine = torch.tensor([m == machine for m in machines], device=scores.device)
+        disruptive = is_machine & labels
+        non_disruptive = is_machine & ~labels
+        no_disruptive = disruptive.sum().clamp_min(1)
+        no_non_disruptive = non_disruptive.sum().clamp_min(1)
+
+        true_alarms = in_window[disruptive]
+        premature_alarms = (raised & ~in_window)[disruptive]
+        warnings = torch.where(
+            true_alarms,
+            warning_times[disruptive],
+            torch.full_like(warning_times[disruptive], float("nan")),
+        ).T
+        if warnings.shape[-1] > 0:
+            warning_quantiles = torch.nanquantile(
+                warnings,
+                torch.tensor(quantiles, dtype=scores.dtype, device=scores.device),
+                dim=-1,
+            ).T
+        else:
+            warning_quantiles = torch.full(
+                (len(thresholds), len(quantiles)), float("nan"), device=scores.device
+            )
+
+        results[machine] = {
+            "true_alarm_rate": true_alarms.sum(0) / no_disruptive,
+            "premature_alarm_rate": premature_alarms.sum(0) / no_disruptive,
+            "missed_alarm_rate": (~raised[disruptive]).sum(0) / no_disruptive,
+            "false_alarm_rate": raised[non_disruptive].sum(0) / no_non_disruptive,
+            "warning_time_quantiles": warning_quantiles,
+            "warning_times": warnings,
+        }
+    return results
+
+
+def calibrate_thresholds(
+    results: dict,
+    thresholds: torch.Tensor,
+    max_false_alarm_rate: float,
+) -> dict:
+    """Pick, per machine, the lowest threshold whose false alarm rate stays within
+    the budget. Alarm rates do not increase with the threshold, so this is the
+    threshold with the highest true alarm rate within the budget.
+
+    Args:
+        results (dict): the output of `evaluate_thresholds`
+        thresholds (torch.Tensor): [thresholds] the grid passed to
+            `evaluate_thresholds`, in increasing order
+        max_false_alarm_rate (float): the false alarm budget
+
+    Returns:
+        (dict): for every machine, the chosen threshold, or None if no threshold
+            of the grid satisfies the budget
+    """
+    thresholds = torch.as_tensor(thresholds)
+    calibrated = {}
+    for machine, result in results.items():
+        within_budget = (result["false_alarm_rate"] <= max_false_alarm_rate).nonzero()
+        if within_budget.numel() == 0:
+            calibrated[machine] = None
+        else:
+            calibrated[machine] = thresholds[within_budget[0, 0]].item()
+    return calibrated
@@ -0,0 +1,119 @@
+from . import alarms
+import math
+import numpy as np
+import torch
+
+# Hand-built traces, padded to 8 timesteps. The padding of the first shot would
+# cross every threshold, the second shot has a spike before min_time, the third
+# never crosses and the fourth touches 0.5 without exceeding it.
+SCORES = torch.tensor(
+    [
+        [0.1, 0.2, 0.6, 0.9, 0.3, 0.99, 0.99, 0.99],
+        [0.7, 0.1, 0.1, 0.1, 0.1, 0.1, 0.8, 0.1],
+        [0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.99, 0.99],
+        [0.0, 0.0, 0.0, 0.4, 0.5, 0.95, 0.0, 0.0],
+    ]
+)
+LENGTHS = torch.tensor([5, 8, 6, 6])
+LABELS = torch.tensor([1, 1, 0, 1])
+MACHINES = ["cmod", "cmod", "cmod", "d3d"]
+TAUS = {"cmod": 3, "d3d": 2}
+THRESHOLDS = torch.tensor([0.0, 0.3, 0.5, 0.9])
+
+
+def brute_force_crossing(shot: int, threshold: float, min_time: int) -> int:
+    for t in range(min_time, int(LENGTHS[shot])):
+        if SCORES[shot, t] > threshold:
+            return t
+    return -1
+
+
+def test_first_crossings():
+    for min_time in [0, 2, 7]:
+        crossings = alarms.first_crossings(SCORES, LENGTHS, THRESHOLDS, min_time)
+        expected = [
+            [brute_force_crossing(s, thr.item(), min_time) for thr in THRESHOLDS]
+            for s in range(len(SCORES))
+        ]
+        assert crossings.tolist() == expected
+    crossings = alarms.first_crossings(SCORES, LENGTHS, THRESHOLDS, min_time=2)
+    assert crossings[0].tolist() == [2, 2, 2, -1]
+    assert crossings[1].tolist() == [2, 6, 6, -1]
+    assert crossings[2].tolist() == [2, -1, -1, -1]
+    assert crossings[3].tolist() == [3, 3, 5, 5]
+
+
+def test_evaluate_thresholds():
+    quantiles = (0.1, 0.5, 0.9)
+    for min_time in [0, 2]:
+        results = alarms.evaluate_thresholds(
+            SCORES, LENGTHS, LABELS, MACHINES, THRESHOLDS, TAUS, min_time, quantiles
+        )
+        assert sorted(results) == ["cmod", "d3d"]
+        for machine, result in results.items():
+            shots = [s for s, m in enumerate(MACHINES) if m == machine]
+            disruptive = [s for s in shots if LABELS[s]]
+            non_disruptive = [s for s in shots if not LABELS[s]]
+            rates = {
+                "true_alarm_rate": [],
+                "premature_alarm_rate": [],
+                "missed_alarm_rate": [],
+                "false_alarm_rate": [],
+            }
+            warning_times, warning_quantiles = [], []
+            for threshold in THRESHOLDS.tolist():
+                true, premature, missed, warnings = 0, 0, 0, []
+                for s in disruptive:
+                    alarm = brute_force_crossing(s, threshold, min_time)
+                    warning = int(LENGTHS[s]) - alarm
+                    if alarm == -1:
+                        missed += 1
+                        warnings.append(math.nan)
+                    elif warning <= TAUS[machine]:
+                        true += 1
+                        warnings.append(warning)
+                    else:
+                        premature += 1
+                        warnings.append(math.nan)
+                false = sum(
+                    brute_force_crossing(s, threshold, min_time) != -1
+                    for s in non_disruptive
+                )
+                no_disruptive = max(len(disruptive), 1)
+                rates["true_alarm_rate"].append(true / no_disruptive)
+                rates["premature_alarm_rate"].append(premature / no_disruptive)
+                rates["missed_alarm_rate"].append(missed / no_disruptive)
+                rates["false_alarm_rate"].append(false / max(len(non_disruptive), 1))
+                warning_times.append(warnings)
+                if all(math.isnan(w) for w in warnings):
+                    warning_quantiles.append([math.nan] * len(quantiles))
+                else:
+                    warning_quantiles.append(np.nanquantile(warnings, quantiles))
+
+            for name, expected in rates.items():
+                torch.testing.assert_close(
+                    result[name], torch.tensor(expected), check_dtype=False
+                )
+            torch.testing.assert_close(
+                result["warning_times"],
+                torch.tensor(warning_times),
+                check_dtype=False,
+                equal_nan=True,
+            )
+            torch.testing.assert_close(
+                result["warning_time_quantiles"],
+                torch.tensor(np.array(warning_quantiles)),
+                check_dtype=False,
+                equal_nan=True,
+            )
+
+    # The warning time window: an alarm 3 timesteps before the end of a cmod shot is
+    # a true alarm, 8 timesteps before it is premature.
+    results = alarms.evaluate_thresholds(
+        SCORES, LENGTHS, LABELS, MACHINES, THRESHOLDS, TAUS
+    )
+    assert results["cmod"]["warning_times"][1, 0].item() == 3
+    assert math.isnan(results["cmod"]["warning_times"][1, 1].item())
+    assert results["cmod"]["premature_alarm_rate"][1].item() == 0.5
+    # The only non-disruptive shot crosses 0.0 only
+    assert results["cmod"]["false_alarm_rate"].tolist() == [1.0, 0.0, 0.0, 0.0]
@@ -0,0 +1,216 @@
+# torch
+import torch
+from pytorch_lightning.plugins.io import CheckpointIO
+
+# built-in
+import os
+import threading
+import uuid
+import warnings
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# typing
+from typing import Any, Optional
+
+
+FORMAT = "ccnn-incremental-v1"
+
+
+class TensorRef:
+    """Placeholder of a tensor in a manifest, pointing to its blob."""
+
+    def __init__(self, blob: str):
+        self.blob = blob
+
+
+def _map_tensors(obj, fn, key=""):
+    """Applies fn(key, tensor) to every tensor in nested dicts, lists and tuples."""
+    if isinstance(obj, torch.Tensor):
+        return fn(key, obj)
+    elif isinstance(obj, dict):
+        return type(obj)(
+            (k, _map_tensors(v, fn, f"{key}.{k}" if key else str(k)))
+            for k, v in obj.items()
+        )
+    elif isinstance(obj, (list, tuple)) and not hasattr(obj, "_fields"):
+        return type(obj)(_map_tensors(v, fn, f"{key}.{i}") for i, v in enumerate(obj))
+    return obj
+
+
+def _load_blob(path: str, mmap: bool) -> torch.Tensor:
+    if path.endswith(".pt"):
+        return torch.load(path, map_location="cpu")
+    if not mmap:
+        return torch.from_numpy(np.load(path))
+    with warnings.catch_warnings():
+        # Memory mapped arrays are read-only, they are copied by load_state_dict
+        warnings.filterwarnings(
+            "ignore", message=".*not writable.*", category=UserWarning
+        )
+        return torch.from_numpy(np.load(path, mmap_mode="r"))
+
+
+def load_checkpoint(
+    path: str, map_location: Optional[Any] = "cpu", mmap: bool = True
+) -> dict:
+    """Loads a checkpoint written by AsyncIncrementalCheckpointIO, or a regular
+    torch checkpoint. With mmap, the tensors of the former are memory mapped,
+    read-only, and only read from disk when they are used, e.g., copied by
+    `load_state_dict`. Only use mmap to load weights: optimizer states would keep
+    the read-only tensors and be updated in place."""
+    checkpoint = torch.load(path, map_location=map_location)
+    if not (isinstance(checkpoint, dict) and checkpoint.get("format") == FORMAT):
+        return checkpoint
+    blobs_dir = os.path.join(os.path.dirname(path), checkpoint["blobs_dir"])
+
+    def load(obj):
+        if isinstance(obj, TensorRef):
+            tensor = _load_blob(os.path.join(blobs_dir, obj.blob), mmap)
+            if map_location not in (None, "cpu", torch.device("cpu")):
+                tensor = tensor.to(map_location)
+            return tensor
+        elif isinstance(obj, dict):
+            return type(obj)((k, load(v)) for k, v in obj.items())
+        elif isinstance(obj, (list, tuple)) and not hasattr(obj, "_fields"):
+            return type(obj)(load(v) for v in obj)
+        return obj
+
+    return load(checkpoint["checkpoint"])
+
+
+class AsyncIncrementalCheckpointIO(CheckpointIO):
+    """Lightning CheckpointIO that writes checkpoints on a background thread, and
+    only writes the tensors that changed since the previous checkpoint.
+
+    `save_checkpoint` only copies the tensors of the checkpoint to host memory, on
+    the training thread, and returns. A single background thread then writes every
+    tensor that differs from the one written for the same key before to its own
+    blob, as a .npy file, and the checkpoint itself as a small manifest that refers
+    to the blobs. Unchanged tensors, e.g. kernel positions, `train_length` buffers
+    or the shared tensors of the best and last checkpoint, are written once. Writes
+    and removals are applied in order; loading waits for pending writes.
+
+    The previous tensors are kept in host memory for the comparison, so this uses
+    about one extra copy of the model and optimizer state.
+
+    Args:
+        asynchronous (bool, optional): write on a background thread. Defaults to True.
+        incremental (bool, optional): skip unchanged tensors. Defaults to True.
+    """
+
+    BLOBS_DIR = "blobs"
+
+    def __init__(self, asynchronous: bool = True, incremental: bool = True):
+        super().__init__()
+        self.asynchronous = asynchronous
+        self.incremental = incremental
+        self._executor = None
+        self._pending = []
+        self._lock = threading.Lock()
+        # key -> (host tensor, blob) of the last written tensor of every key
+        self._written = {}
+        # checkpoint path -> blobs it refers to
+        self._references = {}
+
+    def _submit(self, fn, *args):
+        if not self.asynchronous:
+            fn(*args)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        with self._lock:
+            # Re-raise errors of writes that already finished
+            for future in [f for f in self._pending if f.done()]:
+                self._pending.remove(future)
+                future.result()
+            self._pending.append(self._executor.submit(fn, *args))
+
+    def wait(self):
+        """Blocks until all pending writes are done."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def save_checkpoint(
+        self, checkpoint: dict, path: str, storage_options: Optional[Any] = None
+    ):
+        # Snapshot on the training thread, so training can continue
+        def snapshot(key, tensor):
+            return tensor.detach().to("cpu", copy=True)
+
+        self._submit(self._write, _map_tensors(checkpoint, snapshot), path)
+
+    def _write(self, checkpoint: dict, path: str):
+        directory = os.path.dirname(path)
+        blobs_dir = os.path.join(directory, self.BLOBS_DIR)
+        os.makedirs(blobs_dir, exist_ok=True)
+        blobs = set()
+
+        def write(key, tensor):
+            previous = self._written.get(key)
+            if (
+                self.incremental
+                and previous is not None
+                and previous[0].dtype == tensor.dtype
+                and previous[0].shape == tensor.shape
+                and torch.equal(previous[0], tensor)
+                and os.path.exists(os.path.join(blobs_dir, previous[1]))
+            ):
+                blob = previous[1]
+            else:
+                # numpy has no bfloat16
+                suffix = ".pt" if tensor.dtype == torch.bfloat16 else ".npy"
+                blob = uuid.uuid4().hex + suffix
+                blob_path = os.path.join(blobs_dir, blob)
+                if suffix == ".pt":
+                    torch.save(tensor, blob_path)
+                else:
+                    np.save(blob_path, tensor.numpy())
+            self._written[key] = (tensor, blob)
+            blobs.add(blob)
+            return TensorRef(blob)
+
+        manifest = {
+            "format": FORMAT,
+            "blobs_dir": self.BLOBS_DIR,
+            "checkpoint": _map_tensors(checkpoint, write),
+        }
+        tmp_path = f"{path}.tmp"
+        torch.save(manifest, tmp_path)
+        os.replace(tmp_path, path)
+        # Checkpoints rewritten at the same path, e.g. last.ckpt, are never removed
+        # by Lightning, so their previous blobs are released here
+        previous = self._references.get(path, set())
+        self._references[path] = blobs
+        self._remove_unused(blobs_dir, previous - blobs)
+
+    def load_checkpoint(self, path: str, map_location: Optional[Any] = None) -> dict:
+        self.wait()
+        # Resumed optimizer states are updated in place, so they are not memory mapped
+        return load_checkpoint(path, map_location=map_location, mmap=False)
+
+    def remove_checkpoint(self, path: str):
+        self._submit(self._remove, path)
+
+    def _remove(self, path: str):
+        if os.path.exists(path):
+            os.remove(path)
+        blobs = self._references.pop(path, set())
+        self._remove_unused(os.path.join(os.path.dirname(path), self.BLOBS_DIR), blobs)
+
+    def _remove_unused(self, blobs_dir: str, blobs: set):
+        # Blobs of this run that no other checkpoint or future comparison uses
+        in_use = set().union(*self._references.values())
+        in_use.update(blob for _, blob in self._written.values())
+        for blob in blobs - in_use:
+            blob_path = os.path.join(blobs_dir, blob)
+            if os.path.exists(blob_path):
+                os.remove(blob_path)
+
+    def teardown(self):
+        self.wait()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,17 @@
+from . import checkpoint_io
+import os
+import torch
+
+
+def test_rewritten_checkpoint_releases_its_blobs(tmp_path):
+    io = checkpoint_io.AsyncIncrementalCheckpointIO(asynchronous=False)
+    path = os.path.join(tmp_path, "last.ckpt")
+    blobs_dir = os.path.join(tmp_path, io.BLOBS_DIR)
+    frozen = torch.ones(3)
+    for step in range(3):
+        io.save_checkpoint({"frozen": frozen, "step": torch.tensor(step)}, path)
+        # One blob per tensor, the unchanged one is written once
+        assert len(os.listdir(blobs_dir)) == 2
+    checkpoint = io.load_checkpoint(path)
+    assert checkpoint["step"].item() == 2
+    assert torch.equal(checkpoint["frozen"], frozen)
@@ -0,0 +1,297 @@
+import torch
+import collections
+import copy
+import math
+
+# project
+import ckconv
+import models
+from ckconv.nn.ckconv import CKConvBase
+from ckconv.nn.flexconv import FlexConvBase
+from ckconv.nn.conv import ConvBase
+from ckconv.utils.flops import conv_flops, kernel_net_flops
+
+# typing
+from omegaconf import OmegaConf
+
+
+LayerCost = collections.namedtuple(
+    "LayerCost",
+    [
+        "name",
+        "type",
+        "in_channels",
+        "out_channels",
+        "length",
+        "kernel_length",
+        "fft",
+        "kernel_gflops",
+        "conv_gflops",
+        "gflops",
+        "activations_mb",
+    ],
+)
+
+
+def train_length(kernel_size, length: int) -> int:
+    """Number of kernel positions sampled by a CKConv for inputs of the given length,
+    see `CKConvBase.handle_kernel_positions`."""
+    if kernel_size == "full":
+        return 2 * length - 1
+    elif kernel_size == "same":
+        return length
+    return int(kernel_size)
+
+
+def kernel_length(module: CKConvBase, length: int) -> int:
+    """Length of the kernel a CKConv or FlexConv samples for an input of the given
+    length. For FlexConvs with dynamic cropping, the kernel is cropped where the
+    current mask drops below its threshold, see `FlexConvBase.construct_masked_kernel`.
+    """
+    size = int(module.train_length[0])
+    if size == 0:
+        # Not run yet, the kernel size is fixed by the first input
+        size = train_length(module.kernel_size, length)
+    if not isinstance(module, FlexConvBase) or not module.dynamic_cropping:
+        return size
+
+    with torch.no_grad():
+        root = module.root_function(
+            thresh=module.mask_threshold,
+            mean=module.mask_mean_param,
+            sigma=module.mask_width_param,
+            temperature=module.mask_temperature,
+        )
+    step = 2.0 / (size - 1)
+    if module.causal:
+        root = float(root)
+        if abs(root) >= 1.0:
+            return size
+        return size - math.floor((root + 1.0) / step)
+    else:
+        root = float(root.reshape(-1)[0])
+        if abs(root) >= 1.0:
+            return size
+        return 2 * math.ceil(root / step + 1e-8) - 1
+
+
+def conv_layer_cost(
+    name: str,
+    module: torch.nn.Module,
+    batch_size: int,
+    length: int,
+    bytes_per_element: int = 4,
+) -> LayerCost:
+    """Predicted cost of a forward pass of a CKConv, FlexConv or Conv layer, including
+    kernel generation and, for separable layers, the channel mixer.
+
+    Activation memory counts the tensors the layer creates in the forward pass:
+    the outputs of the kernel network, the padded input and the Fourier transforms of
+    the convolution, and the outputs of the convolution and channel mixer.
+    """
+    c_in, c_out = module.in_channels, module.out_channels
+    if isinstance(module, CKConvBase):
+        k = kernel_length(module, length)
+    else:
+        k = module.kernel_size
+    kernel_shape = [1 if module.separable else c_out, c_in, k]
+
+    fft = module.conv_use_fft
+    if fft and isinstance(module, FlexConvBase):
+        # FlexConvs only use the FFT for kernels larger than their fft_threshold
+        fft = k > module.fft_threshold
+    causal = getattr(module, "causal", True)
+    conv = conv_flops(
+        [batch_size, c_in, length], kernel_shape, module.separable, fft, causal
+    )
+
+    # Elements of the tensors created by the convolution
+    conv_channels = c_in if module.separable else c_out
+    if causal:
+        padded = length + k + (k % 2 == 0) - 1
+    else:
+        padded = length + 2 * (k // 2)
+    elements = batch_size * c_in * padded + batch_size * conv_channels * length
+    if fft:
+        frequencies = padded // 2 + 1
+        # Complex spectra of the input, kernel and product, and the inverse transform
+        elements += 2 * frequencies * (batch_size * c_in + math.prod(kernel_shape[:2]))
+        elements += 2 * frequencies * batch_size * conv_channels
+        elements += batch_size * conv_channels * padded
+
+    kernel = 0.0
+    if isinstance(module, CKConvBase):
+        kernel = kernel_net_flops(module.Kernel, k)
+        # Every linear layer of the kernel network and its elementwise operations
+        kernel_channels = sum(
+            m.out_channels
+            for m in module.Kernel.modules()
+            if isinstance(m, torch.nn.modules.conv._ConvNd)
+        )
+        elements += 2 * k * kernel_channels
+
+    mixer = 0.0
+    if hasattr(module, "channel_mixer"):
+        mixer = 2.0 * batch_size * length * c_in * c_out
+        elements += batch_size * c_out * length
+
+    return LayerCost(
+        name=name,
+        type=type(module).__name__,
+        in_channels=c_in,
+        out_channels=c_out,
+        length=length,
+        kernel_length=k,
+        fft=fft,
+        kernel_gflops=kernel / 1e9,
+        conv_gflops=(conv + mixer) / 1e9,
+        gflops=(kernel + conv + mixer) / 1e9,
+        activations_mb=elements * bytes_per_element / 2**20,
+    )
+
+
+def estimate_network(
+    network: torch.nn.Module,
+    length: int,
+    batch_size: int = 1,
+    bytes_per_element: int = 4,
+) -> list:
+    """Predicts the per-layer cost of a forward pass of a `ResNetBase` on sequences of
+    the given length, without running it. Kernel lengths follow from the current mask
+    widths of the FlexConvs, so a trained network can be estimated as well.
+
+    Layers are visited in the order in which they are registered, which is the order
+    in which they are applied in the blocks of this repository. Elementwise layers
+    that hold no channel information take the channels of the preceding layer.
+
+    Args:
+        network (torch.nn.Module): the network to estimate.
+        length (int): input sequence length.
+        batch_size (int, optional): Defaults to 1.
+        bytes_per_element (int, optional): Defaults to 4, i.e. float32.
+
+    Returns:
+        (list): a LayerCost per layer
+    """
+    costs = []
+    channels = None
+    skip = set()
+    for name, module in network.named_modules():
+        if module in skip:
+            continue
+        layer_length = length
+        if module is getattr(network, "out_layer", None) and (
+            getattr(network, "OUTPUT_TYPE", None) == "label"
+        ):
+            # Applied to the mean over the sequence
+            layer_length = 1
+
+        if isinstance(module, (CKConvBase, ConvBase)):
+            # The kernel network and channel mixer are part of the layer
+            skip.update(module.modules())
+            costs.append(
+                conv_layer_cost(name, module, batch_size, length, bytes_per_element)
+            )
+            channels = module.out_channels
+            continue
+
+        c_in = c_out = channels
+        flops = 0.0
+        if isinstance(module, torch.nn.modules.conv._ConvNd):
+            c_in, c_out = module.in_channels, module.out_channels
+            flops = 2.0 * batch_size * layer_length * c_in * c_out // module.groups
+        elif isinstance(module, torch.nn.modules.batchnorm._NormBase):
+            c_in = c_out = module.num_features
+            flops = 2.0 * batch_size * layer_length * c_out
+        elif isinstance(module, (torch.nn.GroupNorm, ckconv.nn.LayerNorm)):
+            flops = 8.0 * batch_size * layer_length * (c_out or 0)
+        elif isinstance(module, torch.nn.modules.pooling._MaxPoolNd):
+            length = length // module.kernel_size
+            layer_length = length
+        elif isinstance(module, torch.nn.modules.dropout._DropoutNd):
+            if module.p == 0.0:
+                continue
+        elif not module.__module__.startswith("torch.nn.modules.activation"):
+            # Containers and blocks
+            continue
+        if c_out is None:
+            continue
+        channels = c_out
+        costs.append(
+            LayerCost(
+                name=name,
+                type=type(module).__name__,
+                in_channels=c_in,
+                out_channels=c_out,
+                length=layer_length,
+                kernel_length=None,
+                fft=False,
+                kernel_gflops=0.0,
+                conv_gflops=0.0,
+                gflops=flops / 1e9,
+                activations_mb=batch_size
+                * c_out
+                * layer_length
+                * bytes_per_element
+                / 2**20,
+            )
+        )
+    return costs
+
+
+def construct_sequence_network(
+    cfg: OmegaConf, in_channels: int, out_channels: int
+) -> torch.nn.Module:
+    """Constructs the sequence network described by `net.*`, `kernel.*`, `mask.*` and
+    `conv.*` of a config, without a datamodule."""
+    cfg = copy.deepcopy(cfg)
+    OmegaConf.set_struct(cfg, False)
+    cfg.net.data_dim = 1
+    cfg.net.data_type = "sequence"
+    return getattr(models, f"{cfg.net.type}_sequence")(
+        in_channels=in_channels,
+        out_channels=out_channels,
+        net_cfg=cfg.net,
+        kernel_cfg=cfg.kernel,
+        conv_cfg=cfg.conv,
+        mask_cfg=cfg.mask,
+    )
+
+
+def estimate_config(
+    cfg: OmegaConf,
+    in_channels: int,
+    out_channels: int,
+    length: int,
+    batch_size: int = 1,
+) -> list:
+    """Predicts the per-layer cost of the sequence network described by a config.
+    The network is only constructed, not run, so its masks are at their initial
+    width, `mask.init_value`."""
+    network = construct_sequence_network(cfg, in_channels, out_channels)
+    return estimate_network(network, length, batch_size)
+
+
+def summarise(costs: list) -> dict:
+    """Totals of a list of LayerCosts. The training cost is approximated as three
+    times the forward cost, one forward and two backward passes."""
+    gflops = sum(c.gflops for c in costs)
+    return {
+        "gflops": gflops,
+        "train_gflops": 3.0 * gflops,
+        "kernel_gflops": sum(c.kernel_gflops for c in costs),
+        "conv_gflops": sum(c.conv_gflops for c in costs),
+        "activations_mb": sum(c.activations_mb for c in costs),
+    }
+
+
+def format_costs(costs: list) -> str:
+    widths = [max([4] + [len(c.name) for c in costs]) + 2, 20] + [12] * 9
+    lines = ["".join(f.ljust(w) for f, w in zip(LayerCost._fields, widths))]
+    for cost in costs:
+        cells = [
+            f"{v:.4f}" if isinstance(v, float) else ("-" if v is None else str(v))
+            for v in cost
+        ]
+        lines.append("".join(c.ljust(w) for c, w in zip(cells, widths)))
+    return "\n".join(lines)
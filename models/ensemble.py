@@ -0,0 +1,229 @@
+# torch
+import torch
+
+# project
+from .lightning_wrappers import ClassificationWrapper
+from .metrics import HistogramMetrics
+
+# typing
+from omegaconf import OmegaConf
+from typing import List
+
+
+class EnsembleNetwork(torch.nn.Module):
+    """Independent replicas of a network, trained together on shared batches.
+
+    Every member has its own parameters, the center and scale of its robust scaler,
+    and boolean masks over the shots of the dataset for its train, val and test
+    splits, see `datamodules.LucasEnsembleDataModule`. Inputs are the unscaled
+    shots, zero padded by the collate function, and are scaled per member.
+
+    Args:
+        networks (list): one network per member.
+        names (list): names of the members, used for logging.
+        center (Tensor): [members, channels] robust scaler centers.
+        scale (Tensor): [members, channels] robust scaler scales.
+        masks (dict): split -> [members, shots] boolean masks.
+    """
+
+    def __init__(
+        self,
+        networks: List[torch.nn.Module],
+        names: List[str],
+        center: torch.Tensor,
+        scale: torch.Tensor,
+        masks: dict,
+    ):
+        super().__init__()
+        self.members = torch.nn.ModuleList(networks)
+        self.names = list(names)
+        self.OUTPUT_TYPE = networks[0].OUTPUT_TYPE
+        self.register_buffer("center", center.clone())
+        self.register_buffer("scale", scale.clone())
+        # The masks follow from the dataset, they are not part of the state dict
+        for split, mask in masks.items():
+            self.register_buffer(f"{split}_mask", mask.clone(), persistent=False)
+
+    @property
+    def out_layer(self):
+        return self.members[0].out_layer
+
+    def __len__(self):
+        return len(self.members)
+
+    def mask(self, split: str) -> torch.Tensor:
+        return getattr(self, f"{split}_mask")
+
+    def scale_input(self, x, lens, member: int):
+        center = self.center[member].view(1, -1, 1)
+        scale = self.scale[member].view(1, -1, 1)
+        x = (x - center) / scale
+        # Padding stays zero, as if the shots were scaled before collating
+        padding = torch.arange(x.shape[-1], device=x.device) >= lens.view(-1, 1)
+        return x.masked_fill(padding.unsqueeze(1), 0.0)
+
+    def forward(self, x, lens, member: int):
+        return self.members[member](self.scale_input(x, lens, member), lens)
+
+    def forward_unrolled(self, x, lens, member: int):
+        x = self.scale_input(x, lens, member)
+        return self.members[member].forward_unrolled(x, lens)
+
+
+class EnsembleWrapper(ClassificationWrapper):
+    """Trains the members of an EnsembleNetwork on shared batches.
+
+    Every member only sees the shots of its own split in a batch. The loss is the sum
+    of the member losses, so that each member receives the gradient of its own loss.
+    Metrics are logged per member as "{stage}/{member name}/{metric}", and their
+    mean over the members as "{stage}/{metric}", which is monitored for
+    checkpointing and early stopping.
+    """
+
+    def __init__(
+        self,
+        network: EnsembleNetwork,
+        cfg: OmegaConf,
+        **kwargs,
+    ):
+        super().__init__(
+            network=network,
+            cfg=cfg,
+        )
+        n_classes = network.out_layer.out_channels
+        task = "multiclass" if self.multiclass else "binary"
+        self.member_metrics = torch.nn.ModuleDict(
+            {
+                # "train" would clash with Module.train
+                f"{stage}_metrics": torch.nn.ModuleList(
+                    [
+                        HistogramMetrics(num_classes=n_classes, task=task, bins=100)
+                        for _ in range(len(network))
+                    ]
+                )
+                for stage in ["train", "val", "test"]
+            }
+        )
+
+    def _ensemble_step(self, batch, stage: str) -> dict:
+        """Runs every member on its shots of the batch.
+
+        Returns:
+            (dict): member index -> loss, for the members with shots in the batch
+        """
+        x, labels, lens, positions = batch
+        lens = torch.as_tensor(lens, device=x.device)
+        masks = self.network.mask(stage)[:, positions]
+        losses = {}
+        for member, mask in enumerate(masks):
+            if not mask.any():
+                continue
+            member_lens, member_labels = lens[mask], labels[mask]
+            logits = self.network(x[mask], member_lens, member=member)
+            probabilities = self.get_probabilities(logits, member_lens)
+            self.member_metrics[f"{stage}_metrics"][member].update(
+                probabilities.detach(), member_labels
+            )
+            if not self.multiclass:
+                member_labels = member_labels.float()
+                logits = logits.view(-1)
+            if self.seq_out:
+                losses[member] = self.loss_metric(logits, member_labels, member_lens)
+            else:
+                losses[member] = self.loss_metric(logits, member_labels)
+        return losses
+
+    def _log_losses(self, stage: str, losses: dict, **kwargs):
+        for member, loss in losses.items():
+            self.log(f"{stage}/{self.network.names[member]}/loss", loss, **kwargs)
+        loss = torch.stack(list(losses.values())).mean()
+        self.log(f"{stage}/loss", loss, **kwargs)
+
+    def training_step(self, batch, batch_idx):
+        losses = self._ensemble_step(batch, "train")
+        if self.weight_regularizer is not None:
+            reg_loss = self.weight_regularizer(self.network)
+        else:
+            reg_loss = 0.0
+        kwargs = {"on_step": True, "on_epoch": True, "sync_dist": self.distributed}
+        self._log_losses("train", losses, **kwargs)
+        return {"loss": sum(losses.values()) + reg_loss}
+
+    def validation_step(self, batch, batch_idx):
+        with torch.no_grad():
+            losses = self._ensemble_step(batch, "val")
+        if losses:
+            kwargs = {"on_epoch": True, "sync_dist": self.distributed}
+            self._log_losses("val", losses, **kwargs)
+
+    def test_step(self, batch, batch_idx):
+        losses = self._ensemble_step(batch, "test")
+        if losses:
+            self._log_losses("test", losses, on_epoch=True, sync_dist=self.distributed)
+
+    def predict_step(self, batch, batch_idx, dataloader_idx=0):
+        """Returns the unrolled (per-timestep) logits of every member on all shots of
+        the batch, stacked as [members, batch, ...], together with the labels and
+        lengths of the shots and, per split, the [members, batch] masks of the shots
+        that each member was trained, validated or tested on."""
+        x, labels, lens, positions = batch
+        lens = torch.as_tensor(lens, device=x.device)
+        logits = []
+        for member in range(len(self.network)):
+            if self.seq_out:
+                logits.append(self.network(x, lens, member=member))
+            else:
+                logits.append(self.network.forward_unrolled(x, lens, member=member))
+        masks = {
+            split: self.network.mask(split)[:, positions]
+            for split in ["train", "val", "test"]
+        }
+        return {
+            "logits": torch.stack(logits),
+            "labels": labels,
+            "lengths": lens,
+            "masks": masks,
+        }
+
+    def _log_member_metrics(self, stage: str) -> dict:
+        """Computes, logs and resets the metrics of every member, and logs their
+        mean over the members.
+
+        Returns:
+            (dict): metric -> mean over the members
+        """
+        per_member = []
+        for name, metrics in zip(
+            self.network.names, self.member_metrics[f"{stage}_metrics"]
+        ):
+            values = metrics.compute()
+            metrics.reset()
+            values.pop("roc")
+            for metric, value in values.items():
+                self.log(f"{stage}/{name}/{metric}", value, on_epoch=True)
+            per_member.append(values)
+        means = {
+            metric: torch.stack([values[metric] for values in per_member]).mean()
+            for metric in per_member[0]
+        }
+        for metric, value in means.items():
+            self.log(f"{stage}/{metric}", value, on_epoch=True)
+        return means
+
+    def _log_best(self, stage: str, values: dict, best: dict):
+        for name, this_epoch in values.items():
+            prev_best = best.get(name, None)
+            if not prev_best or this_epoch > prev_best:
+                best[name] = this_epoch.item()
+                self.logger.experiment.log({f"{stage}/best_{name}": best[name]})
+
+    def on_train_epoch_end(self):
+        values = self._log_member_metrics("train")
+        self._log_best("train", values, self.best_train_metrics)
+
+    def on_validation_epoch_end(self):
+        values = self._log_member_metrics("val")
+        self._log_best("val", values, self.best_val_metrics)
+
+    def on_test_epoch_end(self):
+        self._log_member_metrics("test")
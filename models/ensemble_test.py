@@ -0,0 +1,48 @@
+from benchmarks.cost_model import compose_config
+from benchmarks.training import synthetic_shots
+from dataset_constructor import construct_datamodule
+from datamodules.lucas import LucasDataModule
+from model_constructor import construct_model
+import os
+import pickle
+import torch
+
+
+def test_ensemble_steps(tmp_path):
+    with open(os.path.join(tmp_path, LucasDataModule.DATA_FILENAME), "wb") as f:
+        pickle.dump(synthetic_shots(300, seed=0, max_length=256), f)
+    cfg = compose_config(
+        ["net.no_hidden=8", "net.no_blocks=1", "kernel.no_hidden=8", "no_workers=0"]
+    )
+    cfg.dataset.name = "LucasEnsemble"
+    cfg.dataset.data_dir = str(tmp_path)
+    cfg.dataset.params.members = [{"seed": 1}, {"seed": 2}]
+    cfg.device = "cpu"
+    cfg.train.avail_gpus = 0
+    cfg.train.batch_size = 8
+    cfg.scheduler.iters_per_train_epoch = 1
+    cfg.scheduler.total_train_iters = cfg.train.epochs
+
+    torch.manual_seed(0)
+    datamodule = construct_datamodule(cfg)
+    datamodule.setup()
+    model = construct_model(cfg, datamodule)
+    assert len(model.network) == 2
+
+    model.train()
+    loss = model.training_step(next(iter(datamodule.train_dataloader())), 0)["loss"]
+    assert torch.isfinite(loss)
+    loss.backward()
+
+    model.eval()
+    batch = next(iter(datamodule.val_dataloader()))
+    model.validation_step(batch, 0)
+    with torch.no_grad():
+        out = model.predict_step(batch, 0)
+    x, labels, lens, positions = batch
+    assert out["logits"].shape[:2] == (2, x.shape[0])
+    assert torch.isfinite(out["logits"]).all()
+    for split in ["train", "val", "test"]:
+        assert out["masks"][split].shape == (2, x.shape[0])
+    # Every shot of the val loader is in the val split of some member
+    assert out["masks"]["val"].any(0).all()
@@ -0,0 +1,311 @@
+# torch
+import torch
+from torch.ao.quantization import HistogramObserver, QConfig
+from torch.ao.quantization import default_per_channel_weight_observer
+
+# project
+from ckconv.nn.ckconv import CKConvBase
+from ckconv.nn.flexconv import FlexConvBase
+
+# built-in
+import copy
+import time
+
+# typing
+from typing import Iterable, Mapping, Optional, Sequence, Union
+
+
+def bake_kernels(network: torch.nn.Module, mode: bool = True) -> torch.nn.Module:
+    """Bakes the masked kernels of all FlexConvs of the network, see
+    `FlexConvBase.bake`: the kernels are sampled on the first forward pass in eval
+    mode and reused afterwards."""
+    for module in network.modules():
+        if isinstance(module, FlexConvBase):
+            module.bake(mode)
+    return network
+
+
+def int8_qconfig() -> QConfig:
+    """Observers of the int8 layers: histogram calibrated activations, with the range
+    reduced to 7 bits on fbgemm / x86 to avoid overflows, and symmetric per-channel
+    weights."""
+    reduce_range = torch.backends.quantized.engine in ["fbgemm", "x86"]
+    return QConfig(
+        activation=HistogramObserver.with_args(reduce_range=reduce_range),
+        weight=default_per_channel_weight_observer,
+    )
+
+
+def pointwise_layers(network: torch.nn.Module) -> list:
+    """Names and modules of the point-wise Conv1d layers of the network, e.g., the
+    channel mixers, linear layers, shortcuts and the output layer, except those of
+    the kernel networks."""
+    kernel_layers = set()
+    for module in network.modules():
+        if isinstance(module, CKConvBase):
+            kernel_layers.update(id(m) for m in module.Kernel.modules())
+    return [
+        (name, module)
+        for name, module in network.named_modules()
+        if type(module) is torch.nn.Conv1d
+        and module.kernel_size == (1,)
+        and module.stride == (1,)
+        and module.groups == 1
+        and id(module) not in kernel_layers
+    ]
+
+
+class ObservedLinear1d(torch.nn.Module):
+    """Point-wise Conv1d that records the ranges of its inputs and outputs."""
+
+    def __init__(self, linear: torch.nn.Conv1d, qconfig: QConfig):
+        super().__init__()
+        self.linear = linear
+        self.qconfig = qconfig
+        self.input_observer = qconfig.activation()
+        self.output_observer = qconfig.activation()
+
+    def forward(self, x):
+        self.input_observer(x)
+        out = self.linear(x)
+        self.output_observer(out)
+        return out
+
+
+class QuantizedLinear1d(torch.nn.Module):
+    """Point-wise Conv1d with int8 weights, quantized per output channel, and uint8
+    inputs and outputs, quantized with the scales found during calibration. Takes and
+    returns float tensors of shape [batch, channels, length]. CPU only.
+
+    Args:
+        observed (ObservedLinear1d): the calibrated layer.
+    """
+
+    def __init__(self, observed: ObservedLinear1d):
+        super().__init__()
+        linear = observed.linear
+        weight = linear.weight.detach().float().squeeze(-1)
+        weight_observer = observed.qconfig.weight()
+        weight_observer(weight)
+        scales, zero_points = weight_observer.calculate_qparams()
+        qweight = torch.quantize_per_channel(
+            weight, scales.double(), zero_points.long(), axis=0, dtype=torch.qint8
+        )
+        bias = None if linear.bias is None else linear.bias.detach().float()
+
+        self.linear = torch.ao.nn.quantized.Linear(
+            linear.in_channels,
+            linear.out_channels,
+            bias_=bias is not None,
+            dtype=torch.qint8,
+        )
+        self.linear.set_weight_bias(qweight, bias)
+        scale, zero_point = observed.output_observer.calculate_qparams()
+        self.linear.scale, self.linear.zero_point = float(scale), int(zero_point)
+        scale, zero_point = observed.input_observer.calculate_qparams()
+        self.input_scale, self.input_zero_point = float(scale), int(zero_point)
+        self.in_channels = linear.in_channels
+        self.out_channels = linear.out_channels
+
+    def forward(self, x):
+        batch, channels, length = x.shape
+        # Channels last, so that the layer is a single matrix product
+        x = x.float().transpose(1, 2).reshape(-1, channels)
+        x = torch.quantize_per_tensor(
+            x, self.input_scale, self.input_zero_point, torch.quint8
+        )
+        out = self.linear(x).dequantize()
+        return out.view(batch, length, -1).transpose(1, 2)
+
+
+def calibrate(network: torch.nn.Module, batches: Iterable):
+    """Runs (x, labels, lens) batches through the network, as in scoring."""
+    with torch.no_grad():
+        for x, _, lens in batches:
+            lens = torch.as_tensor(lens)
+            network(x, lens)
+            if hasattr(network, "forward_unrolled"):
+                network.forward_unrolled(x, lens)
+
+
+def quantize_network(
+    network: torch.nn.Module,
+    batches: Iterable,
+    skip: Sequence[str] = (),
+    inplace: bool = False,
+) -> torch.nn.Module:
+    """Post-training int8 quantization of a network for CPU inference.
+
+    The kernels of the FlexConvs are baked, the point-wise layers (see
+    `pointwise_layers`) are calibrated on the batches, e.g., a slice of the
+    validation set, and replaced by QuantizedLinear1d layers. The depthwise
+    convolutions, norms and nonlinearities stay in float32. Channel mixers that
+    are fused with the FFT convolution are unfused.
+
+    Args:
+        network (torch.nn.Module): the network, e.g., a ResNet_sequence.
+        batches (Iterable): (x, labels, lens) batches to calibrate on.
+        skip (Sequence[str], optional): names of point-wise layers to keep in float32,
+            e.g., ["out_layer"]. Defaults to ().
+        inplace (bool, optional): quantize the network itself instead of a copy.
+            Defaults to False.
+
+    Returns:
+        (torch.nn.Module): the quantized network, in eval mode.
+    """
+    if not inplace:
+        network = copy.deepcopy(network)
+    bake_kernels(network.eval())
+    qconfig = int8_qconfig()
+
+    observed = {}
+    for name, module in pointwise_layers(network):
+        if name in skip:
+            continue
+        parent_name, _, attr = name.rpartition(".")
+        parent = network.get_submodule(parent_name)
+        if attr == "channel_mixer":
+            parent.fuse_mixer = False
+        observed[name] = ObservedLinear1d(module, qconfig)
+        setattr(parent, attr, observed[name])
+
+    calibrate(network, batches)
+
+    for name, module in observed.items():
+        parent_name, _, attr = name.rpartition(".")
+        setattr(network.get_submodule(parent_name), attr, QuantizedLinear1d(module))
+    return network
+
+
+def truncation_window(kernel: torch.Tensor, error_budget: float, causal: bool) -> slice:
+    """Shortest window of the last dimension of a 1D kernel, such that the energy
+    outside of it is at most error_budget^2 of the total, i.e., the relative L2
+    error of the truncated kernel is at most error_budget. Causal kernels keep their
+    end, the most recent lags, and centred kernels their centre.
+
+    Returns:
+        (slice): the window of the kernel to keep
+    """
+    energy = kernel.detach().double().pow(2).sum(dim=tuple(range(kernel.dim() - 1)))
+    size = energy.shape[0]
+    if not causal:
+        # Energy at each distance from the centre
+        centre = size // 2
+        distance = (torch.arange(size, device=energy.device) - centre).abs()
+        energy = energy.new_zeros(centre + 1).index_add_(0, distance, energy)
+    else:
+        energy = energy.flip(0)
+    # dropped[k]: energy beyond the first k + 1 lags (or distances), exactly zero
+    # for the last one
+    tail = torch.cumsum(energy.flip(0), dim=0).flip(0)
+    dropped = torch.cat([tail[1:], tail.new_zeros(1)])
+    allowed = error_budget**2 * tail[0]
+    keep = int(torch.nonzero(dropped <= allowed)[0]) + 1
+    if causal:
+        return slice(size - keep, size)
+    return slice(centre - (keep - 1), centre + keep)
+
+
+def _conv_time(conv, shape, kernel, layer, repeats: int) -> float:
+    x = torch.randn(shape, dtype=kernel.dtype, device=kernel.device)
+    times = []
+    with torch.no_grad():
+        for _ in range(repeats + 1):
+            start = time.perf_counter()
+            conv(x, kernel, layer.bias, separable=layer.separable, causal=layer.causal)
+            times.append(time.perf_counter() - start)
+    # The first run is a warmup
+    return min(times[1:])
+
+
+def truncate_kernels(
+    network: torch.nn.Module,
+    batches: Iterable,
+    error_budget: Union[float, Mapping[str, float]] = 1e-3,
+    fft_threshold: Optional[int] = None,
+    repeats: int = 3,
+) -> list:
+    """Truncates the baked kernels of the FlexConvs of a network to an error budget,
+    and selects the convolution of every layer for the truncated kernel.
+
+    Narrow masks leave most of a kernel close to zero, while dynamic cropping keeps
+    it down to `mask.threshold`. The kernels are baked on the first batch (see
+    `bake_kernels`) and every 1D kernel is cut to the shortest window whose relative
+    L2 error is within the budget of its layer, see `truncation_window`. With
+    conv.use_fft, short kernels then use the direct convolution and long ones the FFT:
+    either below and above fft_threshold, or, if None, whichever is faster for the
+    input shape of the first batch.
+
+    Args:
+        network (torch.nn.Module): the network, e.g., a ResNet_sequence.
+        batches (Iterable): (x, labels, lens) batches, of which the first is used.
+        error_budget (float or Mapping[str, float], optional): relative L2 error per
+            kernel, or per layer name; layers that are not named are not truncated.
+            Defaults to 1e-3.
+        fft_threshold (int, optional): length above which kernels use the FFT.
+            Defaults to None, timing both convolutions per layer.
+        repeats (int, optional): timed runs per convolution. Defaults to 3.
+
+    Returns:
+        (list): a dict per layer with its kernel length before and after truncation,
+            the retained energy and the selected convolution
+    """
+    layers = {
+        name: module
+        for name, module in network.named_modules()
+        if isinstance(module, FlexConvBase) and module.data_dim == 1
+    }
+    shapes = {}
+    handles = [
+        module.register_forward_pre_hook(
+            lambda module, args, name=name: shapes.setdefault(name, args[0].shape)
+        )
+        for name, module in layers.items()
+    ]
+    bake_kernels(network.eval())
+    x, _, lens = next(iter(batches))
+    try:
+        with torch.no_grad():
+            network(x, torch.as_tensor(lens))
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    report = []
+    for name, layer in layers.items():
+        if isinstance(error_budget, Mapping):
+            budget = error_budget.get(name, 0.0)
+        else:
+            budget = error_budget
+        kernel = layer.baked_kernel
+        if kernel is None:
+            # Not run on the first batch
+            continue
+        window = truncation_window(kernel, budget, layer.causal)
+        truncated = kernel[..., window].contiguous()
+        layer.baked_kernel = layer.conv_kernel = truncated
+        size = truncated.shape[-1]
+
+        times = {}
+        if not layer.conv_use_fft:
+            conv = "spatial"
+        elif fft_threshold is not None:
+            layer.fft_threshold = fft_threshold
+            conv = "fft" if size > fft_threshold else "spatial"
+        else:
+            for conv_type, fn in layer.conv_types.items():
+                times[conv_type] = _conv_time(fn, shapes[name], truncated, layer, repeats)
+            conv = min(times, key=times.get)
+            # Keeps the faster convolution for this kernel length
+            layer.fft_threshold = size - 1 if conv == "fft" else size
+        report.append(
+            {
+                "layer": name,
+                "kernel_length": kernel.shape[-1],
+                "truncated_length": size,
+                "retained_energy": (truncated.norm() ** 2 / kernel.norm() ** 2).item(),
+                "conv": conv,
+                **{f"{k}_ms": 1000.0 * v for k, v in times.items()},
+            }
+        )
+    return report
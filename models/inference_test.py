@@ -0,0 +1,25 @@
+from . import inference
+import torch
+
+
+def test_quantized_linear1d_matches_float():
+    torch.manual_seed(0)
+    linear = torch.nn.Conv1d(16, 8, kernel_size=1)
+    observed = inference.ObservedLinear1d(linear, inference.int8_qconfig())
+    x = torch.randn(4, 16, 50)
+    with torch.no_grad():
+        ref = observed(x)
+        out = inference.QuantizedLinear1d(observed)(x)
+    assert out.shape == ref.shape
+    assert ((out - ref).norm() / ref.norm()) < 0.05
+
+
+def test_truncation_window():
+    # Energy 4, 1 and 0.01 at lags 0, 1 and 2 of a causal kernel
+    kernel = torch.tensor([[[0.0, 0.1, 1.0, 2.0]]])
+    assert inference.truncation_window(kernel, 0.0, causal=True) == slice(1, 4)
+    assert inference.truncation_window(kernel, 0.05, causal=True) == slice(2, 4)
+    assert inference.truncation_window(kernel, 0.5, causal=True) == slice(3, 4)
+    # Centred kernels are truncated symmetrically
+    kernel = torch.tensor([[[0.01, 0.5, 2.0, 0.5, 0.01]]])
+    assert inference.truncation_window(kernel, 0.01, causal=False) == slice(1, 4)
@@ -5,18 +5,17 @@ import glob
 import hydra
 import torchmetrics
 from . import seqseq_utils
-from torchmetrics.classification import Accuracy, Recall, F1Score, AUROC, ROC
+from .metrics import HistogramMetrics, LogitSummary
 from pytorch_lightning.callbacks import Callback
 import sys
 from . import plotting
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 # project
 from optim import construct_optimizer, construct_scheduler
 import ckconv
-
-# logger
-import wandb
+from ckconv.utils import loggers
 
 # typing
 from omegaconf import OmegaConf
@@ -98,32 +97,39 @@ class LightningWrapperBase(pl.LightningModule):
                     self.logger.experiment.summary["no_params"] = no_params
                     self.no_params = no_params
 
-                    # Log code
-                    code = wandb.Artifact(
-                        f"source-code-{self.logger.experiment.name}", type="code"
-                    )
-                    # Get paths
-                    paths = glob.glob(
-                        hydra.utils.get_original_cwd() + "/**/*.py",
-                        recursive=True,
-                    )
-                    paths += glob.glob(
-                        hydra.utils.get_original_cwd() + "/**/*.yaml",
-                        recursive=True,
-                    )
-                    # Filter paths
-                    paths = list(filter(lambda x: "outputs" not in x, paths))
-                    paths = list(filter(lambda x: "venv" not in x, paths))
-                    paths = list(filter(lambda x: "wandb" not in x, paths))
-                    # Get all source files
-                    for path in paths:
-                        code.add_file(
-                            path,
-                            name=path.replace(f"{hydra.utils.get_original_cwd()}/", ""),
-                        )
-                    # Use the artifact
-                    if not self.logger.experiment.offline:
-                        wandb.run.use_artifact(code)
+                    # Log code, only to wandb
+                    if not isinstance(self.logger, loggers.LocalLogger):
+                        self._log_code()
+
+    def _log_code(self):
+        # Offline runs never upload the artifact, so don't collect it
+        if self.logger.experiment.offline:
+            return
+        import wandb
+
+        name = f"source-code-{self.logger.experiment.name}"
+        code = wandb.Artifact(name, type="code")
+        # Get paths
+        paths = glob.glob(
+            hydra.utils.get_original_cwd() + "/**/*.py",
+            recursive=True,
+        )
+        paths += glob.glob(
+            hydra.utils.get_original_cwd() + "/**/*.yaml",
+            recursive=True,
+        )
+        # Filter paths
+        paths = list(filter(lambda x: "outputs" not in x, paths))
+        paths = list(filter(lambda x: "venv" not in x, paths))
+        paths = list(filter(lambda x: "wandb" not in x, paths))
+        # Get all source files
+        for path in paths:
+            code.add_file(
+                path,
+                name=path.replace(f"{hydra.utils.get_original_cwd()}/", ""),
+            )
+        # Use the artifact
+        wandb.run.use_artifact(code)
 
 
 class ClassificationWrapper(LightningWrapperBase):
@@ -143,26 +149,13 @@ class ClassificationWrapper(LightningWrapperBase):
         self.multiclass = n_classes != 1
         self.seq_out = network.OUTPUT_TYPE == "sequence"
 
-        # Other metrics
+        # Other metrics. acc, recall, f1, auroc and roc are all derived at epoch end
+        # from a single histogram of scores, which is only synced once per epoch.
         task = "multiclass" if self.multiclass else "binary"
-
-        def make_metrics(stage, **kwargs):
-            metrics = {
-                "acc": Accuracy(**kwargs),
-                "recall": Recall(**kwargs),
-                "f1": F1Score(**kwargs),
-                "auroc": AUROC(thresholds=100, **kwargs),
-                "roc": ROC(thresholds=100, **kwargs),
-            }
-            # Each metric also has to be set as an attribute on the module
-            for name, metric in metrics.items():
-                setattr(self, f"{stage}_{name}", metric)
-            return metrics
-
-        kwargs = {"num_classes": n_classes, "task": task}
-        self.train_metrics = make_metrics("train", **kwargs)
-        self.val_metrics = make_metrics("val", **kwargs)
-        self.test_metrics = make_metrics("test", **kwargs)
+        kwargs = {"num_classes": n_classes, "task": task, "bins": 100}
+        self.train_metrics = HistogramMetrics(**kwargs)
+        self.val_metrics = HistogramMetrics(**kwargs)
+        self.test_metrics = HistogramMetrics(**kwargs)
 
         # loss_metric should accept (logits, labels) or
         #   (logits, labels, lens) if seq_out
@@ -189,8 +182,13 @@ class ClassificationWrapper(LightningWrapperBase):
         # Placeholders for logging of best train & validation values
         self.best_train_metrics = {}
         self.best_val_metrics = {}
-        self.train_step_outputs = []
-        self.validation_step_outputs = []
+        # Bounded summaries of the logits, used for the epoch-end histograms
+        logit_histogram_cfg = cfg.train.logit_histogram
+        self.train_logits = LogitSummary(**logit_histogram_cfg)
+        self.val_logits = LogitSummary(**logit_histogram_cfg)
+        # Disruptivity plots are rendered on a background thread
+        self._plot_executor = None
+        self._plot_future = None
 
     def _preprocess_batch(self, batch):
         if len(batch) < 3:
@@ -199,36 +197,42 @@ class ClassificationWrapper(LightningWrapperBase):
         else:
             return batch
 
-    def _step(self, batch, metrics_dict: dict, compute_metrics: bool = False):
+    def _step(
+        self,
+        batch,
+        metrics: HistogramMetrics,
+        unrolled: bool = False,
+    ):
         """Run a single step of the model
 
         Args:
             batch (Tensor): the batch to run the step on
-            metrics_dict (dict): The dictionary of metrics (self.train_metrics, etc...)
-            compute_metrics (bool, optional): Whether to compute the value of each
-                metric. Otherwise, we just call `.update` to update its internal state.
+            metrics (HistogramMetrics): The metrics of this stage (self.train_metrics,
+                etc...). Only its state is updated, metrics are computed at epoch end.
+            unrolled (bool, optional): Whether to also return the unrolled
+                (per-timestep) logits, taken from the same forward pass.
                 Defaults to False.
 
         Returns:
-            probalities (Tensor), logits (Tensor), loss (Tensor)
+            probalities (Tensor), logits (Tensor), loss (Tensor),
+            unrolled_logits (Tensor or None)
         """
         # batch can contain either x, labels or x, labels, lens
         x, labels, lens = self._preprocess_batch(batch)
-        logits = self.forward(x, lens)
+        unrolled_logits = None
+        if unrolled and not self.seq_out:
+            logits, unrolled_logits = self.network.forward_with_unrolled(x, lens)
+        else:
+            logits = self.forward(x, lens)
+            if unrolled:
+                # Sequence outputs are already per-timestep
+                unrolled_logits = logits
 
         # Probabilities
         probabilities = self.get_probabilities(logits, lens)
 
-        # Calculate metrics
-        for name, metric in metrics_dict.items():
-            # We don't want to compute roc on every step, since
-            # we only log it per epoch
-            if name == "roc":
-                metric.update(probabilities, labels.round().int())
-            elif not compute_metrics:
-                metric.update(probabilities, labels)
-            else:
-                metric(probabilities, labels)
+        # Update the metric state
+        metrics.update(probabilities.detach(), labels)
 
         # For binary classification, the labels must be float
         if not self.multiclass:
@@ -242,18 +246,28 @@ class ClassificationWrapper(LightningWrapperBase):
         else:
             loss = self.loss_metric(logits, labels)
         # Return predictions and loss
-        return probabilities, logits, loss
+        return probabilities, logits, loss, unrolled_logits
 
-    def _log_metrics(self, stage: str, metrics_dict, **kwargs):
-        for name, metric in metrics_dict.items():
+    def _log_metrics(self, stage: str, metrics: HistogramMetrics):
+        """Computes, logs and resets the metrics of a stage at epoch end.
+
+        Returns:
+            (dict): the computed metrics, see `HistogramMetrics.compute`
+        """
+        # The state is already reduced across processes by `compute`
+        values = metrics.compute()
+        metrics.reset()
+        for name, value in values.items():
             if name != "roc":  # we just log ROC plots
-                self.log(f"{stage}/{name}", metric, **kwargs)
+                self.log(f"{stage}/{name}", value, on_epoch=True)
+        fpr, tpr, _ = values["roc"]
+        roc = loggers.Figure(plotting.plot_roc, fpr, tpr)
+        loggers.log(self.logger.experiment, {f"{stage}/roc": roc})
+        return values
 
     def training_step(self, batch, batch_idx):
         # Perform step
-        predictions, logits, loss = self._step(
-            batch, self.train_metrics, compute_metrics=True
-        )
+        predictions, logits, loss, _ = self._step(batch, self.train_metrics)
         # Add regularization
         if self.weight_regularizer is not None:
             reg_loss = self.weight_regularizer(self.network)
@@ -262,77 +276,100 @@ class ClassificationWrapper(LightningWrapperBase):
         # Log metrics
         kwargs = {"on_step": True, "on_epoch": True, "sync_dist": self.distributed}
         self.log("train/loss", loss, prog_bar=True, **kwargs)
-        self._log_metrics("train", self.train_metrics, **kwargs)
-        # Store loss and logits for on_train_epoch_end
+        # Add logits to the histogram logged in on_train_epoch_end
         if self.seq_out:  # we do this to save memory, not sure the impact
             logits = torch.mean(logits, dim=-1)
-        self.train_step_outputs.append(
-            {"loss": loss + reg_loss, "logits": logits.detach()}
-        )
+        self.train_logits.update(logits)
         # Do I still need the logits in this?
         return {"loss": loss + reg_loss, "logits": logits.detach()}
 
     def validation_step(self, batch, batch_idx):
         # Perform step
+        dpcfg = self.disruptivity_plot_cfg
+        do_plot = dpcfg.enabled and dpcfg.batch_idx == batch_idx
         with torch.no_grad():
-            predictions, logits, loss = self._step(
-                batch, self.val_metrics, compute_metrics=False
+            predictions, logits, loss, unrolled_logits = self._step(
+                batch, self.val_metrics, unrolled=do_plot
             )
             # Log and return loss (Required in training step)
 
             kwargs = {"on_epoch": True, "sync_dist": self.distributed}
             self.log("val/loss", loss, **kwargs)
-            self._log_metrics("val", self.val_metrics, **kwargs)
 
             if self.seq_out:
                 logits = torch.mean(logits, dim=0)
 
-            # used to log histograms in validation_epoch_step
-            self.validation_step_outputs.append({"logits": logits})
-
-            # Do disruptivity plotting
-            dpcfg = self.disruptivity_plot_cfg
-            if dpcfg.enabled and dpcfg.batch_idx == batch_idx:
-                x, labels, lens = self._preprocess_batch(batch)
-                out = (
-                    self(x, lens)
-                    if self.seq_out
-                    else self.network.forward_unrolled(x, lens)
-                ).cpu()
-                fig = plotting.plot_disruption_predictions(out, batch, dpcfg)
-                self.logger.experiment.log({"val/disruptivity_plot": wandb.Image(fig)})
+            # used to log histograms in on_validation_epoch_end
+            self.val_logits.update(logits)
+
+            # Do disruptivity plotting, reusing the unrolled logits of this step
+            if do_plot:
+                _, labels, lens = self._preprocess_batch(batch)
+                self._log_disruptivity_plot(
+                    unrolled_logits.cpu(),
+                    labels.cpu(),
+                    torch.as_tensor(lens).cpu(),
+                )
 
             return logits
 
     def test_step(self, batch, batch_idx):
         # Perform step
-        predictions, _, loss = self._step(
-            batch, self.test_metrics, compute_metrics=False
-        )
+        predictions, _, loss, _ = self._step(batch, self.test_metrics)
         self.log("test/loss", loss, on_epoch=True, sync_dist=self.distributed)
-        self._log_metrics(
-            "test",
-            self.test_metrics,
-            on_epoch=True,
-            sync_dist=self.distributed,
+
+    def predict_step(self, batch, batch_idx, dataloader_idx=0):
+        """Returns the unrolled (per-timestep) logits of a batch, together with the
+        labels and lengths of its shots."""
+        x, labels, lens = self._preprocess_batch(batch)
+        if self.seq_out:
+            logits = self(x, lens)
+        else:
+            logits = self.network.forward_unrolled(x, lens)
+        return {"logits": logits, "labels": labels, "lengths": torch.as_tensor(lens)}
+
+    def _log_disruptivity_plot(self, out, labels, lens):
+        """Renders and logs a disruptivity plot on a background thread, so that
+        validation is not held up by matplotlib. At most one plot is in flight.
+        """
+        self._wait_for_disruptivity_plot()
+        if self._plot_executor is None:
+            self._plot_executor = ThreadPoolExecutor(max_workers=1)
+        experiment = self.logger.experiment
+        dpcfg = self.disruptivity_plot_cfg
+
+        figure = loggers.Figure(
+            plotting.plot_disruption_predictions, out, (None, labels, lens), dpcfg
         )
 
+        def render():
+            loggers.log(experiment, {"val/disruptivity_plot": figure})
+
+        self._plot_future = self._plot_executor.submit(render)
+
+    def _wait_for_disruptivity_plot(self):
+        # Re-raises any exception that occurred while rendering
+        if self._plot_future is not None:
+            future, self._plot_future = self._plot_future, None
+            future.result()
+
+    @staticmethod
+    def _logit_histogram(summary: LogitSummary):
+        return loggers.Histogram(summary.counts.cpu().numpy(), summary.edges().numpy())
+
     def on_train_epoch_end(self):
-        flattened_logits = torch.flatten(
-            torch.cat(
-                [step_output["logits"] for step_output in self.train_step_outputs]
-            )
-        )
-        self.logger.experiment.log(
+        loggers.log(
+            self.logger.experiment,
             {
-                "train/logits": wandb.Histogram(flattened_logits.to("cpu")),
-            }
+                "train/logits": self._logit_histogram(self.train_logits),
+            },
         )
-        # Log best accuracy
-        for name, _ in self.train_metrics.items():
+        self.train_logits.reset()
+        # Log metrics and best accuracy
+        values = self._log_metrics("train", self.train_metrics)
+        for name, this_epoch in values.items():
             if name == "roc":
                 continue
-            this_epoch = self.trainer.callback_metrics[f"train/{name}_epoch"]
             prev_best = self.best_train_metrics.get(name, None)
             if not prev_best or this_epoch > prev_best:
                 self.best_train_metrics[name] = this_epoch.item()
@@ -342,27 +379,22 @@ class ClassificationWrapper(LightningWrapperBase):
                     }
                 )
 
-        fig, _ = self.train_metrics["roc"].plot()
-        self.logger.experiment.log({"train/roc": fig})
-
-        self.train_step_outputs.clear()
-
     def on_validation_epoch_end(self):
-        # Gather logits from validation set and construct a histogram of them.
-        flattened_logits = torch.flatten(
-            torch.cat([output["logits"] for output in self.validation_step_outputs])
-        )
-        self.logger.experiment.log(
+        self._wait_for_disruptivity_plot()
+        # Log the histogram of the logits of the validation set.
+        loggers.log(
+            self.logger.experiment,
             {
-                "val/logits": wandb.Histogram(flattened_logits.to("cpu")),
-                "val/logit_max_abs_value": flattened_logits.abs().max().item(),
-            }
+                "val/logits": self._logit_histogram(self.val_logits),
+                "val/logit_max_abs_value": self.val_logits.max_abs.item(),
+            },
         )
-        # Log best accuracy
-        for name, _ in self.val_metrics.items():
+        self.val_logits.reset()
+        # Log metrics and best accuracy
+        values = self._log_metrics("val", self.val_metrics)
+        for name, this_epoch in values.items():
             if name == "roc":
                 continue
-            this_epoch = self.trainer.callback_metrics[f"val/{name}"]
             prev_best = self.best_val_metrics.get(name, None)
             if not prev_best or this_epoch > prev_best:
                 self.best_val_metrics[name] = this_epoch.item()
@@ -372,14 +404,8 @@ class ClassificationWrapper(LightningWrapperBase):
                     }
                 )
 
-        fig, _ = self.val_metrics["roc"].plot()
-        self.logger.experiment.log({"val/roc": fig})
-
-        self.validation_step_outputs.clear()
-
     def on_test_epoch_end(self):
-        fig, _ = self.test_metrics["roc"].plot()
-        self.logger.experiment.log({"test/roc": fig})
+        self._log_metrics("test", self.test_metrics)
 
     # This has a *args to ignore lengths if they get passed
     @staticmethod
@@ -0,0 +1,145 @@
+import torch
+from torchmetrics import Metric
+
+
+class HistogramMetrics(Metric):
+    """Streaming classification metrics derived from a single histogram of scores.
+
+    Every step adds the batch to one count buffer with a single `torch.bincount`.
+    Accuracy, recall, F1, AUROC and the ROC curve are all derived from these counts
+    when `compute` is called, which is also the only point where the state is
+    reduced across processes. Scores are binned in `bins` equal-width bins over
+    [0, 1], so the ROC curve is evaluated on `bins + 1` thresholds, as with
+    `torchmetrics.AUROC(thresholds=bins)`.
+
+    Layout of the count buffer:
+        binary: [2, bins], score histogram of the negatives and the positives.
+        multiclass: [C, 2, bins] one-vs-rest score histograms of every class,
+            followed by the [C, C] confusion matrix (target, prediction). Like
+            torchmetrics, multiclass accuracy, recall and F1 are macro averages.
+
+    Args:
+        num_classes (int): number of classes. 1 (or 2) means a binary task.
+        task (str): either "binary" or "multiclass".
+        bins (int, optional): number of score bins. Defaults to 100.
+    """
+
+    full_state_update = False
+
+    def __init__(self, num_classes: int, task: str, bins: int = 100, **kwargs):
+        super().__init__(**kwargs)
+        if task not in ["binary", "multiclass"]:
+            raise ValueError(f"Task {task} not supported.")
+        self.task = task
+        self.num_classes = num_classes if task == "multiclass" else 1
+        self.bins = bins
+        if task == "binary":
+            size = 2 * bins
+        else:
+            size = num_classes * 2 * bins + num_classes**2
+        self.add_state("counts", default=torch.zeros(size), dist_reduce_fx="sum")
+
+    def _bin(self, scores: torch.Tensor) -> torch.Tensor:
+        return (scores.float() * self.bins).long().clamp_(0, self.bins - 1)
+
+    def update(self, probabilities: torch.Tensor, labels: torch.Tensor):
+        """
+        Args:
+            probabilities (Tensor): [batch] scores for binary tasks, or [batch, C]
+                class probabilities for multiclass tasks.
+            labels (Tensor): [batch] targets.
+        """
+        labels = labels.reshape(-1).round().long()
+        if self.task == "binary":
+            index = labels * self.bins + self._bin(probabilities.reshape(-1))
+        else:
+            C, bins = self.num_classes, self.bins
+            classes = torch.arange(C, device=labels.device)
+            is_target = (labels.unsqueeze(-1) == classes).long()
+            hist_index = classes * 2 * bins + is_target * bins
+            hist_index = hist_index + self._bin(probabilities)
+            predictions = torch.argmax(probabilities, dim=-1)
+            confusion_index = C * 2 * bins + labels * C + predictions
+            index = torch.cat([hist_index.reshape(-1), confusion_index])
+        self.counts += torch.bincount(index, minlength=self.counts.numel()).to(
+            self.counts.dtype
+        )
+
+    def compute(self) -> dict:
+        """Returns a dict with the scalar metrics "acc", "recall", "f1" and "auroc",
+        and "roc": a tuple of (fpr, tpr, thresholds) tensors."""
+        if self.task == "binary":
+            hist = self.counts.view(1, 2, self.bins)
+        else:
+            C = self.num_classes
+            hist = self.counts[: C * 2 * self.bins].view(C, 2, self.bins)
+
+        # Counts at or above each threshold; thresholds are descending.
+        above = hist.flip(-1).cumsum(-1)
+        above = torch.cat([torch.zeros_like(above[..., :1]), above], dim=-1)
+        totals = hist.sum(-1, keepdim=True).clamp_min(1.0)
+        fpr = above[:, 0] / totals[:, 0]
+        tpr = above[:, 1] / totals[:, 1]
+        thresholds = torch.linspace(1.0, 0.0, self.bins + 1, device=hist.device)
+        auroc = torch.trapz(tpr, fpr, dim=-1).mean()
+
+        if self.task == "binary":
+            # Predictions are positive from the middle bin onwards, i.e. p >= 0.5
+            threshold_bin = self.bins - self.bins // 2
+            tp = above[0, 1, threshold_bin]
+            fp = above[0, 0, threshold_bin]
+            fn = totals[0, 1, 0] - tp
+            tn = totals[0, 0, 0] - fp
+            acc = (tp + tn) / (tp + tn + fp + fn).clamp_min(1.0)
+            recall = tp / (tp + fn).clamp_min(1.0)
+            f1 = 2 * tp / (2 * tp + fp + fn).clamp_min(1.0)
+            roc = (fpr[0], tpr[0], thresholds)
+        else:
+            confusion = self.counts[C * 2 * self.bins :].view(C, C)
+            tp = confusion.diagonal()
+            fn = confusion.sum(1) - tp
+            fp = confusion.sum(0) - tp
+            recall = (tp / (tp + fn).clamp_min(1.0)).mean()
+            acc = recall
+            f1 = (2 * tp / (2 * tp + fp + fn).clamp_min(1.0)).mean()
+            roc = (fpr, tpr, thresholds)
+
+        return {"acc": acc, "recall": recall, "f1": f1, "auroc": auroc, "roc": roc}
+
+
+class LogitSummary(torch.nn.Module):
+    """Bounded-memory summary of the logits seen during an epoch.
+
+    Keeps an online histogram over fixed edges in [-limit, limit], and the running
+    maximum absolute value. Logits outside of the range are counted in the outermost
+    bins. Updating costs one `torch.bincount` per step, and summarising at epoch end
+    costs O(bins), independent of the number of steps.
+
+    Args:
+        bins (int, optional): number of histogram bins. Defaults to 64.
+        limit (float, optional): the histogram covers [-limit, limit]. Defaults to 20.
+    """
+
+    def __init__(self, bins: int = 64, limit: float = 20.0):
+        super().__init__()
+        self.bins = bins
+        self.limit = limit
+        self.register_buffer("counts", torch.zeros(bins), persistent=False)
+        self.register_buffer("max_abs", torch.zeros(1), persistent=False)
+
+    @torch.no_grad()
+    def update(self, logits: torch.Tensor):
+        logits = logits.detach().reshape(-1).float()
+        if logits.numel() == 0:
+            return
+        index = (logits.clamp(-self.limit, self.limit) + self.limit) / (2 * self.limit)
+        index = (index * self.bins).long().clamp_(0, self.bins - 1)
+        self.counts += torch.bincount(index, minlength=self.bins).to(self.counts.dtype)
+        self.max_abs = torch.maximum(self.max_abs, logits.abs().max())
+
+    def edges(self) -> torch.Tensor:
+        return torch.linspace(-self.limit, self.limit, self.bins + 1)
+
+    def reset(self):
+        self.counts.zero_()
+        self.max_abs.zero_()
@@ -0,0 +1,72 @@
+from . import metrics
+import torch
+import torchmetrics
+
+BINS = 100
+
+
+def auroc_tolerance(scores, is_positive, bins: int = BINS) -> float:
+    """Bound of the binning error of the AUROC: a positive and a negative in the same
+    bin count as half a correctly ordered pair, which is off by at most 1/2."""
+    index = (scores * bins).long().clamp(0, bins - 1)
+    positives = torch.bincount(index[is_positive], minlength=bins).double()
+    negatives = torch.bincount(index[~is_positive], minlength=bins).double()
+    return 0.5 * (positives * negatives).sum().item() / (
+        positives.sum() * negatives.sum()
+    ).item()
+
+
+def test_binary_histogram_metrics():
+    torch.manual_seed(0)
+    labels = torch.randint(0, 2, (1000,))
+    probabilities = torch.sigmoid(2.0 * torch.randn(1000) + labels)
+    histogram = metrics.HistogramMetrics(num_classes=1, task="binary", bins=BINS)
+    for batch in zip(probabilities.split(64), labels.split(64)):
+        histogram.update(*batch)
+    values = histogram.compute()
+
+    # Derived from the same counts, so equal up to float rounding
+    functional = torchmetrics.functional.classification
+    torch.testing.assert_close(
+        values["acc"], functional.binary_accuracy(probabilities, labels)
+    )
+    torch.testing.assert_close(
+        values["recall"], functional.binary_recall(probabilities, labels)
+    )
+    torch.testing.assert_close(
+        values["f1"], functional.binary_f1_score(probabilities, labels)
+    )
+    auroc = functional.binary_auroc(probabilities, labels)
+    tolerance = auroc_tolerance(probabilities, labels.bool())
+    assert abs(values["auroc"].item() - auroc.item()) <= tolerance
+
+
+def test_multiclass_histogram_metrics():
+    torch.manual_seed(0)
+    C = 4
+    labels = torch.randint(0, C, (1000,))
+    logits = torch.randn(1000, C) + torch.nn.functional.one_hot(labels, C)
+    probabilities = torch.softmax(logits, dim=-1)
+    histogram = metrics.HistogramMetrics(num_classes=C, task="multiclass", bins=BINS)
+    for batch in zip(probabilities.split(64), labels.split(64)):
+        histogram.update(*batch)
+    values = histogram.compute()
+
+    # Macro averages, as in HistogramMetrics
+    functional = torchmetrics.functional.classification
+    kwargs = {"num_classes": C, "average": "macro"}
+    torch.testing.assert_close(
+        values["acc"], functional.multiclass_accuracy(probabilities, labels, **kwargs)
+    )
+    torch.testing.assert_close(
+        values["recall"], functional.multiclass_recall(probabilities, labels, **kwargs)
+    )
+    torch.testing.assert_close(
+        values["f1"], functional.multiclass_f1_score(probabilities, labels, **kwargs)
+    )
+    auroc = functional.multiclass_auroc(probabilities, labels, **kwargs)
+    # Macro average of the one-vs-rest AUROCs, and of their binning errors
+    tolerance = sum(
+        auroc_tolerance(probabilities[:, c], labels == c) for c in range(C)
+    ) / C
+    assert abs(values["auroc"].item() - auroc.item()) <= tolerance
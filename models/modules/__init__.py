@@ -1,2 +1,3 @@
 from .residual_block import TCNBlock, ResNetBlock, PreActResNetBlock
 from .s4_block import S4Block
+from .checkpoint import CheckpointedSequential
@@ -0,0 +1,64 @@
+# torch
+import torch
+
+# project
+from ckconv.utils.checkpoint import checkpoint
+
+
+class CheckpointedSequential(torch.nn.Sequential):
+    """A torch.nn.Sequential that checkpoints the activations of some of its modules
+    during training. Parameters are registered as in torch.nn.Sequential, so
+    checkpoints of either are interchangeable.
+
+    Args:
+        *modules: the modules to apply in order.
+        policy (str, optional): which modules to checkpoint. One of
+            "none": no module.
+            "all": every module.
+            "every_n": every n-th module, starting with the first.
+            "auto": every module whose input is larger than min_mb.
+            Defaults to "none".
+        every (int, optional): n of the "every_n" policy. Defaults to 1.
+        min_mb (float, optional): threshold of the "auto" policy. Defaults to 64.0.
+    """
+
+    POLICIES = ["none", "all", "every_n", "auto"]
+
+    def __init__(
+        self,
+        *modules: torch.nn.Module,
+        policy: str = "none",
+        every: int = 1,
+        min_mb: float = 64.0,
+    ):
+        super().__init__(*modules)
+        if policy not in self.POLICIES:
+            raise ValueError(
+                f"Checkpointing policy {policy} not recognized. Options: {self.POLICIES}"
+            )
+        self.policy = policy
+        self.every = every
+        self.min_mb = min_mb
+
+    def checkpointed(self, idx: int, x: torch.Tensor) -> bool:
+        if not (self.training and torch.is_grad_enabled()):
+            return False
+        if self.policy == "all":
+            return True
+        elif self.policy == "every_n":
+            return idx % self.every == 0
+        elif self.policy == "auto":
+            return (
+                isinstance(x, torch.Tensor)
+                and x.numel() * x.element_size() / 2**20 > self.min_mb
+            )
+        return False
+
+    def forward(self, x):
+        for idx, module in enumerate(self):
+            # Modules without parameters, e.g. pooling, are cheap to store
+            if self.checkpointed(idx, x) and any(True for _ in module.parameters()):
+                x = checkpoint(module, x)
+            else:
+                x = module(x)
+        return x
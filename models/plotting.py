@@ -1,7 +1,9 @@
 import torch
-import matplotlib.pyplot as plt
 import numpy as np
 
+# matplotlib is imported when a figure is rendered, see `ckconv.utils.loggers.Figure`,
+# so that runs that do not plot do not import it
+
 
 def plot_disruption_predictions(out: torch.Tensor, batch, cfg):
     """Generates a matplotlib plot of disruptino predictions from a batch of network
@@ -12,9 +14,15 @@ def plot_disruption_predictions(out: torch.Tensor, batch, cfg):
         out (torch.Tensor): tensor of shape [batch, seq_len]
         lens: the inputted batch tuple of (x, label, lens)
         cfg: the hydra disruption plotting config
+
+    The figure is created without pyplot, so this is safe to call from a background
+    thread.
     """
+    from matplotlib.figure import Figure
+
     _, labels, lens = batch
-    fig, ax = plt.subplots()
+    fig = Figure()
+    ax = fig.subplots()
     n_plot = min(out.shape[0], cfg.max_plots)
     for s_idx in range(n_plot):
         s_len = lens[s_idx]
@@ -28,3 +36,23 @@ def plot_disruption_predictions(out: torch.Tensor, batch, cfg):
             color="r" if labels[s_idx] == 1 else "g",
         )
     return fig
+
+
+def plot_roc(fpr: torch.Tensor, tpr: torch.Tensor):
+    """Generates a matplotlib plot of one or more ROC curves.
+
+    Args:
+        fpr (torch.Tensor): tensor of shape [n_thresholds] or [classes, n_thresholds]
+        tpr (torch.Tensor): tensor of the same shape as fpr
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.subplots()
+    fpr, tpr = fpr.cpu().view(-1, fpr.shape[-1]), tpr.cpu().view(-1, tpr.shape[-1])
+    for curve_fpr, curve_tpr in zip(fpr, tpr):
+        ax.plot(curve_fpr.numpy(), curve_tpr.numpy())
+    ax.plot([0, 1], [0, 1], linestyle="--", color="gray")
+    ax.set_xlabel("False positive rate")
+    ax.set_ylabel("True positive rate")
+    return fig
@@ -35,6 +35,7 @@ class ResNetBase(torch.nn.Module):
         downsampling = net_cfg.downsampling
         downsampling_size = net_cfg.downsampling_size
         nonlinearity = net_cfg.nonlinearity
+        checkpointing = net_cfg.get("checkpointing", {})
 
         self.data_type = net_cfg.data_type
 
@@ -135,7 +136,13 @@ class ResNetBase(torch.nn.Module):
             if i in downsampling:
                 blocks.append(DownsamplingType(kernel_size=downsampling_size))
 
-        self.blocks = torch.nn.Sequential(*blocks)
+        # Blocks whose activations are recomputed on backward, see CheckpointedSequential
+        self.blocks = modules.CheckpointedSequential(
+            *blocks,
+            policy=checkpointing.get("policy", "none"),
+            every=checkpointing.get("every", 1),
+            min_mb=checkpointing.get("min_mb", 64.0),
+        )
         # -------------------------
 
         # Define Output Layers:
@@ -180,8 +187,7 @@ class ResNet_sequence(ResNetBase):
         out = self.out_norm(out)
         return out
 
-    def forward(self, x, lens, *args):
-        out = self.__blocks_normed(x)
+    def __masked_mean(self, out, lens):
         # Combine masking and multiplying by the denominator for
         # an average of the sequence outputs
         mask = torch.zeros_like(out)
@@ -195,13 +201,26 @@ class ResNet_sequence(ResNetBase):
         out = self.out_layer(out)
         return out.squeeze(-1)
 
-    def forward_unrolled(self, x, *args):
-        out = self.__blocks_normed(x)
+    def __cumulative_mean(self, out):
         out = torch.cumsum(out, dim=-1)
         out = out / torch.arange(1, out.shape[-1] + 1, device=out.device)
         out = self.out_layer(out)
         return out.squeeze(-2)  # squeeze out channel dim
 
+    def forward(self, x, lens, *args):
+        out = self.__blocks_normed(x)
+        return self.__masked_mean(out, lens)
+
+    def forward_unrolled(self, x, *args):
+        out = self.__blocks_normed(x)
+        return self.__cumulative_mean(out)
+
+    def forward_with_unrolled(self, x, lens, *args):
+        """Returns the outputs of `forward` and `forward_unrolled`, computed from a
+        single pass through the blocks."""
+        out = self.__blocks_normed(x)
+        return self.__masked_mean(out, lens), self.__cumulative_mean(out)
+
 
 class ResNetSeq_sequence(ResNetBase):
     """ResNetSeq is a resnet-style s4 network which outputs result of the S4 blocks"""
@@ -0,0 +1,204 @@
+import torch
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class _ShotState:
+    """The samples received so far for one shot, in a preallocated buffer."""
+
+    def __init__(self, max_length: int, channels: int):
+        self.buffer = torch.zeros(max_length, channels)
+        self.length = 0
+
+    def append(self, samples: torch.Tensor):
+        end = self.length + samples.shape[0]
+        if end > self.buffer.shape[0]:
+            raise ValueError(
+                f"Shot exceeds the maximum length of {self.buffer.shape[0]} samples."
+            )
+        self.buffer[self.length : end] = samples
+        self.length = end
+        return end
+
+
+_Request = collections.namedtuple(
+    "_Request", ["shot_id", "samples", "future", "submitted"]
+)
+
+
+class MicroBatchingScorer:
+    """In-process server that scores live shots with a `ResNet_sequence`.
+
+    Clients stream the samples of a shot with `submit` (or the blocking `score`),
+    from any number of threads. A single batching thread coalesces the requests that
+    arrive within `max_wait` seconds of each other (at most `max_batch_size`) into
+    one forward pass of `forward_unrolled`, and resolves each request with the
+    disruptivity (sigmoid of the unrolled logit) at its last sample. Requests of the
+    same shot are applied in the order in which they were submitted.
+
+    Every shot keeps the samples received so far, since the causal convolutions and
+    the cumulative mean of `forward_unrolled` depend on the whole history. Call
+    `end_shot` to release them.
+
+    Args:
+        network (torch.nn.Module): a network with a `forward_unrolled` method.
+        max_batch_size (int, optional): maximum number of requests per forward.
+            Defaults to 64.
+        max_wait (float, optional): coalescing window in seconds. Defaults to 0.005.
+        max_length (int, optional): maximum number of samples per shot.
+            Defaults to 2048.
+        latency_window (int, optional): number of latest requests used for the
+            latency percentiles. Defaults to 10000.
+    """
+
+    def __init__(
+        self,
+        network: torch.nn.Module,
+        max_batch_size: int = 64,
+        max_wait: float = 0.005,
+        max_length: int = 2048,
+        latency_window: int = 10000,
+    ):
+        self.network = network.eval()
+        self.channels = network.conv1.in_channels
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_length = max_length
+
+        self._queue = queue.Queue()
+        self._shots = {}
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._batch_sizes = collections.deque(maxlen=latency_window)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, shot_id, samples) -> Future:
+        """Adds samples of shape [n, channels] to a shot. Returns a future resolving
+        to the disruptivity of the shot after its last sample."""
+        if self._closed:
+            raise RuntimeError("The scorer has been closed.")
+        samples = torch.as_tensor(samples, dtype=torch.float32)
+        samples = samples.reshape(-1, self.channels)
+        if samples.shape[0] == 0:
+            raise ValueError("At least one sample must be submitted.")
+        future = Future()
+        self._queue.put(_Request(shot_id, samples, future, time.perf_counter()))
+        return future
+
+    def score(self, shot_id, samples) -> float:
+        """Blocking version of `submit`."""
+        return self.submit(shot_id, samples).result()
+
+    def end_shot(self, shot_id):
+        """Releases the state of a shot, after its pending requests are scored."""
+        self._queue.put(_Request(shot_id, None, None, time.perf_counter()))
+
+    def close(self):
+        """Scores all pending requests and stops the batching thread."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)) -> dict:
+        """Returns the latency of the latest requests in milliseconds, from
+        submission to result, for each of the given percentiles."""
+        latencies = torch.tensor(list(self._latencies), dtype=torch.float64)
+        if latencies.numel() == 0:
+            return {p: float("nan") for p in percentiles}
+        q = torch.tensor(percentiles, dtype=torch.float64) / 100.0
+        values = torch.quantile(latencies, q) * 1000.0
+        return {p: v.item() for p, v in zip(percentiles, values)}
+
+    def mean_batch_size(self) -> float:
+        if not self._batch_sizes:
+            return float("nan")
+        return sum(self._batch_sizes) / len(self._batch_sizes)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            request = self._queue.get()
+            if request is None:
+                break
+            batch = [request]
+            # Coalesce the requests that arrive within the window.
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    request = self._queue.get(timeout=max(timeout, 0.0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+            self._process(batch)
+        # Score whatever is still pending before stopping.
+        pending = []
+        while not self._queue.empty():
+            request = self._queue.get()
+            if request is not None:
+                pending.append(request)
+        if pending:
+            self._process(pending)
+
+    def _process(self, batch: list):
+        # 1. Update the state of each shot, in submission order.
+        scored = []
+        for request in batch:
+            if request.samples is None:
+                # Ended shots are released after this batch has been scored.
+                scored.append((request, None))
+                continue
+            state = self._shots.get(request.shot_id)
+            if state is None:
+                state = _ShotState(self.max_length, self.channels)
+                self._shots[request.shot_id] = state
+            try:
+                end = state.append(request.samples)
+            except ValueError as e:
+                request.future.set_exception(e)
+                continue
+            scored.append((request, end))
+
+        # 2. One forward pass over the padded histories of all shots in the batch.
+        shot_ids = list(dict.fromkeys(r.shot_id for r, end in scored if end is not None))
+        rows = {shot_id: i for i, shot_id in enumerate(shot_ids)}
+        if shot_ids:
+            states = [self._shots[shot_id] for shot_id in shot_ids]
+            lengths = torch.tensor([state.length for state in states])
+            x = torch.zeros(len(states), lengths.max(), self.channels)
+            for i, state in enumerate(states):
+                x[i, : state.length] = state.buffer[: state.length]
+            try:
+                with torch.no_grad():
+                    scores = torch.sigmoid(
+                        self.network.forward_unrolled(x.transpose(1, 2), lengths)
+                    )
+            except Exception as e:
+                for request, end in scored:
+                    if end is not None:
+                        request.future.set_exception(e)
+                scored = [(r, end) for r, end in scored if end is None]
+
+        # 3. Resolve the futures and release ended shots.
+        now = time.perf_counter()
+        for request, end in scored:
+            if end is None:
+                self._shots.pop(request.shot_id, None)
+                continue
+            request.future.set_result(scores[rows[request.shot_id], end - 1].item())
+            self._latencies.append(now - request.submitted)
+        self._batch_sizes.append(len(batch))
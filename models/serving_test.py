@@ -0,0 +1,56 @@
+from . import serving
+import threading
+import torch
+
+
+class CumulativeMean(torch.nn.Module):
+    """Causal toy network: the cumulative mean of a point-wise layer."""
+
+    def __init__(self, channels: int):
+        super().__init__()
+        self.conv1 = torch.nn.Conv1d(channels, 1, kernel_size=1)
+
+    def forward_unrolled(self, x, lens):
+        out = self.conv1(x)[:, 0]
+        steps = torch.arange(1, out.shape[-1] + 1, dtype=out.dtype)
+        return torch.cumsum(out, dim=-1) / steps
+
+
+def test_micro_batching_scorer():
+    torch.manual_seed(0)
+    network = CumulativeMean(channels=3)
+    shots = {shot_id: torch.randn(20, 3) for shot_id in ["a", "b", "c", "d"]}
+    # Every shot is streamed in chunks of 4, 1 and 15 samples
+    chunks = [slice(0, 4), slice(4, 5), slice(5, 20)]
+
+    def expected(shot_id, end):
+        history = shots[shot_id][:end].T.unsqueeze(0)
+        with torch.no_grad():
+            logits = network.forward_unrolled(history, torch.tensor([end]))
+        return torch.sigmoid(logits)[0, -1].item()
+
+    # A long coalescing window, closed by max_batch_size once every shot submitted
+    scorer = serving.MicroBatchingScorer(
+        network, max_batch_size=len(shots), max_wait=5.0, max_length=32
+    )
+    for chunk in chunks:
+        barrier = threading.Barrier(len(shots))
+        results = {}
+
+        def client(shot_id):
+            barrier.wait()
+            results[shot_id] = scorer.score(shot_id, shots[shot_id][chunk])
+
+        threads = [threading.Thread(target=client, args=(s,)) for s in shots]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for shot_id, result in results.items():
+            assert abs(result - expected(shot_id, chunk.stop)) < 1e-6
+    # One forward pass per round of requests
+    assert list(scorer._batch_sizes) == [len(shots)] * len(chunks)
+
+    scorer.end_shot("a")
+    scorer.close()
+    assert sorted(scorer._shots) == ["b", "c", "d"]
@@ -0,0 +1,233 @@
+# torch
+import torch
+import torch.multiprocessing
+
+# project
+from dataset_constructor import construct_datamodule
+from model_constructor import construct_model
+from datamodules.lucas import collate_fn
+from models.alarms import first_crossings
+from models.checkpoint_io import load_checkpoint
+from models.inference import quantize_network, truncate_kernels
+
+# built-in
+import copy
+import itertools
+import os
+import time
+import numpy as np
+
+# Configs
+import hydra
+from omegaconf import OmegaConf
+
+
+@hydra.main(config_path="cfg", config_name="config.yaml", version_base="1.3")
+def main(
+    cfg: OmegaConf,
+):
+    """Scores shots offline with a trained checkpoint.
+
+    Every shot is run through `forward_unrolled`, and its per-timestep disruptivity
+    (sigmoid of the unrolled logits) and first alarm time are written to npz shards
+    in `score.output_dir`. Shots are sorted by length and grouped into buckets of at
+    most `score.max_timesteps_per_batch` padded timesteps, and the buckets are spread
+    over `score.workers` processes.
+
+    Example:
+        python score.py score.checkpoint=path/to/model.ckpt score.split=all
+    """
+    OmegaConf.set_struct(cfg, False)
+    score_cfg = cfg.score
+    if not score_cfg.checkpoint:
+        raise ValueError("score.checkpoint must point to a model checkpoint.")
+    cfg.train.avail_gpus = torch.cuda.device_count()
+
+    # Construct data_module
+    datamodule = construct_datamodule(cfg)
+    datamodule.prepare_data()
+    datamodule.setup()
+    dataset = get_scoring_dataset(datamodule, score_cfg.split)
+
+    # Construct model and load the checkpoint
+    network = load_network(cfg, datamodule, score_cfg.checkpoint)
+    if str(score_cfg.precision) == "int8":
+        # Calibrated on the first batches of the validation set
+        calibration = itertools.islice(
+            datamodule.val_dataloader(), score_cfg.calibration_batches
+        )
+        network = quantize_network(network, calibration, inplace=True)
+    if score_cfg.kernel_error_budget > 0.0:
+        # The kernels are baked on the first validation batch
+        report = truncate_kernels(
+            network, datamodule.val_dataloader(), score_cfg.kernel_error_budget
+        )
+        for layer in report:
+            print(
+                f"{layer['layer']}: kernel truncated from {layer['kernel_length']} "
+                f"to {layer['truncated_length']}, {layer['conv']} convolution."
+            )
+
+    # Group shots of similar length
+    lengths = [dataset.metas[i]["shot_len"] for i in range(len(dataset))]
+    buckets = length_buckets(lengths, score_cfg.max_timesteps_per_batch)
+
+    # Spread the buckets over the workers
+    no_workers = max(1, min(score_cfg.workers, len(buckets)))
+    threads = score_cfg.threads_per_worker
+    if threads == -1:
+        threads = max(1, os.cpu_count() // no_workers)
+    worker_buckets = balance_buckets(buckets, lengths, no_workers)
+
+    os.makedirs(score_cfg.output_dir, exist_ok=True)
+    print(
+        f"Scoring {len(dataset)} shots in {len(buckets)} batches "
+        f"with {no_workers} worker(s) of {threads} thread(s)."
+    )
+    start = time.perf_counter()
+    if no_workers == 1:
+        score_buckets(0, network, dataset, worker_buckets[0], score_cfg, threads)
+    else:
+        # Forked workers share the network and dataset with this process.
+        ctx = torch.multiprocessing.get_context("fork")
+        processes = [
+            ctx.Process(
+                target=score_buckets,
+                args=(rank, network, dataset, worker_buckets[rank], score_cfg, threads),
+            )
+            for rank in range(no_workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        failed = [p.exitcode for p in processes if p.exitcode != 0]
+        if failed:
+            raise RuntimeError(f"{len(failed)} scoring worker(s) failed.")
+    elapsed = time.perf_counter() - start
+    print(
+        f"Scored {len(dataset)} shots ({sum(lengths)} timesteps) in {elapsed:.1f}s. "
+        f"Output written to {os.path.abspath(score_cfg.output_dir)}"
+    )
+
+
+def load_network(cfg: OmegaConf, datamodule, checkpoint_path: str):
+    """Constructs the network of the config and loads the weights of a Lightning
+    checkpoint into it. The network is returned in eval mode."""
+    model = construct_model(cfg, datamodule)
+    # Incremental checkpoints are memory mapped
+    checkpoint = load_checkpoint(checkpoint_path, map_location="cpu")
+    model.load_state_dict(checkpoint["state_dict"])
+    return model.network.eval()
+
+
+def get_scoring_dataset(datamodule, split: str):
+    """Returns a copy of the dataset of the given split, without length
+    augmentation. split "all" concatenates the train, validation and test sets. The
+    datasets of the datamodule are left untouched."""
+    if split == "all":
+        splits = ["train", "val", "test"]
+    elif split in ["train", "val", "test"]:
+        splits = [split]
+    else:
+        raise ValueError(f"Split {split} not recognized.")
+    datasets = [getattr(datamodule, f"{s}_dataset") for s in splits]
+    # A shallow copy shares the shots, but not the lists that hold them
+    dataset = copy.copy(datasets[0])
+    dataset.xs = [x for d in datasets for x in d.xs]
+    dataset.ys = [y for d in datasets for y in d.ys]
+    dataset.metas = [meta for d in datasets for meta in d.metas]
+    dataset.len_aug = False
+    return dataset
+
+
+def length_buckets(lengths: list, max_timesteps: int) -> list:
+    """Sorts shots by length and greedily groups them into batches, such that the
+    padded size (batch size * longest shot) of a batch stays below max_timesteps.
+
+    Returns:
+        (list): a list of lists of dataset indices
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    buckets, bucket = [], []
+    for i in order:
+        # Shots are sorted, so the current one is the longest of the bucket
+        if bucket and (len(bucket) + 1) * lengths[i] > max_timesteps:
+            buckets.append(bucket)
+            bucket = []
+        bucket.append(i)
+    if bucket:
+        buckets.append(bucket)
+    return buckets
+
+
+def balance_buckets(buckets: list, lengths: list, no_workers: int) -> list:
+    """Assigns buckets to workers, largest first, to the least loaded worker."""
+    costs = [len(b) * max(lengths[i] for i in b) for b in buckets]
+    loads = [0] * no_workers
+    assignment = [[] for _ in range(no_workers)]
+    for idx in sorted(range(len(buckets)), key=lambda i: -costs[i]):
+        worker = loads.index(min(loads))
+        assignment[worker].append(buckets[idx])
+        loads[worker] += costs[idx]
+    return assignment
+
+
+def score_buckets(rank, network, dataset, buckets, score_cfg, threads):
+    """Runs the buckets of one worker through the network and writes shards of
+    `score_cfg.shard_size` shots to `score_cfg.output_dir`."""
+    torch.set_num_threads(threads)
+    shard = []
+    shard_idx = 0
+    # bf16 autocasts as train.precision=bf16 does, the FFTs stay in float32. int8
+    # networks are quantized in main.
+    bf16 = str(score_cfg.precision) == "bf16"
+    with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16, enabled=bf16):
+        for bucket in buckets:
+            x, labels, lens = collate_fn([dataset[i] for i in bucket])
+            lens = torch.as_tensor(lens)
+            scores = torch.sigmoid(network.forward_unrolled(x, lens).float())
+            alarms = first_crossings(
+                scores,
+                lens,
+                thresholds=torch.tensor([score_cfg.alarm_threshold]),
+                min_time=score_cfg.alarm_min_time,
+            )[:, 0]
+            for j, i in enumerate(bucket):
+                meta = dataset.metas[i]
+                shard.append(
+                    (
+                        meta["ind"],
+                        meta["machine"],
+                        labels[j].item(),
+                        scores[j, : lens[j]],
+                        alarms[j].item(),
+                    )
+                )
+            if len(shard) >= score_cfg.shard_size:
+                write_shard(shard, score_cfg.output_dir, rank, shard_idx)
+                shard, shard_idx = [], shard_idx + 1
+    if shard:
+        write_shard(shard, score_cfg.output_dir, rank, shard_idx)
+
+
+def write_shard(shard: list, output_dir: str, rank: int, shard_idx: int):
+    """Writes a shard of scored shots as columns to an npz file. The ragged time
+    series are concatenated in `scores`; shot i spans
+    `scores[offsets[i]:offsets[i + 1]]`."""
+    shot_ids, machines, labels, scores, alarms = zip(*shard)
+    lengths = np.array([len(s) for s in scores], dtype=np.int64)
+    np.savez(
+        os.path.join(output_dir, f"scores-{rank:03d}-{shard_idx:05d}.npz"),
+        shot_ids=np.array(shot_ids),
+        machines=np.array(machines),
+        labels=np.array(labels, dtype=np.float32),
+        lengths=lengths,
+        offsets=np.concatenate([[0], np.cumsum(lengths)]),
+        scores=torch.cat(scores).numpy().astype(np.float32),
+        alarm_times=np.array(alarms, dtype=np.int64),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import score
+import numpy as np
+import os
+import torch
+import types
+
+
+def test_length_buckets():
+    lengths = [50, 10, 30, 200, 10, 40, 20]
+    buckets = score.length_buckets(lengths, max_timesteps=100)
+    # Every shot once, in order of length
+    order = [i for bucket in buckets for i in bucket]
+    assert sorted(order) == list(range(len(lengths)))
+    assert [lengths[i] for i in order] == sorted(lengths)
+    for bucket in buckets:
+        padded = len(bucket) * max(lengths[i] for i in bucket)
+        # A shot over the budget is alone in its bucket
+        assert padded <= 100 or len(bucket) == 1
+    assert [3] in buckets
+
+
+def test_balance_buckets():
+    lengths = [5, 10, 20, 40, 80, 80, 30]
+    buckets = score.length_buckets(lengths, max_timesteps=80)
+    assignment = score.balance_buckets(buckets, lengths, no_workers=3)
+    assert len(assignment) == 3
+    assigned = [bucket for worker in assignment for bucket in worker]
+    assert sorted(assigned) == sorted(buckets)
+
+
+def test_write_shard_round_trip(tmp_path):
+    shard = [
+        (7, "cmod", 1.0, torch.tensor([0.1, 0.2, 0.9]), 2),
+        (3, "d3d", 0.0, torch.tensor([0.3]), -1),
+        (12, "east", 0.0, torch.tensor([0.0, 0.4, 0.5, 0.2, 0.1]), -1),
+    ]
+    score.write_shard(shard, tmp_path, rank=1, shard_idx=4)
+    out = np.load(os.path.join(tmp_path, "scores-001-00004.npz"))
+    assert out["shot_ids"].tolist() == [7, 3, 12]
+    assert out["machines"].tolist() == ["cmod", "d3d", "east"]
+    assert out["alarm_times"].tolist() == [2, -1, -1]
+    assert out["lengths"].tolist() == [3, 1, 5]
+    offsets = out["offsets"]
+    for i, (_, _, _, scores, _) in enumerate(shard):
+        np.testing.assert_array_equal(
+            out["scores"][offsets[i] : offsets[i + 1]], scores.numpy()
+        )
+
+
+def test_get_scoring_dataset_keeps_datamodule_datasets():
+    def dataset(name, n):
+        return types.SimpleNamespace(
+            xs=[f"{name}{i}" for i in range(n)],
+            ys=[0.0] * n,
+            metas=[{"ind": f"{name}{i}"} for i in range(n)],
+            len_aug=True,
+        )
+
+    datamodule = types.SimpleNamespace(
+        train_dataset=dataset("train", 3),
+        val_dataset=dataset("val", 1),
+        test_dataset=dataset("test", 2),
+    )
+    scored = score.get_scoring_dataset(datamodule, "all")
+    assert scored.xs == ["train0", "train1", "train2", "val0", "test0", "test1"]
+    assert len(scored.metas) == len(scored.ys) == 6
+    assert not scored.len_aug
+    assert len(datamodule.train_dataset.xs) == 3
+    assert datamodule.train_dataset.len_aug
@@ -0,0 +1,80 @@
+# torch
+import torch
+
+# project
+from dataset_constructor import construct_datamodule
+from models.serving import MicroBatchingScorer
+from score import load_network, get_scoring_dataset
+
+# built-in
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Configs
+import hydra
+from omegaconf import OmegaConf
+
+
+@hydra.main(config_path="cfg", config_name="config.yaml", version_base="1.3")
+def main(
+    cfg: OmegaConf,
+):
+    """Load generator for the live scoring server.
+
+    Replays `serve.no_shots` shots of a split of the Lucas dataset against a
+    `MicroBatchingScorer`, with `serve.concurrency` shots streaming at the same time
+    in chunks of `serve.chunk_size` samples, and reports the throughput, the mean
+    batch size and the latency percentiles.
+
+    Example:
+        python serve.py serve.checkpoint=path/to/model.ckpt serve.concurrency=32
+    """
+    OmegaConf.set_struct(cfg, False)
+    serve_cfg = cfg.serve
+    if not serve_cfg.checkpoint:
+        raise ValueError("serve.checkpoint must point to a model checkpoint.")
+    cfg.train.avail_gpus = torch.cuda.device_count()
+    if serve_cfg.threads != -1:
+        torch.set_num_threads(serve_cfg.threads)
+
+    # Construct data_module and model
+    datamodule = construct_datamodule(cfg)
+    datamodule.prepare_data()
+    datamodule.setup()
+    dataset = get_scoring_dataset(datamodule, serve_cfg.split)
+    network = load_network(cfg, datamodule, serve_cfg.checkpoint)
+
+    no_shots = min(serve_cfg.no_shots, len(dataset))
+    scorer = MicroBatchingScorer(
+        network,
+        max_batch_size=serve_cfg.max_batch_size,
+        max_wait=serve_cfg.max_wait_ms / 1000.0,
+        max_length=max(len(x) for x in dataset.xs),
+    )
+
+    def replay(idx):
+        x = dataset.xs[idx]
+        for start in range(0, len(x), serve_cfg.chunk_size):
+            scorer.score(idx, x[start : start + serve_cfg.chunk_size])
+            if serve_cfg.interval_ms > 0:
+                time.sleep(serve_cfg.interval_ms / 1000.0)
+        scorer.end_shot(idx)
+        return len(x)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=serve_cfg.concurrency) as pool:
+        timesteps = sum(pool.map(replay, range(no_shots)))
+    elapsed = time.perf_counter() - start
+    scorer.close()
+
+    percentiles = scorer.latency_percentiles((50, 90, 99))
+    print(
+        f"Replayed {no_shots} shots ({timesteps} timesteps) in {elapsed:.1f}s: "
+        f"{timesteps / elapsed:.0f} timesteps/s, "
+        f"mean batch size {scorer.mean_batch_size():.1f}.\n"
+        + ", ".join(f"p{p} {v:.2f} ms" for p, v in percentiles.items())
+    )
+
+
+if __name__ == "__main__":
+    main()
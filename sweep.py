@@ -0,0 +1,228 @@
+# torch
+import torch
+import torch.multiprocessing
+import pytorch_lightning as pl
+
+# project
+from dataset_constructor import construct_datamodule
+from model_constructor import construct_model
+from trainer_constructor import construct_logger, construct_trainer
+
+# built-in
+import copy
+import itertools
+import json
+import os
+import random
+import time
+import yaml
+from multiprocessing.connection import wait
+
+# Configs
+import hydra
+from omegaconf import OmegaConf
+
+
+@hydra.main(config_path="cfg", config_name="config.yaml", version_base="1.3")
+def main(
+    cfg: OmegaConf,
+):
+    """Runs a sweep of trainings in parallel on the cores of this machine.
+
+    The configs are the combinations of `sweep.grid`, or `sweep.samples` of them
+    drawn at random, applied on top of the config of the command line. The Lucas
+    data is loaded and split once per distinct `dataset.*` config, before forking,
+    so runs share it with this process. Every run is forked with its own, disjoint,
+    set of `sweep.cores_per_worker` cores, and its final metrics are appended to
+    `sweep.output_dir/results.jsonl`.
+
+    Example:
+        python sweep.py 'sweep.grid=["net.no_hidden=64,140", "optimizer.lr=0.01,0.02"]'
+    """
+    OmegaConf.set_struct(cfg, False)
+    sweep_cfg = cfg.sweep
+    cfg.train.avail_gpus = 0
+    cfg.device = "cpu"
+
+    runs = sweep_configs(cfg, sweep_cfg.grid, sweep_cfg.samples, sweep_cfg.seed)
+    core_sets = split_cores(sweep_cfg.workers, sweep_cfg.cores_per_worker)
+
+    # Load the data of every distinct dataset config once, shared by the forks
+    datamodules = {}
+    for _, run_cfg in runs:
+        key = dataset_key(run_cfg)
+        if key not in datamodules:
+            datamodules[key] = construct_datamodule(copy.deepcopy(run_cfg))
+            datamodules[key].prepare_data()
+            datamodules[key].setup()
+
+    os.makedirs(sweep_cfg.output_dir, exist_ok=True)
+    results_path = os.path.join(sweep_cfg.output_dir, "results.jsonl")
+    print(
+        f"Sweeping {len(runs)} configs with {len(core_sets)} worker(s) of "
+        f"{len(core_sets[0])} core(s)."
+    )
+
+    ctx = torch.multiprocessing.get_context("fork")
+    pending = list(enumerate(runs))
+    running = {}  # sentinel -> (process, receiver, cores, run idx, overrides, start)
+    free_cores = list(core_sets)
+    results = []
+    while pending or running:
+        # Start runs on the free core sets
+        while pending and free_cores:
+            idx, (overrides, run_cfg) = pending.pop(0)
+            cores = free_cores.pop(0)
+            receiver, sender = ctx.Pipe(duplex=False)
+            run_dir = os.path.join(sweep_cfg.output_dir, f"run-{idx:04d}")
+            datamodule = datamodules[dataset_key(run_cfg)]
+            process = ctx.Process(
+                target=run_worker,
+                args=(run_cfg, datamodule, cores, run_dir, sender),
+            )
+            process.start()
+            sender.close()
+            running[process.sentinel] = (
+                process,
+                receiver,
+                cores,
+                idx,
+                overrides,
+                time.perf_counter(),
+            )
+
+        # Collect the runs that finished
+        for sentinel in wait(list(running)):
+            process, receiver, cores, idx, overrides, start = running.pop(sentinel)
+            try:
+                metrics = receiver.recv()
+            except EOFError:
+                # The run crashed or was killed
+                metrics = None
+            process.join()
+            free_cores.append(cores)
+            result = {
+                "run": idx,
+                "overrides": overrides,
+                "status": "failed" if metrics is None else "done",
+                "elapsed_s": time.perf_counter() - start,
+                **(metrics or {}),
+            }
+            results.append(result)
+            with open(results_path, "a") as f:
+                f.write(json.dumps(result) + "\n")
+            print(f"[{len(results)}/{len(runs)}] {result}")
+
+    failed = [r for r in results if r["status"] != "done"]
+    print(
+        f"Sweep finished: {len(results) - len(failed)} done, {len(failed)} failed. "
+        f"Results written to {os.path.abspath(results_path)}"
+    )
+
+
+def parse_grid(grid: list) -> dict:
+    """Parses a grid of Hydra-style sweep overrides, e.g.,
+    ["net.no_hidden=64,140", "optimizer.lr=0.01,0.02"], into a dict of key -> values.
+    """
+    parsed = {}
+    for override in grid:
+        key, values = override.split("=", 1)
+        parsed[key] = [yaml.safe_load(value) for value in values.split(",")]
+    return parsed
+
+
+def sweep_configs(cfg: OmegaConf, grid: list, samples: int, seed: int) -> list:
+    """The configs of a sweep: every combination of the grid, or `samples` of them
+    drawn at random without replacement if samples != -1.
+
+    Returns:
+        (list): a list of (overrides, config) tuples
+    """
+    parsed = parse_grid(grid)
+    keys = list(parsed)
+    combinations = list(itertools.product(*parsed.values()))
+    if samples != -1:
+        combinations = random.Random(seed).sample(
+            combinations, min(samples, len(combinations))
+        )
+    runs = []
+    for values in combinations:
+        run_cfg = copy.deepcopy(cfg)
+        for key, value in zip(keys, values):
+            OmegaConf.update(run_cfg, key, value, force_add=True)
+        overrides = " ".join(f"{k}={v}" for k, v in zip(keys, values))
+        runs.append((overrides, run_cfg))
+    return runs
+
+
+def split_cores(workers: int, cores_per_worker: int) -> list:
+    """Splits the cores available to this process into disjoint sets, one per
+    worker. cores_per_worker = -1 divides all cores over the workers."""
+    cores = sorted(os.sched_getaffinity(0))
+    workers = max(1, min(workers, len(cores)))
+    if cores_per_worker == -1:
+        cores_per_worker = len(cores) // workers
+    if workers * cores_per_worker > len(cores):
+        raise ValueError(
+            f"{workers} workers of {cores_per_worker} cores do not fit in the "
+            f"{len(cores)} available cores."
+        )
+    return [
+        cores[i * cores_per_worker : (i + 1) * cores_per_worker] for i in range(workers)
+    ]
+
+
+def dataset_key(cfg: OmegaConf) -> str:
+    # The data and its splits only depend on these settings
+    return OmegaConf.to_yaml(cfg.dataset) + f"debug: {cfg.get('debug', False)}"
+
+
+def run_worker(cfg, datamodule, cores, run_dir, connection):
+    """Trains and tests a single config on the given cores, and sends its final
+    metrics back."""
+    os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    os.makedirs(run_dir, exist_ok=True)
+    os.environ["TRAINER_DIR"] = run_dir
+    connection.send(train(cfg, datamodule, run_dir))
+    connection.close()
+
+
+def train(cfg: OmegaConf, datamodule, run_dir: str) -> dict:
+    """Trains a model on an already set up datamodule, as `main.py` does, and tests
+    the best checkpoint.
+
+    Returns:
+        (dict): the final metrics, and the best value of the monitored metric
+    """
+    pl.seed_everything(cfg.seed, workers=True)
+    datamodule.batch_size = cfg.train.batch_size // cfg.train.accumulate_grad_steps
+    datamodule.test_batch_size = cfg.test.batch_size_multiplier * cfg.train.batch_size
+    cfg.scheduler.iters_per_train_epoch = (
+        len(datamodule.train_dataset) // cfg.train.batch_size
+    )
+    cfg.scheduler.total_train_iters = (
+        cfg.scheduler.iters_per_train_epoch * cfg.train.epochs
+    )
+    model = construct_model(cfg, datamodule)
+
+    cfg.offline = True
+    logger = construct_logger(cfg, save_dir=run_dir)
+    trainer, checkpoint_callback = construct_trainer(cfg, logger)
+    trainer.fit(model=model, datamodule=datamodule)
+    trainer.test(model, datamodule=datamodule, ckpt_path="best")
+
+    metrics = {
+        k: v.item() if isinstance(v, torch.Tensor) else v
+        for k, v in trainer.callback_metrics.items()
+    }
+    best = checkpoint_callback.best_model_score
+    metrics[f"best_{checkpoint_callback.monitor}"] = (
+        best.item() if best is not None else None
+    )
+    logger.experiment.finish()
+    return metrics
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 import pytorch_lightning as pl
 from models.lightning_wrappers import OnExceptionExit
+from ckconv.utils.loggers import LocalLogger
+from models.checkpoint_io import AsyncIncrementalCheckpointIO
+import ckconv
 import os
 
 # typing
@@ -8,15 +11,50 @@ from omegaconf import OmegaConf
 from pytorch_lightning.loggers import WandbLogger
 
 
+def construct_logger(
+    cfg: OmegaConf,
+    save_dir: str = None,
+) -> pl.loggers.Logger:
+    """Constructs the logger selected by `logging.backend`: "wandb", or "local" for a
+    LocalLogger that writes to `logging.save_dir`."""
+    backend = cfg.logging.backend
+    if backend == "local":
+        return LocalLogger(
+            save_dir=save_dir or cfg.logging.save_dir,
+            defer_figures=cfg.logging.defer_figures,
+        )
+    elif backend == "wandb":
+        return WandbLogger(
+            save_dir=save_dir or os.environ.get("WANDB_LOGGER_DIR", "."),
+            project=cfg.wandb.project,
+            entity=cfg.wandb.entity if cfg.wandb.entity != -1 else None,
+            config=ckconv.utils.flatten_configdict(cfg),
+            log_model=False
+            if cfg.offline
+            else "all",  # used to save models to wandb during training
+            offline=cfg.offline,
+            id=cfg.wandb.run_id if cfg.wandb.run_id != -1 else None,
+            save_code=False,
+        )
+    raise ValueError(f"Logging backend {backend} not recognized.")
+
+
+# train.precision -> Lightning precision. bf16 autocasts to bfloat16, also on CPU.
+# The FFTs and kernel nets of the CKConvs stay in float32, see `fft_dtypes`.
+PRECISIONS = {"32": "32-true", "16": "16-mixed", "bf16": "bf16-mixed"}
+
+
 def construct_trainer(
     cfg: OmegaConf,
-    wandb_logger: pl.loggers.WandbLogger,
+    logger: pl.loggers.Logger,
 ) -> tuple[pl.Trainer, pl.Callback]:
     # Set up precision
-    if cfg.train.mixed_precision:
-        precision = 16
-    else:
-        precision = 32
+    precision = "16" if cfg.train.mixed_precision else str(cfg.train.precision)
+    if precision not in PRECISIONS:
+        raise ValueError(
+            f"Precision {precision} not recognized. Options: {list(PRECISIONS)}"
+        )
+    precision = PRECISIONS[precision]
 
     # Set up determinism
     if cfg.deterministic:
@@ -59,6 +97,16 @@ def construct_trainer(
 
     exception_callback = OnExceptionExit()
 
+    # Checkpoints are written on a background thread, skipping unchanged tensors
+    plugins = []
+    if cfg.train.checkpoint_io.asynchronous or cfg.train.checkpoint_io.incremental:
+        plugins.append(
+            AsyncIncrementalCheckpointIO(
+                asynchronous=cfg.train.checkpoint_io.asynchronous,
+                incremental=cfg.train.checkpoint_io.incremental,
+            )
+        )
+
     """
     TODO:
     detect_anomaly
@@ -97,7 +145,7 @@ def construct_trainer(
         default_root_dir=os.environ.get("TRAINER_DIR", os.getcwd()),
         accelerator=accelerator,
         max_epochs=cfg.train.epochs,
-        logger=wandb_logger,
+        logger=logger,
         gradient_clip_val=cfg.train.grad_clip,
         accumulate_grad_batches=cfg.train.accumulate_grad_steps,
         limit_train_batches=cfg.train.limit_train_batches,
@@ -122,5 +170,6 @@ def construct_trainer(
         # Determinism
         deterministic=deterministic,
         benchmark=benchmark,
+        plugins=plugins,
     )
     return trainer, checkpoint_callback